@@ -3,24 +3,142 @@
 command to download and process BMRA data for specified date rahge
 """
 import datetime as dt
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from django.core.management.base import BaseCommand, CommandError
-from ._download_functions import process_bmra_file
+from django.db import connections
+from ._download_functions import process_bmra_file, process_bmra_day, init_bmra_worker, \
+    get_tibco_daily_filenames, prefetch_bmra_files
+from ._async_download_functions import Prefetcher
+from ._ledger_functions import get_first_incomplete
+from ._bmu_period_functions import update_bmu_periods, get_bmra_period_dates
 
 class Command(BaseCommand):
     help = 'downloads BMRA data for specific date range, expected 2 arguments of form yyyy-m-d'
 
     def add_arguments(self, parser):
         parser.add_argument('date', nargs='+', type=str)
+        parser.add_argument('--batch_size', type=int, default=5000,
+                            help='insert messages in batches of this size per message subtype, '
+                                 'or individually if 0')
+        parser.add_argument('--parse_workers', type=int, default=None,
+                            help='parse BMRA messages using this number of worker processes')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='process this number of days in parallel, each in its own process')
+        parser.add_argument('--prefetch', type=int, default=0,
+                            help='download this number of upcoming days in the background, '
+                                 'not supported with workers')
+        parser.add_argument('--loader', choices=['orm', 'copy'], default='orm',
+                            help='method used to load level rows, copy requires PostgreSQL')
+        parser.add_argument('--force', action='store_true',
+                            help='reprocess days already completed in the ingestion ledger')
+        parser.add_argument('--no_bmu_periods', action='store_true',
+                            help='don\'t update the BMU period table for the days processed')
 
     def handle(self, *args, **options):
         self.stdout.write('Started: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
         start_date = dt.datetime(*[int(x) for x in options['date'][0].split('-')[:3]])
         end_date = dt.datetime(*[int(x) for x in options['date'][1].split('-')[:3]])
+        if options['workers'] is not None and options['prefetch'] > 0:
+            raise CommandError('prefetch is not supported with workers, as each worker '
+                               'downloads its own day')
+        if not options['force']:
+            # days before the first day not completed in the ledger are
+            # skipped without downloading, later completed days are skipped
+            # if their checksum is unchanged
+            filenames = get_tibco_daily_filenames(start_date, end_date)
+            first_incomplete = get_first_incomplete(filenames)
+            if first_incomplete > 0:
+                start_date += dt.timedelta(days=first_incomplete)
+                self.stdout.write('{} days already completed, resuming from {:%Y-%m-%d}'.format(
+                    first_incomplete, start_date))
+        if options['workers'] is not None:
+            processed_dates = self.process_parallel(start_date, end_date, options)
+        else:
+            processed_dates = self.process_serial(start_date, end_date, options)
+        if not options['no_bmu_periods'] and len(processed_dates) > 0:
+            # updated once all days are processed, as neighbouring days
+            # share settlement dates
+            count = update_bmu_periods(get_bmra_period_dates(processed_dates))
+            self.stdout.write('{} BMU periods updated'.format(count))
+        self.stdout.write('Finished: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
+
+    def process_serial(self, start_date, end_date, options):
+        """
+        Processes each day in the date range in turn, downloading the files
+        for upcoming days in the background if prefetch is set, and returns
+        the days processed
+        """
+        from GBEnergyDataManager.settings import BMRA_INPUT_DIR
+
+        processed_dates = []
+        with Prefetcher() as prefetcher:
+            date = start_date
+            while date <= end_date:
+                self.stdout.write('{:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
+                self.stdout.write("downloading data for "
+                                  + '{:%Y-%m-%d}'.format(date))
+                if options['prefetch'] > 0:
+                    prefetch_bmra_files(prefetcher,
+                                        [date + dt.timedelta(days=x)
+                                         for x in range(options['prefetch'] + 1)
+                                         if date + dt.timedelta(days=x) <= end_date])
+                    prefetcher.wait(BMRA_INPUT_DIR + get_tibco_daily_filenames(date)[0])
+                combined_insert_log = process_bmra_file(date,
+                                                        batch_size=options['batch_size'] or None,
+                                                        parse_workers=options['parse_workers'],
+                                                        force=options['force'],
+                                                        loader=options['loader'])
+                if combined_insert_log.get('skipped'):
+                    self.stdout.write('already completed, skipped')
+                else:
+                    processed_dates.append(date)
+                date += dt.timedelta(days=1)
+        return processed_dates
+
+    def process_parallel(self, start_date, end_date, options):
+        """
+        Processes each day in the date range in a pool of worker processes,
+        each day in its own transaction, and writes a summary of the status
+        of each day once all days are complete, and returns the days
+        completed
+        """
+        dates = []
         date = start_date
         while date <= end_date:
-            self.stdout.write('{:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
-            self.stdout.write("downloading data for "
-                              + '{:%Y-%m-%d}'.format(date))
-            process_bmra_file(date)
+            dates.append(date)
             date += dt.timedelta(days=1)
-        self.stdout.write('Finished: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
+
+        # connections must not be shared with forked worker processes
+        connections.close_all()
+        results = {}
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 initializer=init_bmra_worker) as executor:
+            futures = [executor.submit(process_bmra_day,
+                                       date,
+                                       options['batch_size'] or None,
+                                       options['parse_workers'],
+                                       options['force'],
+                                       options['loader'])
+                       for date in dates]
+            for future in as_completed(futures):
+                date, status, result = future.result()
+                results[date] = (status, result)
+                self.stdout.write('{:%Y-%m-%d %H:%M:%S} {:%Y-%m-%d} {}'.format(
+                    dt.datetime.now(), date, status))
+
+        self.stdout.write('Summary:')
+        for date in dates:
+            status, result = results[date]
+            if status == 'skipped':
+                self.stdout.write('{:%Y-%m-%d} {}: already completed'.format(date, status))
+            elif status == 'completed':
+                self.stdout.write('{:%Y-%m-%d} {}: {} messages, {} inserted, {} duplicates'.format(
+                    date, status, result['count'],
+                    sum(result['inserts'].values()),
+                    sum(result['duplicate_msg'].values())))
+            else:
+                self.stdout.write('{:%Y-%m-%d} {}: {}'.format(date, status, result))
+        statuses = [status for status, _ in results.values()]
+        self.stdout.write('{} days completed, {} days skipped, {} days failed'.format(
+            statuses.count('completed'), statuses.count('skipped'), statuses.count('failed')))
+        return [date for date in dates if results[date][0] == 'completed']
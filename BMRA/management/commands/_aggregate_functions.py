@@ -4,32 +4,49 @@ helper functions to collate and aggregate raw data
 """
 from BMRA.models.core import BMU
 from BMRA.models.balancing import FPN, FPNlevel
+from BMRA.models.profiles import unpack_levels
 import pandas as pd
+from ._integration_functions import integrate_levels
 
 def get_BMU_timeseries(bmu_id, SD_start, SD_end):
     """
-
+    Returns the FPN levels of a BMU and the FPN energy of each settlement
+    period within a date range, with levels held as level rows or packed
+
+    Parameters
+    ----------
+    bmu_id : str
+        the BMU id
+    SD_start : date
+        the first settlement date
+    SD_end : date
+        the last settlement date
+
+    Returns
+    -------
+    tuple
+        DataFrame of FPN levels with SD, SP, TS and VP columns, and
+        DataFrame of FPN energy (MWh) with SD, SP and MWh columns
     """
-    #get raw list of FPN objects
     bmu = BMU.objects.get(id=bmu_id)
-    fpns = pd.DataFrame.from_records(FPN.objects.filter(bmu=bmu,
-                                                        SD__gte=SD_start,
-                                                        SD__lte=SD_end).values())
-
-    df_fpn = pd.DataFrame(columns=['SD', 'SP', 'TS', 'VP'])
-
-    df_fpn.set_index(['SD', 'SP', 'TS'])
-    
     fpn_levels = FPNlevel.objects.filter(
         fpn__bmu=bmu,
-        fpn__SD__gte=SD_start,
-        fpn__SD__lte=SD_end).order_by('TS', 'fpn__SD', 'fpn__SP')
-
-    for fpn_level in fpn_levels:
-        df_fpn = df_fpn.append([{'TS':fpn_level.TS,
-                                 'SD':fpn_level.fpn.SD,
-                                 'SP':fpn_level.fpn.SP,
-                                 'VP':fpn_level.VP}])
-
-
-    return df_fpn
+        fpn__sd__gte=SD_start,
+        fpn__sd__lte=SD_end).order_by('fpn__sd', 'fpn__sp', 'ts')
+    records = list(fpn_levels.values_list('fpn__sd', 'fpn__sp', 'ts', 'vp'))
+    packed_fpns = FPN.objects.filter(
+        bmu=bmu,
+        sd__gte=SD_start,
+        sd__lte=SD_end,
+        levels__isnull=False).values_list('sd', 'sp', 'levels')
+    packed_records = [(sd, sp, ts, vp)
+                      for sd, sp, levels in packed_fpns
+                      for ts, vp in unpack_levels(levels)]
+    if len(packed_records) > 0:
+        # stable sort, keeping the order of levels with equal timestamps
+        records = sorted(records + packed_records, key=lambda record: record[:3])
+    df_fpn = pd.DataFrame.from_records(records, columns=['SD', 'SP', 'TS', 'VP'])
+    df_mwh = integrate_levels(df_fpn.rename(columns={'TS': 'ts'}), 'VP', ('SD', 'SP'))
+    df_mwh = df_mwh.rename(columns={'mwh': 'MWh'})
+
+    return df_fpn, df_mwh
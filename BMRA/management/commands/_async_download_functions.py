@@ -0,0 +1,257 @@
+"""
+Helper functions for downloading files concurrently using asyncio
+
+Each download runs in a worker thread, with the number of downloads in
+progress at a time bounded by a semaphore. Files are downloaded to a
+partial file which is kept on failure, so that retries resume from the
+last byte received using a Range request
+
+"""
+import asyncio
+import http.client
+import os.path
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# HTTP status codes for which a failed download is retried
+RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+
+class DownloadCancelled(Exception):
+    """raised when a download is stopped before completion"""
+
+
+def fetch_file(url, file_path, chunk_size=1048576, timeout=60, stop_event=None):
+    """
+    Downloads a single file, resuming from any partial file left by a
+    previous attempt
+
+    Parameters
+    ----------
+    url : str
+        the url of the file
+    file_path : str
+        the path the file is saved to
+    chunk_size : int
+        the number of bytes read from the response at a time
+    timeout : float
+        the connection timeout in seconds
+    stop_event : threading.Event
+        (optional) event which, once set, stops the download, keeping the
+        partial file
+
+    Raises
+    ------
+    IOError
+        if the response ends before the expected number of bytes
+    DownloadCancelled
+        if stopped by stop_event
+    """
+    partial_path = file_path + '.part'
+    offset = os.path.getsize(partial_path) if os.path.isfile(partial_path) else 0
+    request = urllib.request.Request(url)
+    if offset > 0:
+        request.add_header('Range', 'bytes={}-'.format(offset))
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset > 0:
+            # nothing left to download, partial file is complete
+            os.replace(partial_path, file_path)
+            return
+        raise
+    with response:
+        if offset > 0 and response.status != 206:
+            # range not supported by server, restart download
+            offset = 0
+        expected_length = response.headers.get('Content-Length')
+        received_length = 0
+        with open(partial_path, 'ab' if offset > 0 else 'wb') as file:
+            for chunk in iter(lambda: response.read(chunk_size), b''):
+                if stop_event is not None and stop_event.is_set():
+                    raise DownloadCancelled('Download of {} stopped'.format(url))
+                file.write(chunk)
+                received_length += len(chunk)
+    if expected_length is not None and received_length < int(expected_length):
+        raise IOError('Incomplete download of {}, {} of {} bytes received'.format(
+            url, received_length, expected_length))
+    os.replace(partial_path, file_path)
+
+
+async def download_file(url, file_path, semaphore, retries=3, backoff=1.0, stop_event=None):
+    """
+    Downloads a single file once a place is available in the semaphore,
+    retrying with exponential backoff on connection errors, incomplete
+    downloads and temporary server errors
+
+    Parameters
+    ----------
+    url : str
+        the url of the file
+    file_path : str
+        the path the file is saved to
+    semaphore : asyncio.Semaphore
+        semaphore limiting the number of concurrent downloads
+    retries : int
+        the number of times a failed download is retried
+    backoff : float
+        the delay in seconds before the first retry, doubled for each
+        subsequent retry
+    stop_event : threading.Event
+        as per fetch_file
+
+    Returns
+    -------
+    str
+        the path of the downloaded file
+    """
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                await loop.run_in_executor(None, partial(fetch_file, url, file_path,
+                                                         stop_event=stop_event))
+                return file_path
+            except urllib.error.HTTPError as e:
+                if e.code not in RETRY_STATUS_CODES or attempt == retries:
+                    raise
+            except (OSError, http.client.HTTPException):
+                if attempt == retries:
+                    raise
+            await asyncio.sleep(backoff * 2 ** attempt)
+
+
+async def download_files_async(downloads, max_concurrency=4, retries=3, backoff=1.0):
+    """
+    Downloads a list of files concurrently
+
+    Parameters
+    ----------
+    downloads : list
+        tuples of url and file path
+    max_concurrency : int
+        the maximum number of downloads in progress at a time
+    retries : int
+        as per download_file
+    backoff : float
+        as per download_file
+
+    Returns
+    -------
+    list
+        the paths of the downloaded files
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    return await asyncio.gather(*[download_file(url, file_path, semaphore, retries, backoff)
+                                  for url, file_path in downloads])
+
+
+def download_files(downloads, max_concurrency=4, retries=3, backoff=1.0):
+    """
+    Downloads a list of files concurrently, blocking until all complete
+
+    Parameters
+    ----------
+    downloads : list
+        tuples of url and file path
+    max_concurrency : int
+        the maximum number of downloads in progress at a time
+    retries : int
+        as per download_file
+    backoff : float
+        as per download_file
+
+    Returns
+    -------
+    list
+        the paths of the downloaded files
+    """
+    return asyncio.run(download_files_async(downloads, max_concurrency, retries, backoff))
+
+
+async def create_semaphore(value):
+    """creates a semaphore bound to the running event loop"""
+    return asyncio.Semaphore(value)
+
+
+async def cancel_tasks():
+    """
+    Cancels all other tasks of the running event loop, waiting until each
+    has handled its cancellation
+    """
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class Prefetcher:
+    """
+    Downloads files in the background while other files are processed,
+    using an event loop running in a separate thread
+
+    Parameters
+    ----------
+    max_concurrency : int
+        the maximum number of downloads in progress at a time
+    retries : int
+        as per download_file
+    backoff : float
+        as per download_file
+    """
+
+    def __init__(self, max_concurrency=4, retries=3, backoff=1.0):
+        self.retries = retries
+        self.backoff = backoff
+        self.futures = {}
+        self.stop_event = threading.Event()
+        # downloads run in threads of an executor owned by the prefetcher,
+        # so that they can be waited for on closing
+        self.executor = ThreadPoolExecutor(thread_name_prefix='prefetch')
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(self.executor)
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.semaphore = asyncio.run_coroutine_threadsafe(create_semaphore(max_concurrency),
+                                                          self.loop).result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def prefetch(self, url, file_path):
+        """
+        Starts downloading a file in the background, if not already started
+        """
+        if file_path not in self.futures:
+            self.futures[file_path] = asyncio.run_coroutine_threadsafe(
+                download_file(url, file_path, self.semaphore, self.retries, self.backoff,
+                              self.stop_event),
+                self.loop)
+
+    def wait(self, file_path):
+        """
+        Blocks until the download of a prefetched file completes, raising any
+        error from the download. Returns immediately for files not prefetched
+        """
+        future = self.futures.pop(file_path, None)
+        if future is not None:
+            future.result()
+
+    def close(self):
+        """
+        Cancels any outstanding downloads, waiting for downloads in progress
+        to stop (leaving their partial files), and stops the event loop
+        """
+        self.stop_event.set()
+        self.futures = {}
+        asyncio.run_coroutine_threadsafe(cancel_tasks(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+        self.loop.close()
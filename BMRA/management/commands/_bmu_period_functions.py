@@ -0,0 +1,160 @@
+"""
+Helper functions for maintaining the BMU period table, which holds the
+main metrics of each BMU in each settlement period in a single row
+
+The table is updated after ingestion for the settlement dates affected by
+the files ingested. Each metric is retrieved for all BMUs with the same
+queries as the annual summaries, and the rows of the affected dates are
+replaced. Dates are updated in chunks of a few days, each retrieved and
+replaced in its own transaction, so that the data held in memory and the
+size of each transaction are bounded for long date ranges
+
+"""
+import datetime as dt
+import pandas as pd
+from django.db import connection, transaction
+from ._summary_functions import query_acceptance_volumes, query_cashflows, query_fpn_volumes, \
+    query_mel_volumes, query_metered_volumes, get_date_ranges, get_bmra_file_dates
+
+# BMU period fields, giving the function retrieving each metric (as per
+# query_acceptance_volumes) and any additional arguments
+BMU_PERIOD_FIELDS = {
+    'fpn': {'function': query_fpn_volumes, 'args': ()},
+    'mel': {'function': query_mel_volumes, 'args': ()},
+    'bav': {'function': query_acceptance_volumes, 'args': ('bv',)},
+    'oav': {'function': query_acceptance_volumes, 'args': ('ov',)},
+    'bid_cashflow': {'function': query_cashflows, 'args': ('bc',)},
+    'offer_cashflow': {'function': query_cashflows, 'args': ('oc',)},
+    'metered': {'function': query_metered_volumes, 'args': ()},
+}
+
+
+def get_bmu_periods(conn, start_date, end_date, bmu_ids=None):
+    """
+    Returns the metrics of each BMU and settlement period within a date
+    range
+
+    Parameters
+    ----------
+    conn : connection
+        the database connection, as used by pandas.read_sql
+    start_date : date
+        the first settlement date
+    end_date : date
+        the last settlement date
+    bmu_ids : list
+        the BMU ids, or None for all BMUs
+
+    Returns
+    -------
+    DataFrame
+        DataFrame indexed by (bmu_id, sd, sp) with a column per field of
+        BMU_PERIOD_FIELDS, with NaN where a metric has no data
+    """
+    columns = []
+    for field, definition in BMU_PERIOD_FIELDS.items():
+        df = definition['function'](conn, bmu_ids, start_date, end_date, *definition['args'])
+        df = df.assign(sd=pd.to_datetime(df['sd']).dt.date)
+        # where more than one value is found the first is taken, as per pivot_summary
+        columns.append(df.groupby(['bmu_id', 'sd', 'sp'])['value'].first().rename(field))
+    return pd.concat(columns, axis=1).sort_index()
+
+
+def get_date_chunks(dates, days=7):
+    """
+    Groups dates into ranges of consecutive dates, as per get_date_ranges,
+    each of at most a given number of days
+
+    Parameters
+    ----------
+    dates : iterable
+        the dates
+    days : int
+        the maximum number of days in each range
+
+    Returns
+    -------
+    list
+        (first date, last date) tuples, in date order
+    """
+    chunks = []
+    for range_start, range_end in get_date_ranges(set(dates)):
+        chunk_start = range_start
+        while chunk_start <= range_end:
+            chunk_end = min(chunk_start + dt.timedelta(days=days - 1), range_end)
+            chunks.append((chunk_start, chunk_end))
+            chunk_start = chunk_end + dt.timedelta(days=1)
+    return chunks
+
+
+def update_bmu_periods(dates, days=7, batch_size=10000):
+    """
+    Replaces the BMU period rows of the given settlement dates. Dates are
+    updated in chunks of consecutive dates, as per get_date_chunks, each
+    retrieved with a single query per metric and replaced in a single
+    transaction
+
+    Parameters
+    ----------
+    dates : iterable
+        the settlement dates to be updated
+    days : int
+        the maximum number of settlement dates updated per transaction
+    batch_size : int
+        the number of rows created per insert
+
+    Returns
+    -------
+    int
+        the number of rows created
+    """
+    from BMRA.models import BMUPeriod
+
+    count = 0
+    for range_start, range_end in get_date_chunks(dates, days):
+        connection.ensure_connection()
+        df = get_bmu_periods(connection.connection, range_start, range_end)
+        df = df.astype(object).where(df.notna(), None)
+        rows = [BMUPeriod(bmu_id=bmu_id, sd=sd, sp=int(sp), **values)
+                for (bmu_id, sd, sp), values in zip(df.index, df.to_dict('records'))]
+        with transaction.atomic():
+            BMUPeriod.objects.filter(sd__gte=range_start, sd__lte=range_end).delete()
+            BMUPeriod.objects.bulk_create(rows, batch_size=batch_size)
+        count += len(rows)
+    return count
+
+
+def get_bmra_period_dates(file_dates):
+    """
+    Returns the settlement dates affected by the BMRA files of the given
+    dates, as per get_bmra_file_dates
+    """
+    dates = set()
+    for file_date in file_dates:
+        if isinstance(file_date, dt.datetime):
+            file_date = file_date.date()
+        dates.update(get_bmra_file_dates(file_date))
+    return dates
+
+
+def get_p114_period_dates(agg_dates):
+    """
+    Returns the settlement dates of the P114 data aggregated on the given
+    dates
+
+    Parameters
+    ----------
+    agg_dates : iterable
+        the aggregation dates, i.e. the dates of the P114 files
+
+    Returns
+    -------
+    set
+        the settlement dates
+    """
+    from P114.models import ABV
+
+    agg_dates = [agg_date.date() if isinstance(agg_date, dt.datetime) else agg_date
+                 for agg_date in agg_dates]
+    return set(ABV.objects.filter(agg_date__in=agg_dates)
+               .values_list('sd', flat=True).distinct())
@@ -0,0 +1,575 @@
+"""
+Helper functions for uploading data to database in batches
+
+Messages are buffered by message type/subtype and inserted with
+bulk_create, parent rows first followed by any associated level rows.
+Messages without a bulk definition are passed through to insert_data
+"""
+from collections import defaultdict
+from ._upload_functions import insert_data, merge_insert_log, new_insert_log
+from ._copy_functions import copy_supported, copy_level_rows
+from ._reference_functions import ReferenceCache
+from ._conflict_functions import get_unique_key, insert_ignore_conflicts
+
+# model fields referencing core entities which must exist before insertion
+REFERENCE_FIELDS = {
+    'bmu_id': 'BMU',
+    'ft_id': 'FT',
+    'zi_id': 'ZI',
+}
+
+# key fields used to restrict the existing keys loaded from the database
+# for duplicate detection, in order of preference. Forecasts are restricted
+# by published time as their settlement dates span several days or weeks
+RANGE_FIELDS = ('tp', 'sd', 'ts', 'st')
+
+# definitions of messages which may be inserted in batches, by message type
+# and message subtype. Each definition gives:
+#   model: the name of the BMRA model to be created
+#   log_key: the key used when logging new entries
+#   per_point: if True, one row is created per data point, with data point
+#              values taking precedence over message header values
+#   key: fields identifying a duplicate entry (as per insert_data)
+#   fields: model field names mapped to either a message dictionary key
+#           or a function of the message dictionary
+#   data_points: (optional) the number of data points expected
+#   level: (optional) tuple of level model name, parent foreign key name
+#          and a field mapping applied to each data point
+# NDFD is not defined here as its primary key (tp) is shared between the
+# data points of a message, so rows are overwritten rather than inserted
+BULK_INSERT_DEFINITIONS = {
+    'BM': {
+        'BOAL': {'model': 'BOAL', 'log_key': 'boal', 'per_point': False,
+                 'key': ('bmu_id', 'ts', 'nk'),
+                 'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'nk': 'NK',
+                            'ta': 'TA', 'ad': 'AD'},
+                 'level': ('BOALlevel', 'boal', {'ts': 'TS', 'va': 'VA'})},
+        'BOALF': {'model': 'BOALF', 'log_key': 'boalf', 'per_point': False,
+                  'key': ('bmu_id', 'ts', 'nk'),
+                  'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'nk': 'NK',
+                             'ta': 'TA', 'ad': 'AD', 'so': 'SO',
+                             'pf': lambda m: m.get('PF'),
+                             'rn': lambda m: m.get('RN'),
+                             'sc': lambda m: m.get('SC')},
+                  'level': ('BOALFlevel', 'boalf', {'ts': 'TS', 'va': 'VA'})},
+        'BOAV': {'model': 'BOAV', 'log_key': 'boav', 'per_point': False,
+                 'key': ('bmu_id', 'nk', 'sd', 'sp', 'nn'),
+                 'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'nk': 'NK',
+                            'sd': 'SD', 'sp': 'SP', 'nn': 'NN', 'ov': 'OV',
+                            'bv': 'BV', 'sa': 'SA'}},
+        'BOD': {'model': 'BOD', 'log_key': 'bod', 'per_point': False,
+                'key': ('bmu_id', 'ts', 'sd', 'sp', 'nn'),
+                'data_points': 2,
+                'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'sd': 'SD',
+                           'sp': 'SP', 'nn': 'NN', 'op': 'OP', 'bp': 'BP',
+                           'ts1': lambda m: m['data_points'][1]['TS'],
+                           'vb1': lambda m: m['data_points'][1]['VB'],
+                           'ts2': lambda m: m['data_points'][2]['TS'],
+                           'vb2': lambda m: m['data_points'][2]['VB']}},
+        'DISPTAV': {'model': 'DISPTAV', 'log_key': 'disptav', 'per_point': False,
+                    'key': ('bmu_id', 'sd', 'sp', 'nn', 'ts'),
+                    'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'sd': 'SD',
+                               'sp': 'SP', 'nn': 'NN', 'ov': 'OV', 'bv': 'BV',
+                               'p1': 'P1', 'p2': 'P2', 'p3': 'P3', 'p4': 'P4',
+                               'p5': 'P5', 'p6': 'P6'}},
+        'EBOCF': {'model': 'EBOCF', 'log_key': 'ebocf', 'per_point': False,
+                  'key': ('bmu_id', 'sd', 'sp', 'nn'),
+                  'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'sd': 'SD',
+                             'sp': 'SP', 'nn': 'NN', 'oc': 'OC', 'bc': 'BC'}},
+        'FPN': {'model': 'FPN', 'log_key': 'fpn', 'per_point': False,
+                'key': ('bmu_id', 'sd', 'sp'),
+                'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'sd': 'SD', 'sp': 'SP'},
+                'level': ('FPNlevel', 'fpn', {'ts': 'TS', 'vp': 'VP'})},
+        'MEL': {'model': 'MEL', 'log_key': 'mel', 'per_point': False,
+                'key': ('bmu_id', 'ts', 'sd', 'sp'),
+                'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'sd': 'SD', 'sp': 'SP'},
+                'level': ('MELlevel', 'mel', {'ts': 'TS', 've': 'VE'})},
+        'MIL': {'model': 'MIL', 'log_key': 'mil', 'per_point': False,
+                'key': ('bmu_id', 'ts', 'sd', 'sp'),
+                'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'sd': 'SD', 'sp': 'SP'},
+                'level': ('MILlevel', 'mil', {'ts': 'TS', 'vf': 'VF'})},
+        'PTAV': {'model': 'PTAV', 'log_key': 'ptav', 'per_point': False,
+                 'key': ('bmu_id', 'sd', 'sp', 'nn'),
+                 'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'sd': 'SD',
+                            'sp': 'SP', 'nn': 'NN', 'ov': 'OV', 'bv': 'BV'}},
+        'QAS': {'model': 'QAS', 'log_key': 'qas', 'per_point': False,
+                'key': ('bmu_id', 'sd', 'sp'),
+                'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'sd': 'SD',
+                           'sp': 'SP', 'sv': 'SV'}},
+        'QPN': {'model': 'QPN', 'log_key': 'qpn', 'per_point': False,
+                'key': ('bmu_id', 'sd', 'sp'),
+                'fields': {'bmu_id': 'bmu_id', 'ts': 'received_time', 'sd': 'SD', 'sp': 'SP'},
+                'level': ('QPNlevel', 'qpn', {'ts': 'TS', 'vp': 'VP'})},
+    },
+    'SYSTEM': {
+        'BSAD': {'model': 'BSAD', 'log_key': 'bsad', 'per_point': False,
+                 'key': ('sd', 'sp'),
+                 'fields': {'sd': 'SD', 'sp': 'SP', 'a1': 'A1', 'a2': 'A2', 'a3': 'A3',
+                            'a4': 'A4', 'a5': 'A5', 'a6': 'A6'}},
+        'DF': {'model': 'DF', 'log_key': 'df', 'per_point': True,
+               'key': ('zi_id', 'tp', 'sd', 'sp'),
+               'fields': {'zi_id': 'ZI', 'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vd': 'VD'}},
+        'DISBSAD': {'model': 'DISBSAD', 'log_key': 'disbsad', 'per_point': False,
+                    'key': ('sd', 'sp', 'ai'),
+                    'fields': {'sd': 'SD', 'sp': 'SP', 'ai': 'AI', 'so': 'SO', 'pf': 'PF',
+                               'jc': 'JC', 'jv': 'JV'}},
+        'DISEBSP': {'model': 'DISEBSP', 'log_key': 'disebsp', 'per_point': False,
+                    'key': ('sd', 'sp'),
+                    'fields': {'sd': 'SD', 'sp': 'SP', 'pb': 'PB', 'ps': 'PS', 'pd': 'PD',
+                               'rsp': lambda m: m.get('RSP'),
+                               'rp': lambda m: m.get('RP'),
+                               'rv': lambda m: m.get('RV'),
+                               'bd': 'BD', 'a3': 'A3', 'a6': 'A6', 'ni': 'NI', 'ao': 'AO',
+                               'ab': 'AB', 't1': 'T1', 't2': 'T2', 'pp': 'PP', 'pc': 'PC',
+                               'j1': 'J1', 'j2': 'J2', 'j3': 'J3', 'j4': 'J4'}},
+        'EBSP': {'model': 'EBSP', 'log_key': 'ebsp', 'per_point': False,
+                 'key': ('sd', 'sp'),
+                 'fields': {'sd': 'SD', 'sp': 'SP', 'pb': 'PB', 'ps': 'PS', 'ao': 'AO',
+                            'ab': 'AB', 'ap': 'AP', 'ac': 'AC', 'pp': 'AP', 'pc': 'PC',
+                            'bd': 'BD', 'a1': 'A1', 'a2': 'A2', 'a3': 'A3', 'a4': 'A4',
+                            'a5': 'A5', 'a6': 'A6'}},
+        'FOU2T14D': {'model': 'FOU2T14D', 'log_key': 'FOU2T14D', 'per_point': True,
+                     'key': ('tp', 'ft_id', 'sd'),
+                     'fields': {'tp': 'TP', 'ft_id': 'FT', 'sd': 'SD', 'ou': 'OU'}},
+        'FOU2T3YW': {'model': 'FOU2T3YW', 'log_key': 'FOU2T3YW', 'per_point': True,
+                     'key': ('tp', 'ft_id', 'cy', 'wn'),
+                     'fields': {'tp': 'TP', 'ft_id': 'FT', 'cy': 'CY', 'wn': 'WN', 'ou': 'OU'}},
+        'FOU2T52W': {'model': 'FOU2T52W', 'log_key': 'FOU2T52W', 'per_point': True,
+                     'key': ('tp', 'ft_id', 'cy', 'wn'),
+                     'fields': {'tp': 'TP', 'ft_id': 'FT', 'cy': 'CY', 'wn': 'WN', 'ou': 'OU'}},
+        'FREQ': {'model': 'FREQ', 'log_key': 'freq', 'per_point': False,
+                 'key': ('ts',),
+                 'fields': {'ts': 'TS', 'sf': 'SF'}},
+        'FUELHH': {'model': 'FUELHH', 'log_key': 'fuelhh', 'per_point': False,
+                   'key': ('sd', 'sp', 'tp', 'ft_id'),
+                   'fields': {'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'ft_id': 'FT', 'fg': 'FG'}},
+        'FUELINST': {'model': 'FUELINST', 'log_key': 'fuelinst', 'per_point': False,
+                     'key': ('sd', 'sp', 'ts', 'tp', 'ft_id'),
+                     'fields': {'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'ts': 'TS',
+                                'ft_id': 'FT', 'fg': 'FG'}},
+        'IMBALNGC': {'model': 'IMBALNGC', 'log_key': 'IMBALNGC', 'per_point': True,
+                     'key': ('zi_id', 'tp', 'sd', 'sp'),
+                     'fields': {'zi_id': 'ZI', 'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vi': 'VI'}},
+        'INDDEM': {'model': 'INDDEM', 'log_key': 'INDDEM', 'per_point': True,
+                   'key': ('zi_id', 'tp', 'sd', 'sp'),
+                   'fields': {'zi_id': 'ZI', 'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vd': 'VD'}},
+        'INDGEN': {'model': 'INDGEN', 'log_key': 'INDGEN', 'per_point': True,
+                   'key': ('zi_id', 'tp', 'sd', 'sp'),
+                   'fields': {'zi_id': 'ZI', 'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vg': 'VG'}},
+        'INDO': {'model': 'INDO', 'log_key': 'indo', 'per_point': False,
+                 'key': ('sd', 'sp', 'tp'),
+                 'fields': {'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vd': 'VD'}},
+        'INDOD': {'model': 'INDOD', 'log_key': 'indod', 'per_point': False,
+                  'key': ('sd', 'tp'),
+                  'fields': {'tp': 'TP', 'sd': 'SD', 'eo': 'EO', 'el': 'EL', 'eh': 'EH',
+                             'en': 'EN'}},
+        'ISPSTACK': {'model': 'ISPSTACK', 'log_key': 'ispstack', 'per_point': False,
+                     'key': ('sd', 'sp', 'ci', 'bo', 'nn', 'nk', 'sn'),
+                     'fields': {'sd': 'SD', 'sp': 'SP', 'bo': 'BO', 'sn': 'SN', 'ci': 'CI',
+                                'nk': lambda m: m.get('NK'),
+                                'nn': lambda m: m.get('NN'),
+                                'cf': 'CF', 'so': 'SO', 'pf': 'PF', 'ri': 'RI', 'up': 'UP',
+                                'rsp': lambda m: m.get('RSP'),
+                                'ip': 'IP', 'iv': 'IV', 'da': 'DA', 'av': 'AV', 'nv': 'NV',
+                                'pv': 'PV', 'fp': 'FP', 'tm': 'TM', 'tv': 'TV', 'tc': 'TC'}},
+        'ITSDO': {'model': 'ITSDO', 'log_key': 'itsdo', 'per_point': False,
+                  'key': ('sd', 'sp', 'tp'),
+                  'fields': {'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vd': 'VD'}},
+        'MELNGC': {'model': 'MELNGC', 'log_key': 'MELNGC', 'per_point': True,
+                   'key': ('zi_id', 'tp', 'sd', 'sp'),
+                   'fields': {'zi_id': 'ZI', 'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vm': 'VM'}},
+        'MID': {'model': 'MID', 'log_key': 'mid', 'per_point': False,
+                'key': ('mi', 'sd', 'sp'),
+                'fields': {'mi': 'MI', 'sd': 'SD', 'sp': 'SP', 'm1': 'M1', 'm2': 'M2'}},
+        'NDF': {'model': 'NDF', 'log_key': 'ndf', 'per_point': True,
+                'key': ('zi_id', 'tp', 'sd', 'sp'),
+                'fields': {'zi_id': 'ZI', 'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vd': 'VD'}},
+        'NDFW': {'model': 'NDFW', 'log_key': 'NDFW', 'per_point': True,
+                 'key': ('tp', 'wd', 'wn'),
+                 'fields': {'tp': 'TP', 'wd': 'WD', 'wn': 'WN', 'vd': 'VD'}},
+        'NETEBSP': {'model': 'NETEBSP', 'log_key': 'netebsp', 'per_point': False,
+                    'key': ('sd', 'sp'),
+                    'fields': {'sd': 'SD', 'sp': 'SP', 'pb': 'PB', 'ps': 'PS', 'pd': 'PD',
+                               'ao': 'AO', 'ab': 'AB', 'ap': 'AP', 'ac': 'AC', 'pp': 'AP',
+                               'pc': 'PC', 'ni': 'NI', 'bd': 'BD', 'a7': 'A7', 'a8': 'A8',
+                               'a11': 'A11', 'a3': 'A3', 'a9': 'A9', 'a10': 'A10',
+                               'a12': 'A12', 'a6': 'A6'}},
+        'NONBM': {'model': 'NONBM', 'log_key': 'nonbm', 'per_point': False,
+                  'key': ('sd', 'sp', 'tp'),
+                  'fields': {'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'nb': 'NB'}},
+        'NOU2T14D': {'model': 'NOU2T14D', 'log_key': 'NOU2T14D', 'per_point': True,
+                     'key': ('tp', 'sd', 'sp'),
+                     'fields': {'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'ou': 'OU'}},
+        'NOU2T3YW': {'model': 'NOU2T3YW', 'log_key': 'NOU2T3YW', 'per_point': True,
+                     'key': ('tp', 'cy', 'wn'),
+                     'fields': {'tp': 'TP', 'cy': 'CY', 'wn': 'WN', 'ou': 'OU'}},
+        'NOU2T52W': {'model': 'NOU2T52W', 'log_key': 'NOU2T52W', 'per_point': True,
+                     'key': ('tp', 'cy', 'wn'),
+                     'fields': {'tp': 'TP', 'cy': 'CY', 'wn': 'WN', 'ou': 'OU'}},
+        'OCNMF3Y': {'model': 'OCNMF3Y', 'log_key': 'OCNMF3Y', 'per_point': True,
+                    'key': ('tp', 'cy', 'wn'),
+                    'fields': {'tp': 'TP', 'cy': 'CY', 'wn': 'WN', 'vm': 'VM'}},
+        'OCNMF3Y2': {'model': 'OCNMF3Y2', 'log_key': 'OCNMF3Y2', 'per_point': True,
+                     'key': ('tp', 'cy', 'wn'),
+                     'fields': {'tp': 'TP', 'cy': 'CY', 'wn': 'WN', 'dm': 'DM'}},
+        'OCNMFD': {'model': 'OCNMFD', 'log_key': 'OCNMFD', 'per_point': True,
+                   'key': ('tp', 'sd', 'sp'),
+                   'fields': {'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vm': 'VM'}},
+        'OCNMFD2': {'model': 'OCNMFD2', 'log_key': 'OCNMFD2', 'per_point': True,
+                    'key': ('tp', 'sd'),
+                    'fields': {'tp': 'TP', 'sd': 'SD', 'dm': 'DM'}},
+        'OCNMFW': {'model': 'OCNMFW', 'log_key': 'OCNMFW', 'per_point': True,
+                   'key': ('tp', 'wd', 'wn'),
+                   'fields': {'tp': 'TP', 'wd': 'WD', 'wn': 'WN', 'vm': 'VM'}},
+        'OCNMFW2': {'model': 'OCNMFW2', 'log_key': 'OCNMFW2', 'per_point': True,
+                    'key': ('tp', 'cy', 'wn'),
+                    'fields': {'tp': 'TP', 'cy': 'CY', 'wn': 'WN', 'dm': 'DM'}},
+        'SOSO': {'model': 'SOSO', 'log_key': 'SOSO', 'per_point': False,
+                 'key': ('ic', 'tt', 'st', 'td'),
+                 'fields': {'tt': 'TT', 'st': 'ST', 'td': 'TD', 'ic': 'IC', 'tq': 'TQ',
+                            'pt': 'PT'}},
+        'TBOD': {'model': 'TBOD', 'log_key': 'tbod', 'per_point': False,
+                 'key': ('sd', 'sp'),
+                 'fields': {'sd': 'SD', 'sp': 'SP', 'ot': 'OT', 'bt': 'BT'}},
+        'TEMP': {'model': 'TEMP', 'log_key': 'temp', 'per_point': False,
+                 'key': ('ts', 'tp'),
+                 'fields': {'ts': 'TS', 'tp': 'TP', 'to': 'TO', 'tn': 'TN', 'tl': 'TL',
+                            'th': 'TH'}},
+        'TSDF': {'model': 'TSDF', 'log_key': 'tsdf', 'per_point': True,
+                 'key': ('zi_id', 'tp', 'sd', 'sp'),
+                 'fields': {'zi_id': 'ZI', 'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vd': 'VD'}},
+        'TSDFD': {'model': 'TSDFD', 'log_key': 'TSDFD', 'per_point': True,
+                  'key': ('tp', 'sd', 'sp'),
+                  'fields': {'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vd': 'VD'}},
+        'TSDFW': {'model': 'TSDFW', 'log_key': 'TSDFW', 'per_point': True,
+                  'key': ('tp', 'wd', 'wn'),
+                  'fields': {'tp': 'TP', 'wd': 'WD', 'wn': 'WN', 'vd': 'VD'}},
+        'UOU2T14D': {'model': 'UOU2T14D', 'log_key': 'UOU2T14D', 'per_point': True,
+                     'key': ('tp', 'bmu_id', 'ft_id', 'sd'),
+                     'fields': {'tp': 'TP', 'bmu_id': 'bmu_id', 'ft_id': 'FT', 'sd': 'SD',
+                                'ou': 'OU'}},
+        'UOU2T3YW': {'model': 'UOU2T3YW', 'log_key': 'UOU2T3YW', 'per_point': True,
+                     'key': ('tp', 'bmu_id', 'ft_id', 'cy', 'wn'),
+                     'fields': {'tp': 'TP', 'bmu_id': 'bmu_id', 'ft_id': 'FT', 'cy': 'CY',
+                                'wn': 'WN', 'ou': 'OU'}},
+        'UOU2T52W': {'model': 'UOU2T52W', 'log_key': 'UOU2T52W', 'per_point': True,
+                     'key': ('tp', 'bmu_id', 'ft_id', 'cy', 'wn'),
+                     'fields': {'tp': 'TP', 'bmu_id': 'bmu_id', 'ft_id': 'FT', 'cy': 'CY',
+                                'wn': 'WN', 'ou': 'OU'}},
+        'WINDFOR': {'model': 'WINDFOR', 'log_key': 'WINDFOR', 'per_point': True,
+                    'key': ('tp', 'sd', 'sp'),
+                    'fields': {'tp': 'TP', 'sd': 'SD', 'sp': 'SP', 'vg': 'VG', 'tr': 'TR'}},
+    },
+}
+
+
+def map_fields(source, field_mapping):
+    """
+    Applies a field mapping from a bulk insert definition to a message
+    dictionary (or merged message/data point dictionary)
+
+    Parameters
+    ----------
+    source : dict
+        the message dictionary
+    field_mapping : dict
+        model field names mapped to message keys or functions
+
+    Returns
+    -------
+    dict
+        model field names mapped to values
+    """
+    return {field: value(source) if callable(value) else source[value]
+            for field, value in field_mapping.items()}
+
+
+def get_range_field(definition):
+    """
+    Returns the key field used to restrict the existing keys loaded for
+    duplicate detection, the first of RANGE_FIELDS present in the key
+
+    Parameters
+    ----------
+    definition : dict
+        the bulk insert definition
+
+    Returns
+    -------
+    str
+        the name of the range field, or None if the key has no date field
+    """
+    for field in RANGE_FIELDS:
+        if field in definition['key']:
+            return field
+    return None
+
+
+def pack_data_points(data_points, level_fields):
+    """
+    Packs the data points of a message as levels (see BMRA.models.profiles)
+
+    Parameters
+    ----------
+    data_points : dict
+        the data points of the message
+    level_fields : dict
+        the level field mapping of a bulk definition, e.g.
+        {'ts': 'TS', 'vp': 'VP'}
+
+    Returns
+    -------
+    bytes
+        the packed levels
+    """
+    from BMRA.models.profiles import pack_levels
+
+    value_field = [field for field in level_fields if field != 'ts'][0]
+    return pack_levels((data_point[level_fields['ts']], data_point[level_fields[value_field]])
+                       for data_point in data_points.values())
+
+
+class BulkInserter:
+    """
+    Buffers message dictionaries by message type and subtype and inserts
+    them in batches using bulk_create
+
+    Duplicates are detected against an in-memory set of keys per subtype.
+    For models with a unique constraint on the key, entries already in the
+    database are skipped on insert (see _conflict_functions). For other
+    models the set is populated from the database with the keys of existing
+    entries over the date range of the messages being inserted
+
+    Parameters
+    ----------
+    batch_size : int
+        the number of messages of a single subtype to be buffered before
+        the buffer is flushed to the database
+    loader : str
+        'orm' to insert level rows with bulk_create, or 'copy' to load them
+        using COPY (see _copy_functions). COPY is only supported for
+        PostgreSQL, with level rows inserted using the ORM otherwise. Not
+        used where levels are stored packed on their parent entries, as per
+        the BMRA_LEVEL_STORAGE setting
+    """
+
+    def __init__(self, batch_size=5000, loader='orm'):
+        from BMRA.models.profiles import use_packed_levels
+
+        if loader not in ('orm', 'copy'):
+            raise ValueError('Loader {} not recognised'.format(loader))
+        self.batch_size = batch_size
+        self.loader = loader if copy_supported() else 'orm'
+        self.buffers = defaultdict(list)
+        self.known_keys = defaultdict(set)
+        self.loaded_ranges = {}
+        self.insert_log = new_insert_log()
+        self.reference_cache = ReferenceCache()
+        self.packed_levels = use_packed_levels()
+
+    def add(self, message_dict):
+        """
+        Adds a message to the relevant buffer, flushing the buffer if full.
+        Messages without a bulk definition are inserted immediately
+        """
+        message_type = message_dict['message_type']
+        message_subtype = message_dict['message_subtype']
+        if message_subtype not in BULK_INSERT_DEFINITIONS.get(message_type, {}):
+            merge_insert_log(self.insert_log, insert_data(message_dict, self.reference_cache))
+            return
+        buffer = self.buffers[(message_type, message_subtype)]
+        buffer.append(message_dict)
+        if len(buffer) >= self.batch_size:
+            self.flush(message_type, message_subtype)
+
+    def close(self):
+        """
+        Flushes all remaining buffers
+
+        Returns
+        -------
+        dict
+            the combined insert log of all messages added
+        """
+        for message_type, message_subtype in list(self.buffers):
+            self.flush(message_type, message_subtype)
+        return self.insert_log
+
+    def load_existing_keys(self, message_type, message_subtype, range_values):
+        """
+        Loads the keys of existing entries of a given type and subtype into
+        the set of known keys, in a single query covering the range of the
+        given values. Only the part of the range not previously loaded is
+        queried, so that repeated flushes of the same file cost no more
+        than a query each
+
+        Parameters
+        ----------
+        message_type : str
+            the message type
+        message_subtype : str
+            the message subtype
+        range_values : list
+            the values of the range field for the entries to be checked
+        """
+        import BMRA.models as bmra_models
+
+        definition = BULK_INSERT_DEFINITIONS[message_type][message_subtype]
+        model = getattr(bmra_models, definition['model'])
+        range_field = get_range_field(definition)
+        range_values = [value for value in range_values if value is not None]
+        if len(range_values) == 0:
+            return
+        range_start, range_end = min(range_values), max(range_values)
+
+        loaded_range = self.loaded_ranges.get((message_type, message_subtype))
+        if loaded_range is None:
+            query_ranges = [(range_start, range_end)]
+        else:
+            query_ranges = []
+            if range_start < loaded_range[0]:
+                query_ranges.append((range_start, loaded_range[0]))
+            if range_end > loaded_range[1]:
+                query_ranges.append((loaded_range[1], range_end))
+            range_start = min(range_start, loaded_range[0])
+            range_end = max(range_end, loaded_range[1])
+
+        known_keys = self.known_keys[(message_type, message_subtype)]
+        for query_range in query_ranges:
+            known_keys.update(model.objects
+                              .filter(**{range_field + '__range': query_range})
+                              .values_list(*definition['key']))
+        self.loaded_ranges[(message_type, message_subtype)] = (range_start, range_end)
+
+    def is_duplicate(self, model, definition, key):
+        """
+        Checks whether an entry with the given key already exists, for keys
+        which cannot be checked against the loaded key set
+        """
+        return model.objects.filter(**dict(zip(definition['key'], key))).exists()
+
+    def flush(self, message_type, message_subtype):
+        """
+        Inserts all buffered messages of a given type and subtype
+        """
+        import BMRA.models as bmra_models
+
+        messages = self.buffers.pop((message_type, message_subtype), [])
+        if len(messages) == 0:
+            return
+        definition = BULK_INSERT_DEFINITIONS[message_type][message_subtype]
+        model = getattr(bmra_models, definition['model'])
+        known_keys = self.known_keys[(message_type, message_subtype)]
+        natural_key = get_unique_key(model)
+        unique_key = natural_key is not None and set(natural_key) == set(definition['key'])
+
+        # keys are computed for all messages before checking for duplicates
+        # so that existing keys can be loaded in a single query
+        key_fields = {field: definition['fields'][field] for field in definition['key']}
+        message_sources = []
+        for message_dict in messages:
+            if definition['per_point']:
+                sources = [dict(message_dict, **data_point)
+                           for data_point in message_dict['data_points'].values()]
+            else:
+                sources = [message_dict]
+            message_sources.append(
+                (message_dict, [(source, tuple(map_fields(source, key_fields).values()))
+                                for source in sources]))
+        range_field = get_range_field(definition)
+        if range_field is not None and not unique_key:
+            range_index = definition['key'].index(range_field)
+            self.load_existing_keys(message_type, message_subtype,
+                                    [key[range_index]
+                                     for _, keyed_sources in message_sources
+                                     for _, key in keyed_sources])
+
+        rows = []
+        row_messages = []
+        level_sources = []
+        message_duplicates = []
+        for message_dict, keyed_sources in message_sources:
+            duplicate = False
+            for source, key in keyed_sources:
+                if unique_key:
+                    duplicate = key in known_keys
+                elif range_field is None or key[range_index] is None:
+                    duplicate = key in known_keys or self.is_duplicate(model, definition, key)
+                else:
+                    duplicate = key in known_keys
+                if duplicate:
+                    break
+                if 'data_points' in definition and len(source['data_points']) != definition['data_points']:
+                    raise ValueError('%d data points expected for %s entry, %d found' %
+                                     (definition['data_points'],
+                                      message_subtype,
+                                      len(source['data_points'])))
+                known_keys.add(key)
+                row = map_fields(source, definition['fields'])
+                if 'level' in definition and self.packed_levels:
+                    row['levels'] = pack_data_points(message_dict['data_points'],
+                                                     definition['level'][2])
+                rows.append(row)
+                row_messages.append(len(message_duplicates))
+                if 'level' in definition:
+                    level_sources.append(message_dict['data_points'])
+            message_duplicates.append(duplicate)
+
+        self.create_references(rows, log_new_bmus=(message_type == 'BM'))
+        objects = [model(**row) for row in rows]
+        if unique_key:
+            # messages with any entry already in the database are duplicates
+            inserted = {id(obj) for obj in insert_ignore_conflicts(objects)}
+            kept = [id(obj) in inserted for obj in objects]
+            for message_index, kept_row in zip(row_messages, kept):
+                if not kept_row:
+                    message_duplicates[message_index] = True
+            rows = [row for row, kept_row in zip(rows, kept) if kept_row]
+            objects = [obj for obj, kept_row in zip(objects, kept) if kept_row]
+            if 'level' in definition:
+                level_sources = [data_points for data_points, kept_row in zip(level_sources, kept)
+                                 if kept_row]
+        else:
+            model.objects.bulk_create(objects)
+        duplicates = sum(message_duplicates)
+        new_entries = len(message_duplicates) - duplicates
+
+        if 'level' in definition and not self.packed_levels:
+            level_model_name, parent_field, level_fields = definition['level']
+            level_model = getattr(bmra_models, level_model_name)
+            if self.loader == 'copy':
+                copy_level_rows(model, definition['key'], level_model, parent_field,
+                                tuple(level_fields),
+                                [tuple(row[field] for field in definition['key'])
+                                 + tuple(map_fields(data_point, level_fields).values())
+                                 for row, data_points in zip(rows, level_sources)
+                                 for data_point in data_points.values()])
+            else:
+                level_model.objects.bulk_create(
+                    [level_model(**{parent_field: parent}, **map_fields(data_point, level_fields))
+                     for parent, data_points in zip(objects, level_sources)
+                     for data_point in data_points.values()])
+
+        if new_entries > 0:
+            merge_insert_log(self.insert_log,
+                             {'new_entries': {definition['log_key']: new_entries}})
+        if duplicates > 0:
+            merge_insert_log(self.insert_log,
+                             {'duplicate_msg': {message_subtype: duplicates}})
+
+    def create_references(self, rows, log_new_bmus=True):
+        """
+        Creates any BMU, fuel type or zone entries referenced by the
+        given rows which do not already exist, logging new BMUs if
+        log_new_bmus is set (as per insert_data, new BMUs are only
+        logged for BM messages)
+        """
+        import BMRA.models as bmra_models
+
+        for field, model_name in REFERENCE_FIELDS.items():
+            ids = sorted({row[field] for row in rows if field in row})
+            if len(ids) == 0:
+                continue
+            new_ids = self.reference_cache.create(getattr(bmra_models, model_name), ids)
+            if model_name == 'BMU' and log_new_bmus:
+                self.insert_log['new_bmus'].extend(new_ids)
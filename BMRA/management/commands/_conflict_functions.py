@@ -0,0 +1,142 @@
+"""
+Helper functions for inserting entries of models with a unique natural key
+
+Entries are inserted with INSERT ... ON CONFLICT DO NOTHING, so that
+entries whose key already exists are skipped by the database rather than
+checked for beforehand, making repeated or concurrent ingestion of the
+same messages safe. The keys of the entries inserted are returned by the
+insert, so that duplicates may still be counted and level rows attached
+to the new entries only. Requires PostgreSQL, or SQLite 3.35 or later
+
+"""
+from django.db import connection
+
+
+def get_unique_key(model):
+    """
+    Returns the natural key of a model, being its first unique_together
+    constraint
+
+    Parameters
+    ----------
+    model : Model
+        the model
+
+    Returns
+    -------
+    tuple
+        the column names (attnames) of the key fields, e.g. ('bmu_id', 'sd',
+        'sp'), or None if the model has no unique_together constraint
+    """
+    if len(model._meta.unique_together) == 0:
+        return None
+    return tuple(model._meta.get_field(name).attname
+                 for name in model._meta.unique_together[0])
+
+
+def from_db_value(field, value):
+    """
+    Converts a value returned by the database to its Python value, as per
+    the conversion applied to query results
+    """
+    expression = field.get_col(field.model._meta.db_table)
+    for converter in connection.ops.get_db_converters(expression) \
+            + expression.get_db_converters(connection):
+        value = converter(value, expression, connection)
+    return value
+
+
+def insert_ignore_conflicts(objects, key=None):
+    """
+    Inserts unsaved model instances, skipping any which conflict with an
+    existing entry on the natural key of the model, as per get_unique_key.
+    The primary keys of the instances inserted are set, as per bulk_create,
+    with the instances inserted identified by the keys returned
+
+    Parameters
+    ----------
+    objects : list
+        unsaved instances of a single model, with unique natural keys
+    key : tuple
+        (optional) the column names (attnames) identifying each instance,
+        e.g. ('id',) for models without a natural key whose primary key is
+        set before insertion. The natural key of the model by default
+
+    Returns
+    -------
+    list
+        the instances inserted, in the order given
+    """
+    if len(objects) == 0:
+        return []
+    model = type(objects[0])
+    opts = model._meta
+    if key is None:
+        key = get_unique_key(model)
+    fields = [field for field in opts.concrete_fields if field is not opts.auto_field]
+    quote_name = connection.ops.quote_name
+
+    inserted = []
+    batch_size = max(connection.ops.bulk_batch_size(fields, objects), 1)
+    for batch_start in range(0, len(objects), batch_size):
+        batch = objects[batch_start:batch_start + batch_size]
+        values = [[field.get_db_prep_save(field.pre_save(obj, True), connection)
+                   for field in fields]
+                  for obj in batch]
+        positions = {tuple(getattr(obj, attname) for attname in key): index
+                     for index, obj in enumerate(batch)}
+        query = 'INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING RETURNING {}, {}'.format(
+            quote_name(opts.db_table),
+            ', '.join(quote_name(field.column) for field in fields),
+            ', '.join(['({})'.format(', '.join(['%s'] * len(fields)))] * len(batch)),
+            quote_name(opts.pk.column),
+            ', '.join(quote_name(opts.get_field(attname).column) for attname in key))
+        with connection.cursor() as cursor:
+            cursor.execute(query, [value for row in values for value in row])
+            returned = cursor.fetchall()
+        indices = []
+        for pk_value, *key_values in returned:
+            index = positions[tuple(from_db_value(opts.get_field(attname), value)
+                                    for attname, value in zip(key, key_values))]
+            setattr(batch[index], opts.pk.attname, pk_value)
+            batch[index]._state.adding = False
+            batch[index]._state.db = connection.alias
+            indices.append(index)
+        inserted.extend(batch[index] for index in sorted(indices))
+    return inserted
+
+
+def remove_duplicates(model, batch_size=10000):
+    """
+    Deletes all but the first entry (by primary key) of each natural key
+    of a model, as per get_unique_key, e.g. prior to the creation of the
+    unique constraint. The duplicate entries are selected in a single query
+    and deleted in batches, with related level entries deleted with their
+    parents
+
+    Parameters
+    ----------
+    model : Model
+        the model
+    batch_size : int
+        the number of entries deleted per query
+
+    Returns
+    -------
+    int
+        the number of entries deleted, excluding related entries
+    """
+    opts = model._meta
+    quote_name = connection.ops.quote_name
+    query = 'SELECT {pk} FROM (SELECT {pk}, row_number() OVER (PARTITION BY {key} ' \
+            'ORDER BY {pk}) AS key_rank FROM {table}) AS ranked WHERE key_rank > 1'.format(
+                pk=quote_name(opts.pk.column),
+                key=', '.join(quote_name(opts.get_field(attname).column)
+                              for attname in get_unique_key(model)),
+                table=quote_name(opts.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(query)
+        duplicate_pks = [row[0] for row in cursor.fetchall()]
+    for batch_start in range(0, len(duplicate_pks), batch_size):
+        model.objects.filter(pk__in=duplicate_pks[batch_start:batch_start + batch_size]).delete()
+    return len(duplicate_pks)
@@ -0,0 +1,145 @@
+"""
+Helper functions for loading level rows into PostgreSQL using COPY
+
+Level rows are streamed into a temporary staging table alongside the
+natural key of their parent entry, then inserted into the level table in a
+single statement which resolves the parent foreign keys by joining the
+staging table to the parent table on the natural key
+
+"""
+import csv
+import datetime as dt
+import io
+from django.db import connection
+
+
+def copy_supported():
+    """
+    Checks whether the database supports loading with COPY
+
+    Returns
+    -------
+    bool
+        True if the default database is PostgreSQL
+    """
+    return connection.vendor == 'postgresql'
+
+
+def format_copy_value(value):
+    """
+    Formats a value for COPY in CSV format, with None as an unquoted empty
+    field (NULL) and booleans, dates and datetimes in PostgreSQL input form
+
+    Parameters
+    ----------
+    value : object
+        the value to be formatted
+
+    Returns
+    -------
+    object
+        the value to be written by csv.writer
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dt.datetime, dt.date)):
+        return value.isoformat()
+    return value
+
+
+def rows_to_csv(rows):
+    """
+    Writes rows of values to an in-memory CSV file for COPY
+
+    Parameters
+    ----------
+    rows : iterable
+        tuples of values
+
+    Returns
+    -------
+    StringIO
+        the CSV file, positioned at the start
+    """
+    csv_file = io.StringIO()
+    writer = csv.writer(csv_file)
+    for row in rows:
+        writer.writerow([format_copy_value(value) for value in row])
+    csv_file.seek(0)
+    return csv_file
+
+
+def copy_level_rows(parent_model, parent_key, level_model, parent_field, level_fields, level_rows):
+    """
+    Inserts level rows using COPY into a staging table, resolving the
+    foreign key to the parent entry set-wise by the parent natural key.
+    Parent entries must already have been inserted, with keys unique
+    within the parent table (as ensured by duplicate detection)
+
+    Parameters
+    ----------
+    parent_model : Model
+        the parent model, e.g. FPN
+    parent_key : tuple
+        the parent model fields forming the natural key, e.g.
+        ('bmu_id', 'sd', 'sp')
+    level_model : Model
+        the level model, e.g. FPNlevel
+    parent_field : str
+        the name of the level model foreign key to the parent, e.g. 'fpn'
+    level_fields : tuple
+        the level model fields to be inserted, e.g. ('ts', 'vp')
+    level_rows : list
+        tuples of the parent key values followed by the level field values
+
+    Returns
+    -------
+    int
+        the number of level rows inserted
+
+    Raises
+    ------
+    ValueError
+        if any level row does not match exactly one parent entry
+    """
+    if len(level_rows) == 0:
+        return 0
+    parent_table = parent_model._meta.db_table
+    level_table = level_model._meta.db_table
+    staging_table = level_table + '_staging'
+    parent_columns = [parent_model._meta.get_field(field).column for field in parent_key]
+    level_columns = [level_model._meta.get_field(field).column for field in level_fields]
+    staging_columns = (['parent_' + column for column in parent_columns]
+                       + ['level_' + column for column in level_columns])
+
+    with connection.cursor() as cursor:
+        # staging table takes its column types from the parent and level tables
+        cursor.execute('DROP TABLE IF EXISTS {}'.format(staging_table))
+        cursor.execute('CREATE TEMPORARY TABLE {} AS SELECT {} FROM {} p, {} l '
+                       'WITH NO DATA'.format(
+                           staging_table,
+                           ', '.join(['p.{} AS parent_{}'.format(column, column)
+                                      for column in parent_columns]
+                                     + ['l.{} AS level_{}'.format(column, column)
+                                        for column in level_columns]),
+                           parent_table,
+                           level_table))
+        cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            staging_table, ', '.join(staging_columns)), rows_to_csv(level_rows))
+        cursor.execute('INSERT INTO {} ({}, {}) SELECT p.id, {} FROM {} s JOIN {} p ON {}'.format(
+            level_table,
+            level_model._meta.get_field(parent_field).column,
+            ', '.join(level_columns),
+            ', '.join(['s.level_' + column for column in level_columns]),
+            staging_table,
+            parent_table,
+            ' AND '.join(['p.{} = s.parent_{}'.format(column, column)
+                          for column in parent_columns])))
+        inserted = cursor.rowcount
+        cursor.execute('DROP TABLE {}'.format(staging_table))
+    if inserted != len(level_rows):
+        raise ValueError('{} of {} {} rows matched a parent entry'.format(
+            inserted, len(level_rows), level_model.__name__))
+    return inserted
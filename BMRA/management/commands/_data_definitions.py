@@ -6,6 +6,7 @@ See example_BM_data.txt for description of fields
 """
 
 import datetime as dt
+from functools import lru_cache
 from django.utils import timezone
 
 # messages which will be processed, all others ignored
@@ -135,6 +136,58 @@ ACCEPTED_MESSAGES = {
 # messages (including some weird ones) that have appeared with no useful information
 IGNORED_MESSAGES = ['TEST', 'test', 'text', 'Duber']
 
+UTC = timezone.utc
+
+
+@lru_cache(maxsize=4096)
+def cast_timestamp(value):
+    """
+    Converts a timestamp string of the form 2017:03:29:01:30:00:GMT to a
+    tz-aware UTC datetime. Results are cached as the same timestamps recur
+    throughout a file, and strings in the standard fixed-width form are
+    sliced directly rather than split
+
+    Parameters
+    ----------
+    value : str
+        the timestamp string
+
+    Returns
+    -------
+    datetime
+        the tz-aware UTC datetime
+    """
+    if (len(value) == 23 and value[4] == ':' and value[7] == ':' and value[10] == ':'
+            and value[13] == ':' and value[16] == ':' and value[19] == ':'
+            and value.count(':') == 6):
+        return dt.datetime(int(value[:4]), int(value[5:7]), int(value[8:10]),
+                           int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                           tzinfo=UTC)
+    return dt.datetime(*[int(x) for x in value.split(':')[:-1]], tzinfo=UTC)
+
+
+@lru_cache(maxsize=1024)
+def cast_date(value):
+    """
+    Converts a date string of the form 2017:03:29:00:00:00:GMT to a date,
+    with results cached and fixed-width strings sliced as per cast_timestamp
+
+    Parameters
+    ----------
+    value : str
+        the date string
+
+    Returns
+    -------
+    date
+        the date
+    """
+    if (len(value) >= 10 and value[4] == ':' and value[7] == ':'
+            and (len(value) == 10 or value[10] == ':') and value.count(':', 0, 10) == 2):
+        return dt.date(int(value[:4]), int(value[5:7]), int(value[8:10]))
+    return dt.date(*[int(x) for x in value.split(':')[:3]])
+
+
 # custom functions for converting raw message strings to required datatypes
 FIELD_CASTING_FUNCS = {
     'A1': lambda value: float(value),
@@ -164,7 +217,7 @@ FIELD_CASTING_FUNCS = {
     'BP': lambda value: float(value),
     'BT': lambda value: float(value),
     'BV': lambda value: float(value),
-    'CD': lambda value: dt.date(*[int(x) for x in value.split(':')[:3]]),
+    'CD': cast_date,
     'CF': lambda value: True if value == 'T' else False,
     'CI': lambda value: value.strip(),
     'CP': lambda value: int(value),
@@ -181,7 +234,7 @@ FIELD_CASTING_FUNCS = {
     'DS': lambda value: value.strip(),
     'DV': lambda value: float(value),
     'DZ': lambda value: int(value),
-    'ED': lambda value: dt.date(*[int(x) for x in value.split(':')[:3]]),
+    'ED': cast_date,
     'EH': lambda value: int(value),
     'EL': lambda value: int(value),
     'EN': lambda value: int(value),
@@ -248,7 +301,7 @@ FIELD_CASTING_FUNCS = {
     'RV': lambda value: float(value),
     'SA': lambda value: True if value == 'S' else False,
     'SC': lambda value: True if value == 'T' else False,
-    'SD': lambda value: dt.date(*[int(x) for x in value.split(':')[:3]]),
+    'SD': cast_date,
     'SE': lambda value: float(value),
     'SF': lambda value: float(value),
     'SI': lambda value: float(value),
@@ -257,27 +310,27 @@ FIELD_CASTING_FUNCS = {
     'SO': lambda value: True if value == 'T' else False,
     'SP': lambda value: int(value),
     'SQ': lambda value: int(value),
-    'ST': lambda value: dt.datetime(*[int(x) for x in value.split(':')[:-1]], tzinfo=timezone.utc),
+    'ST': cast_timestamp,
     'SV': lambda value: float(value),
     'SW': lambda value: value.strip(),
     'SX': lambda value: value.strip(),
     'T1': lambda value: float(value),
     'T2': lambda value: float(value),
-    'TA': lambda value: dt.datetime(*[int(x) for x in value.split(':')[:-1]], tzinfo=timezone.utc),
+    'TA': cast_timestamp,
     'TC': lambda value: float(value),
     'TD': lambda value: value.strip(),
-    'TE': lambda value: dt.datetime(*[int(x) for x in value.split(':')[:-1]], tzinfo=timezone.utc),
-    'TF': lambda value: dt.datetime(*[int(x) for x in value.split(':')[:-1]], tzinfo=timezone.utc),
+    'TE': cast_timestamp,
+    'TF': cast_timestamp,
     'TH': lambda value: float(value),
-    'TI': lambda value: dt.datetime(*[int(x) for x in value.split(':')[:-1]], tzinfo=timezone.utc),
+    'TI': cast_timestamp,
     'TL': lambda value: float(value),
     'TM': lambda value: float(value),
     'TN': lambda value: float(value),
     'TO': lambda value: float(value),
-    'TP': lambda value: dt.datetime(*[int(x) for x in value.split(':')[:-1]], tzinfo=timezone.utc),
+    'TP': cast_timestamp,
     'TQ': lambda value: float(value),
     'TR': lambda value: int(value),
-    'TS': lambda value: dt.datetime(*[int(x) for x in value.split(':')[:-1]], tzinfo=timezone.utc),
+    'TS': cast_timestamp,
     'TT': lambda value: value.strip(),
     'TV': lambda value: float(value),
     'TX': lambda value: value.strip(),
@@ -297,7 +350,7 @@ FIELD_CASTING_FUNCS = {
     'VM': lambda value: float(value),
     'VO': lambda value: float(value),
     'VP': lambda value: float(value),
-    'WD': lambda value: dt.date(*[int(x) for x in value.split(':')[:3]]),
+    'WD': cast_date,
     'WN': lambda value: int(value),
     'ZI': lambda value: value.strip()
 }
@@ -3,13 +3,23 @@ Helper functions for managing downloads
 
 """
 import datetime as dt
-import urllib.request
 import gzip
+import codecs
 import os.path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from django.db import transaction
 from tqdm import tqdm
 
-from ._upload_functions import message_to_dict, insert_data
+from ._upload_functions import message_to_dict, insert_data, merge_insert_log, new_insert_log
+from ._bulk_upload_functions import BulkInserter
+from ._reference_functions import ReferenceCache
+from ._async_download_functions import download_files
+from ._ledger_functions import get_file_checksum, get_completed_entry, start_entry, finish_entry
+
+# the number of messages for which references are created at a time
+REFERENCE_CHUNK_SIZE = 1000
 
 def get_tibco_daily_filenames(date_start, date_end=None):
     """
@@ -52,6 +62,28 @@ key=INSERT_KEY&filename=tib_messages.2018-09-15.gz
     #print(filename_list)
     return filename_list
 
+def get_bmra_url(filename):
+    """
+    returns the Elexon archive url for a given BMRA filename
+
+    Parameters
+    ----------
+    filename : str
+        the filename to be downloaded
+
+    Returns
+    -------
+    str
+        the remote url of the file
+    """
+    from GBEnergyDataManager.settings import ELEXON_BASEURL, ELEXON_KEY
+
+    return (ELEXON_BASEURL
+            + '?key='
+            + ELEXON_KEY
+            + '&filename='
+            + filename)
+
 def download_bmra_file(filename, overwrite):
     """
     downloads single BMRA file corresponding to given filename
@@ -66,71 +98,276 @@ def download_bmra_file(filename, overwrite):
         whether to overwrite existing files
 
     """
-    from GBEnergyDataManager.settings import ELEXON_BASEURL, ELEXON_KEY, BMRA_INPUT_DIR
+    from GBEnergyDataManager.settings import BMRA_INPUT_DIR
 
     if (not os.path.isfile(BMRA_INPUT_DIR + filename)) or (os.path.isfile(BMRA_INPUT_DIR + filename and overwrite)):
-        remote_url = (ELEXON_BASEURL
-                      + '?key='
-                      + ELEXON_KEY
-                      + '&filename='
-                      + filename)
-        urllib.request.urlretrieve(
-            remote_url,
-            BMRA_INPUT_DIR + filename)
+        download_files([(get_bmra_url(filename), BMRA_INPUT_DIR + filename)])
 
-@transaction.atomic #all succeeds for single day or rollback
-def process_bmra_file(date, no_insert=False):
+def prefetch_bmra_files(prefetcher, dates):
+    """
+    starts background downloads of the BMRA files for given dates which
+    are not already saved locally
+
+    Parameters
+    ----------
+    prefetcher : Prefetcher
+        the prefetcher used to download the files
+    dates : list
+        the dates of the files to be downloaded
+    """
+    from GBEnergyDataManager.settings import BMRA_INPUT_DIR
+
+    for date in dates:
+        filename = get_tibco_daily_filenames(date)[0]
+        if not os.path.isfile(BMRA_INPUT_DIR + filename):
+            prefetcher.prefetch(get_bmra_url(filename), BMRA_INPUT_DIR + filename)
+
+def read_bmra_messages(file_path, chunk_size=1048576):
+    """
+    generator yielding individual messages from a gzipped BMRA file,
+    decompressing the file in chunks so that the whole file is never
+    held in memory
+
+    Parameters
+    ----------
+    file_path : str
+        the path of the gzipped BMRA file
+    chunk_size : int
+        the number of bytes to be decompressed at a time
+
+    Yields
+    ------
+    str
+        a single raw message string, terminated with '}'
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')('ignore')
+    remainder = ''
+    with gzip.open(file_path, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            remainder += decoder.decode(chunk, final=(len(chunk) == 0))
+            entries = remainder.split('}')
+            remainder = entries.pop()
+            for entry in entries:
+                if len(entry.strip()) > 0:
+                    yield entry + '}'
+            if len(chunk) == 0:
+                break
+    if len(remainder.strip()) > 0:
+        yield remainder + '}'
+
+def parse_messages(messages):
+    """
+    converts a list of raw message strings to message dictionaries
+
+    Parameters
+    ----------
+    messages : list
+        raw message strings
+
+    Returns
+    -------
+    list
+        message dictionaries (or None for messages which are not processed)
+    """
+    return [message_to_dict(message) for message in messages]
+
+def parse_bmra_messages(messages, parse_workers=None, chunk_size=1000):
+    """
+    generator converting raw message strings to message dictionaries,
+    optionally spreading the parsing across a pool of worker processes.
+    Messages are sent to workers in chunks and results are yielded in the
+    original message order, with at most two chunks per worker in flight
+
+    Parameters
+    ----------
+    messages : iterable
+        raw message strings
+    parse_workers : int
+        the number of worker processes, if None messages are parsed in the
+        current process
+    chunk_size : int
+        the number of messages sent to a worker at a time
+
+    Yields
+    ------
+    dict
+        message dictionary (or None for messages which are not processed)
+    """
+    if parse_workers is None or parse_workers < 2:
+        for message in messages:
+            yield message_to_dict(message)
+        return
+
+    messages = iter(messages)
+    with ProcessPoolExecutor(max_workers=parse_workers) as executor:
+        futures = deque()
+        while True:
+            while len(futures) < 2 * parse_workers:
+                chunk = list(islice(messages, chunk_size))
+                if len(chunk) == 0:
+                    break
+                futures.append(executor.submit(parse_messages, chunk))
+            if len(futures) == 0:
+                break
+            for message_dict in futures.popleft().result():
+                yield message_dict
+
+def process_bmra_file(date, no_insert=False, batch_size=None, parse_workers=None, force=False,
+                      loader='orm'):
     """
-    downloads and processes single BMRA file corresponding to given date
+    downloads and processes single BMRA file corresponding to given date,
+    recording the outcome in the ingestion ledger. Files already completed
+    with the same checksum are skipped unless force is set
 
     Parameters
     ----------
     date : datetime
         the date of the datafile to be downloaded and processed
+    no_insert : bool
+        if True, messages are parsed but not inserted into the db
+    batch_size : int
+        if given, messages are buffered by subtype and inserted in batches
+        of this size rather than individually
+    parse_workers : int
+        if given, messages are parsed by this number of worker processes,
+        with database inserts made by the current process
+    force : bool
+        if True, the file is processed even if already completed
+    loader : str
+        'orm' or 'copy', the method used to load level rows (see
+        BulkInserter). Loading with COPY implies batched inserts
+
+    Returns
+    -------
+    dict
+        the combined insert log, with 'skipped' set if the file was skipped
     """
     from GBEnergyDataManager.settings import BMRA_INPUT_DIR
 
     filename = get_tibco_daily_filenames(date)[0]
     download_bmra_file(filename, True)
-    file = gzip.open(BMRA_INPUT_DIR + filename, 'rb')
-    file_content = file.read().decode('utf-8', 'ignore')
-    file_rows = [entry for entry in file_content.split('}')]
+    if no_insert:
+        return insert_bmra_file(BMRA_INPUT_DIR + filename, True, batch_size, parse_workers)
+
+    checksum = get_file_checksum(BMRA_INPUT_DIR + filename)
+    completed_entry = get_completed_entry(filename, checksum)
+    if completed_entry is not None and not force:
+        combined_insert_log = new_insert_log()
+        combined_insert_log['count'] = completed_entry.message_count
+        combined_insert_log['skipped'] = True
+        return combined_insert_log
+
+    processed_file = start_entry(filename, 'BMRA', checksum)
+    try:
+        combined_insert_log = insert_bmra_file(BMRA_INPUT_DIR + filename,
+                                               False,
+                                               batch_size,
+                                               parse_workers,
+                                               loader)
+    except Exception as e:
+        finish_entry(processed_file, error=e)
+        raise
+    finish_entry(processed_file, combined_insert_log)
+    return combined_insert_log
+
+@transaction.atomic #all succeeds for single day or rollback
+def insert_bmra_file(file_path, no_insert=False, batch_size=None, parse_workers=None, loader='orm'):
+    """
+    processes single downloaded BMRA file
+
+    Parameters
+    ----------
+    file_path : str
+        the path of the gzipped BMRA file
+    no_insert : bool
+        as per process_bmra_file
+    batch_size : int
+        as per process_bmra_file
+    parse_workers : int
+        as per process_bmra_file
+    loader : str
+        as per process_bmra_file
+
+    Returns
+    -------
+    dict
+        the combined insert log
+    """
     count = 0
-    combined_insert_log = {'new_bmus' : [],
-                           'inserts' : {},
-                           'unprocessed_msg' : {},
-                           'duplicate_msg' : {},
-                           }
-    for message in tqdm(file_rows):
-        if len(message.strip()) > 0:
-            message_dict = message_to_dict(message+'}')
+    combined_insert_log = new_insert_log()
+    bulk_inserter = None
+    if no_insert:
+        pass
+    elif batch_size is not None:
+        bulk_inserter = BulkInserter(batch_size, loader)
+    elif loader != 'orm':
+        bulk_inserter = BulkInserter(loader=loader)
+    reference_cache = ReferenceCache()
+    messages = read_bmra_messages(file_path)
+    message_dicts = iter(tqdm(parse_bmra_messages(messages, parse_workers)))
+    # messages are inserted in chunks, with any BMUs etc. referenced by the
+    # chunk created in bulk beforehand
+    for chunk in iter(lambda: list(islice(message_dicts, REFERENCE_CHUNK_SIZE)), []):
+        if not no_insert and bulk_inserter is None:
+            combined_insert_log['new_bmus'].extend(reference_cache.create_references(chunk))
+        for message_dict in chunk:
             if message_dict is not None:
-                if message_dict['message_subtype'] not in []:
-                    if no_insert:
-                        insert_log = []
-                    else:
-                        insert_log = insert_data(message_dict)
-                    if 'new_bmu' in insert_log:
-                        combined_insert_log['new_bmus'].append(insert_log['new_bmu'])
-                    if 'new_entries' in insert_log:
-                        for key,value in insert_log['new_entries'].items():
-                            if key in combined_insert_log['inserts']:
-                                combined_insert_log['inserts'][key] += value
-                            else:
-                                combined_insert_log['inserts'][key] = value
-                    if 'unprocessed_msg' in insert_log:
-                        for key,value in insert_log['unprocessed_msg'].items():
-                            if key in combined_insert_log['unprocessed_msg']:
-                                combined_insert_log['unprocessed_msg'][key] += value
-                            else:
-                                combined_insert_log['unprocessed_msg'][key] = value
-                    if 'duplicate_msg' in insert_log:
-                        for key,value in insert_log['duplicate_msg'].items():
-                            if key in combined_insert_log['duplicate_msg']:
-                                combined_insert_log['duplicate_msg'][key] += value
-                            else:
-                                combined_insert_log['duplicate_msg'][key] = value
+                if no_insert:
+                    pass
+                elif bulk_inserter is not None:
+                    bulk_inserter.add(message_dict)
+                else:
+                    merge_insert_log(combined_insert_log,
+                                     insert_data(message_dict, reference_cache))
             count += 1
+    if bulk_inserter is not None:
+        combined_insert_log = bulk_inserter.close()
     combined_insert_log['count'] = count
-    file.close()
     return combined_insert_log
+
+def init_bmra_worker():
+    """
+    initialiser for worker processes processing BMRA files, ensuring Django
+    is set up where worker processes are spawned rather than forked. Each
+    worker opens its own database connection when first used
+    """
+    import django
+    django.setup()
+
+def process_bmra_day(date, batch_size=None, parse_workers=None, force=False, loader='orm'):
+    """
+    processes single BMRA file corresponding to given date, capturing any
+    error so that processing of other dates can continue. As per
+    process_bmra_file, all inserts for the date are rolled back on error
+
+    Parameters
+    ----------
+    date : datetime
+        the date of the datafile to be downloaded and processed
+    batch_size : int
+        as per process_bmra_file
+    parse_workers : int
+        as per process_bmra_file
+    force : bool
+        as per process_bmra_file
+    loader : str
+        as per process_bmra_file
+
+    Returns
+    -------
+    tuple
+        the date, status ('completed', 'skipped' or 'failed') and either the
+        combined insert log or the error message
+    """
+    try:
+        combined_insert_log = process_bmra_file(date,
+                                                batch_size=batch_size,
+                                                parse_workers=parse_workers,
+                                                force=force,
+                                                loader=loader)
+    except Exception as e:
+        return date, 'failed', '{} {}'.format(type(e).__name__, e.args)
+    if combined_insert_log.get('skipped'):
+        return date, 'skipped', combined_insert_log
+    return date, 'completed', combined_insert_log
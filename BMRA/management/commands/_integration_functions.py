@@ -0,0 +1,173 @@
+"""
+Helper functions for integrating physical notification profiles (e.g. FPN
+and MEL levels) into energy volumes
+
+Profiles are piecewise linear between spot points, so the energy of each
+settlement period is given exactly by the trapezoidal rule. Levels for
+many BMUs and settlement periods are integrated at once using array
+operations, with one output value per group of consecutive levels. Levels
+stored packed on their submissions are unpacked to the same layout
+
+"""
+import numpy as np
+import pandas as pd
+
+
+def get_group_starts(group_keys):
+    """
+    Finds the start of each run of equal keys in sorted key arrays
+
+    Parameters
+    ----------
+    group_keys : list
+        equal-length arrays of key values, e.g. [bmu_ids, sds, sps], sorted
+        so that the rows of each group are consecutive
+
+    Returns
+    -------
+    ndarray
+        boolean array, True for the first row of each group
+    """
+    n_rows = len(group_keys[0]) if len(group_keys) > 0 else 0
+    starts = np.zeros(n_rows, dtype=bool)
+    if n_rows == 0:
+        return starts
+    starts[0] = True
+    for keys in group_keys:
+        keys = np.asarray(keys)
+        starts[1:] |= keys[1:] != keys[:-1]
+    return starts
+
+
+def integrate_profiles(group_keys, ts, values):
+    """
+    Integrates spot point values over each group of levels using the
+    trapezoidal rule
+
+    Parameters
+    ----------
+    group_keys : list
+        equal-length arrays of key values identifying each group, e.g.
+        [bmu_ids, sds, sps], sorted so that the rows of each group are
+        consecutive
+    ts : array-like
+        the spot times, sorted within each group
+    values : array-like
+        the spot values (MW)
+
+    Returns
+    -------
+    tuple
+        the index of the first row of each group, and the energy (MWh) of
+        each group. Groups with a single level have zero energy
+    """
+    starts = get_group_starts(group_keys)
+    first_rows = np.flatnonzero(starts)
+    if len(first_rows) == 0:
+        return first_rows, np.zeros(0)
+    ts = pd.DatetimeIndex(ts).to_numpy(dtype='datetime64[ns]')
+    values = np.asarray(values, dtype=float)
+    hours = np.diff(ts) / np.timedelta64(1, 'h')
+    segment_mwh = 0.5 * (values[1:] + values[:-1]) * hours
+    # segments spanning two groups are excluded
+    within_group = ~starts[1:]
+    group_index = np.cumsum(starts) - 1
+    mwh = np.bincount(group_index[1:][within_group],
+                      weights=segment_mwh[within_group],
+                      minlength=len(first_rows))
+    return first_rows, mwh
+
+
+def integrate_levels(df, value_column, group_columns=('bmu_id', 'sd', 'sp')):
+    """
+    Integrates levels in a DataFrame over each BMU and settlement period,
+    as per integrate_profiles
+
+    Parameters
+    ----------
+    df : DataFrame
+        long DataFrame with group columns, ts and value columns, ordered by
+        the group columns and ts
+    value_column : str
+        the name of the value column (MW)
+    group_columns : tuple
+        the names of the columns identifying each group
+
+    Returns
+    -------
+    DataFrame
+        long DataFrame with the group columns and an mwh column
+    """
+    group_columns = list(group_columns)
+    first_rows, mwh = integrate_profiles([df[column].to_numpy() for column in group_columns],
+                                         df['ts'],
+                                         df[value_column])
+    result = df[group_columns].iloc[first_rows].reset_index(drop=True)
+    result['mwh'] = mwh
+    return result
+
+
+def unpack_levels_frame(df, value_column, packed_column='levels'):
+    """
+    Expands a DataFrame of entries with packed levels (see
+    BMRA.models.profiles) to one row per level. The levels of all entries
+    are unpacked as a single array
+
+    Parameters
+    ----------
+    df : DataFrame
+        DataFrame with a column of packed levels
+    value_column : str
+        the name of the value column to be created, e.g. 'vp'
+    packed_column : str
+        the name of the column of packed levels
+
+    Returns
+    -------
+    DataFrame
+        the columns of df other than the packed column, repeated for each
+        level of the entry, with ts (UTC) and value columns
+    """
+    from BMRA.models.profiles import LEVEL_DTYPE
+
+    packed = [bytes(levels) for levels in df[packed_column]]
+    counts = np.array([len(levels) // LEVEL_DTYPE.itemsize for levels in packed], dtype=int)
+    levels = np.frombuffer(b''.join(packed), dtype=LEVEL_DTYPE)
+    result = df.drop(columns=packed_column)\
+        .iloc[np.repeat(np.arange(len(df)), counts)].reset_index(drop=True)
+    result['ts'] = pd.to_datetime(levels['ts'], unit='s', utc=True)
+    result[value_column] = levels['value']
+    return result
+
+
+def combine_levels(df, packed_df, sort_columns, ts_columns=('ts',)):
+    """
+    Combines levels held as level rows with those unpacked from packed
+    levels, as per unpack_levels_frame, ordered for integrate_levels
+
+    Parameters
+    ----------
+    df : DataFrame
+        levels held as level rows, ordered by the sort columns
+    packed_df : DataFrame
+        levels unpacked from packed levels, with the same columns
+    sort_columns : list
+        the columns by which the levels are ordered, e.g. ['bmu_id', 'sd',
+        'sp', 'ts']. The sort is stable, so levels with equal timestamps
+        keep their order
+    ts_columns : tuple
+        timestamp columns, converted to UTC in both DataFrames
+
+    Returns
+    -------
+    DataFrame
+        the combined levels, or df unchanged if there are no packed levels
+    """
+    if len(packed_df) == 0:
+        return df
+    df = df.copy()
+    for column in ts_columns:
+        df[column] = pd.to_datetime(df[column], utc=True)
+        packed_df[column] = pd.to_datetime(packed_df[column], utc=True)
+    df = pd.concat([df, packed_df[df.columns]], ignore_index=True)
+    return df.sort_values(list(sort_columns), kind='mergesort').reset_index(drop=True)
@@ -0,0 +1,166 @@
+"""
+Helper functions for the ingestion ledger, recording which downloaded
+files have been processed so that interrupted runs can be resumed
+
+"""
+import hashlib
+import time
+from django.utils import timezone
+
+
+def get_file_checksum(file_path, chunk_size=1048576):
+    """
+    Calculates the SHA-256 checksum of a file
+
+    Parameters
+    ----------
+    file_path : str
+        the path of the file
+    chunk_size : int
+        the number of bytes read at a time
+
+    Returns
+    -------
+    str
+        the hex digest of the file contents
+    """
+    checksum = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def get_completed_entry(filename, checksum=None):
+    """
+    Returns the ledger entry for a file if it has been completed,
+    optionally only if completed with the given checksum
+
+    Parameters
+    ----------
+    filename : str
+        the name of the file
+    checksum : str
+        the checksum of the file, if None any checksum is accepted
+
+    Returns
+    -------
+    ProcessedFile
+        the completed ledger entry, or None if not completed
+    """
+    from BMRA.models import ProcessedFile
+
+    processed_files = ProcessedFile.objects.filter(filename=filename, status='completed')
+    if checksum is not None:
+        processed_files = processed_files.filter(checksum=checksum)
+    return processed_files.first()
+
+
+def get_completed_filenames(filenames):
+    """
+    Returns the names of those files in a list which have been completed
+
+    Parameters
+    ----------
+    filenames : list
+        the names of the files
+
+    Returns
+    -------
+    set
+        the names of the completed files
+    """
+    from BMRA.models import ProcessedFile
+
+    return set(ProcessedFile.objects
+               .filter(filename__in=filenames, status='completed')
+               .values_list('filename', flat=True))
+
+
+def get_first_incomplete(filenames):
+    """
+    Returns the index of the first file in a list which has not been
+    completed, or the length of the list if all have been completed
+
+    Parameters
+    ----------
+    filenames : list
+        the names of the files, in processing order
+
+    Returns
+    -------
+    int
+        the index of the first incomplete file
+    """
+    completed = get_completed_filenames(filenames)
+    for index, filename in enumerate(filenames):
+        if filename not in completed:
+            return index
+    return len(filenames)
+
+
+def start_entry(filename, source, checksum):
+    """
+    Records the start of processing of a file in the ledger, replacing any
+    previous entry for the file
+
+    Parameters
+    ----------
+    filename : str
+        the name of the file
+    source : str
+        the source of the file, 'BMRA' or 'P114'
+    checksum : str
+        the checksum of the file
+
+    Returns
+    -------
+    ProcessedFile
+        the ledger entry
+    """
+    from BMRA.models import ProcessedFile
+
+    processed_file, created = ProcessedFile.objects.update_or_create(
+        filename=filename,
+        defaults={'source': source,
+                  'checksum': checksum,
+                  'status': 'started',
+                  'message_count': None,
+                  'insert_count': None,
+                  'duplicate_count': None,
+                  'started': timezone.now(),
+                  'finished': None,
+                  'duration': None,
+                  'error': ''})
+    processed_file.start_time = time.monotonic()
+    return processed_file
+
+
+def finish_entry(processed_file, insert_log=None, error=None):
+    """
+    Records the completion or failure of processing of a file in the ledger
+
+    Parameters
+    ----------
+    processed_file : ProcessedFile
+        the ledger entry returned by start_entry
+    insert_log : dict
+        the combined insert log for the file, with 'count' and optionally
+        'inserts' and 'duplicate_msg' entries
+    error : Exception
+        the error raised during processing, if processing failed
+    """
+    processed_file.finished = timezone.now()
+    processed_file.duration = time.monotonic() - processed_file.start_time
+    if error is not None:
+        processed_file.status = 'failed'
+        processed_file.error = '{} {}'.format(type(error).__name__, error.args)
+    else:
+        processed_file.status = 'completed'
+    if insert_log is not None:
+        processed_file.message_count = insert_log.get('count')
+        if 'inserts' in insert_log:
+            processed_file.insert_count = sum(insert_log['inserts'].values())
+        if 'duplicate_msg' in insert_log:
+            processed_file.duplicate_count = sum(insert_log['duplicate_msg'].values())
+    processed_file.save()
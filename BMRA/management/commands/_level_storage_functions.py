@@ -0,0 +1,144 @@
+"""
+Helper functions for converting the levels of existing FPN, MEL, MIL, QPN,
+BOAL and BOALF entries between level rows and packed storage (see
+BMRA.models.profiles)
+
+Entries are converted by date, those with settlement dates by settlement
+date and acceptances by acceptance time. Packing an entry sets its packed
+levels and deletes its level rows, unpacking does the reverse, so that the
+levels returned by get_levels are unchanged
+
+"""
+import datetime as dt
+from itertools import groupby
+
+# models with levels, giving the date field by which entries are selected
+LEVEL_STORAGE_MODELS = {
+    'FPN': 'sd',
+    'MEL': 'sd',
+    'MIL': 'sd',
+    'QPN': 'sd',
+    'BOAL': 'ta',
+    'BOALF': 'ta',
+}
+
+
+def get_date_filter(model_name, start_date, end_date, prefix=''):
+    """
+    Returns the queryset filter selecting the entries of a model within a
+    date range, as per LEVEL_STORAGE_MODELS
+
+    Parameters
+    ----------
+    model_name : str
+        the model name, e.g. 'FPN'
+    start_date : date
+        the first date
+    end_date : date
+        the last date
+    prefix : str
+        lookup prefix, e.g. 'fpn__' to filter level rows by their entry
+
+    Returns
+    -------
+    dict
+        the filter keyword arguments
+    """
+    date_field = LEVEL_STORAGE_MODELS[model_name]
+    if date_field == 'sd':
+        return {prefix + 'sd__gte': start_date, prefix + 'sd__lte': end_date}
+    midnight = dt.time(0, 0, tzinfo=dt.timezone.utc)
+    return {prefix + date_field + '__gte': dt.datetime.combine(start_date, midnight),
+            prefix + date_field + '__lt': dt.datetime.combine(end_date + dt.timedelta(days=1),
+                                                              midnight)}
+
+
+def get_level_model(model):
+    """
+    Returns the level model of a model with levels and the name of its
+    foreign key to the model
+    """
+    relation = getattr(model, model.level_relation).rel
+    return relation.related_model, relation.field.name
+
+
+def pack_entry_levels(model_name, start_date, end_date):
+    """
+    Packs the level rows of the entries of a model within a date range onto
+    the entries, deleting the level rows. Entries already packed are not
+    changed
+
+    Parameters
+    ----------
+    model_name : str
+        the model name, e.g. 'FPN'
+    start_date : date
+        the first date
+    end_date : date
+        the last date
+
+    Returns
+    -------
+    int
+        the number of entries packed
+    """
+    import BMRA.models as bmra_models
+    from BMRA.models.profiles import pack_levels
+
+    model = getattr(bmra_models, model_name)
+    level_model, parent_field = get_level_model(model)
+    levels = level_model.objects\
+        .filter(**get_date_filter(model_name, start_date, end_date, parent_field + '__'))\
+        .filter(**{parent_field + '__levels__isnull': True})\
+        .order_by(parent_field, 'ts', 'id')\
+        .values_list(parent_field, 'ts', model.level_value_field)
+    count = 0
+    # levels are read before any entry is updated, as updates change the
+    # entries selected
+    for parent_id, parent_levels in groupby(list(levels), key=lambda level: level[0]):
+        model.objects.filter(pk=parent_id).update(
+            levels=pack_levels((ts, value) for _, ts, value in parent_levels))
+        count += 1
+    level_model.objects\
+        .filter(**get_date_filter(model_name, start_date, end_date, parent_field + '__'))\
+        .filter(**{parent_field + '__levels__isnull': False})\
+        .delete()
+    return count
+
+
+def unpack_entry_levels(model_name, start_date, end_date, batch_size=10000):
+    """
+    Unpacks the packed levels of the entries of a model within a date range
+    to level rows, clearing the packed levels
+
+    Parameters
+    ----------
+    model_name : str
+        as per pack_entry_levels
+    start_date : date
+        as per pack_entry_levels
+    end_date : date
+        as per pack_entry_levels
+    batch_size : int
+        the number of level rows created per query
+
+    Returns
+    -------
+    int
+        the number of entries unpacked
+    """
+    import BMRA.models as bmra_models
+    from BMRA.models.profiles import unpack_levels
+
+    model = getattr(bmra_models, model_name)
+    level_model, parent_field = get_level_model(model)
+    entries = model.objects\
+        .filter(**get_date_filter(model_name, start_date, end_date))\
+        .filter(levels__isnull=False)
+    level_rows = [level_model(**{parent_field + '_id': parent_id,
+                                 'ts': ts,
+                                 model.level_value_field: value})
+                  for parent_id, levels in entries.values_list('pk', 'levels')
+                  for ts, value in unpack_levels(levels)]
+    level_model.objects.bulk_create(level_rows, batch_size=batch_size)
+    return entries.update(levels=None)
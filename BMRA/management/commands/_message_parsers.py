@@ -0,0 +1,104 @@
+"""
+Message parsers specialised by message type and subtype
+
+A parse function is compiled for each message type and subtype in
+ACCEPTED_MESSAGES at import time, with the casting function for each
+accepted field resolved in advance, so that parsing a message requires a
+single dictionary lookup per field. Output is identical to the generic
+parsing in message_to_dict and message_part_to_points
+
+"""
+from ._data_definitions import ACCEPTED_MESSAGES, FIELD_CASTING_FUNCS
+
+
+def compile_message_parser(message_type, message_subtype):
+    """
+    Builds a parse function for the key/value pairs of a message of a given
+    type and subtype
+
+    Parameters
+    ----------
+    message_type : str
+        the BMRA message type (e.g. 'BM')
+    message_subtype : str
+        the BMRA message sub-type (e.g. 'FPN')
+
+    Returns
+    -------
+    function
+        function taking the raw message string and a message dictionary
+        containing the header values, adding the key/value pairs and any
+        data points to the dictionary and returning it
+    """
+    casting_funcs = {key: FIELD_CASTING_FUNCS[key]
+                     for key in ACCEPTED_MESSAGES[message_type][message_subtype]}
+
+    def parse_points(raw_message, raw_message_part, no_points):
+        """as per message_part_to_points"""
+        data_dict = dict()
+        if no_points == 0:  # some cases where there is no data
+            return data_dict
+        data_points = raw_message_part.split(',')
+        if len(data_points) % no_points != 0:
+            print(raw_message)
+            raise ValueError("Unexpected number of key/value pairs for message_type %s \
+         and message_subtype %s with expected no_points %d and length %d: %s"
+                             % (message_type,
+                                message_subtype,
+                                no_points,
+                                len(data_points),
+                                raw_message_part))
+        data_length = len(data_points) // no_points
+        for data_set_count, start in enumerate(range(0, len(data_points), data_length), 1):
+            data_set = dict()
+            for data_point in data_points[start:start + data_length]:
+                key, value = data_point.split('=')
+                stripped_key = key.strip()
+                casting_func = casting_funcs.get(stripped_key)
+                if casting_func is None:
+                    print(raw_message)
+                    raise ValueError('message key %s not recognised for \
+                message type %s and message subtype %s %s' %
+                                     (key, message_type,
+                                      message_subtype,
+                                      raw_message_part))
+                data_set[stripped_key] = casting_func(value.strip())
+            data_dict[data_set_count] = data_set
+        return data_dict
+
+    def parse_message(raw_message, message_dict):
+        """as per the key/value parsing in message_to_dict"""
+        key_values = raw_message[raw_message.find('{') + 1:raw_message.rfind('}')]
+        for key_value in key_values.split(','):
+            separator = key_value.find('=')
+            key = key_value[:separator].strip()
+            if key == 'SW':  # edge case where commas can appear in field
+                message_dict[key] = key_values[key_values.rfind(key) + 3:].strip()
+                return message_dict
+            value = key_value[separator + 1:].strip()
+            if key == 'NP' or key == 'NR':  # process multiple datapoints
+                raw_message_part = raw_message[raw_message.rfind(key):-1]
+                raw_message_part = raw_message_part[raw_message_part.find(',') + 1:]
+                message_dict['data_points'] = parse_points(raw_message,
+                                                           raw_message_part,
+                                                           int(value))
+                break  # datapoints should be the final part of the message
+            casting_func = casting_funcs.get(key)
+            if casting_func is None:
+                print(raw_message)
+                raise ValueError('message key %s not recognised for \
+            message type %s and message subtype %s %s' %
+                                 (key, message_type,
+                                  message_subtype,
+                                  raw_message))
+            message_dict[key] = casting_func(value)
+        return message_dict
+
+    return parse_message
+
+
+# compiled parse functions by message type and subtype
+MESSAGE_PARSERS = {(message_type, message_subtype): compile_message_parser(message_type,
+                                                                           message_subtype)
+                   for message_type in ACCEPTED_MESSAGES
+                   for message_subtype in ACCEPTED_MESSAGES[message_type]}
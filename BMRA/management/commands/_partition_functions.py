@@ -0,0 +1,305 @@
+"""
+Helper functions for partitioning the largest BMRA tables by date, using
+PostgreSQL declarative range partitioning
+
+Each table is partitioned by month or year of its settlement date or, for
+tables without one, of its timestamp. A table is converted by renaming the
+existing table, creating a partitioned table of the same name and layout,
+moving the existing rows and recreating keys and indexes. The primary key
+of a partitioned table must include the partition column, which is added
+where required, and foreign keys referencing a partitioned table cannot be
+created, so are dropped
+
+Rows outside the partitions created are held in a default partition, from
+which they are moved when later partitions are added
+
+"""
+import datetime as dt
+import re
+
+# partitioned tables, giving the partition column of each
+PARTITIONED_TABLES = {
+    'bmra_fpn': {'column': 'sd'},
+    'bmra_fpnlevel': {'column': 'ts'},
+    'bmra_mel': {'column': 'sd'},
+    'bmra_mellevel': {'column': 'ts'},
+    'bmra_bod': {'column': 'sd'},
+    'bmra_boalf': {'column': 'ta'},
+    'bmra_boalflevel': {'column': 'ts'},
+    'bmra_freq': {'column': 'ts'},
+    'bmra_ispstack': {'column': 'sd'},
+}
+
+PARTITION_INTERVALS = ('month', 'year')
+
+
+def get_partition_bounds(start_date, end_date, interval):
+    """
+    Returns the bounds of the partitions covering a date range
+
+    Parameters
+    ----------
+    start_date : date
+        the first date to be covered
+    end_date : date
+        the last date to be covered
+    interval : str
+        'month' or 'year'
+
+    Returns
+    -------
+    list
+        (suffix, lower bound, upper bound) tuples, the lower bound inclusive
+        and the upper bound exclusive
+    """
+    if interval == 'year':
+        lower = dt.date(start_date.year, 1, 1)
+    else:
+        lower = dt.date(start_date.year, start_date.month, 1)
+    bounds = []
+    while lower <= end_date:
+        if interval == 'year':
+            upper = dt.date(lower.year + 1, 1, 1)
+            suffix = '{:%Y}'.format(lower)
+        else:
+            upper = dt.date(lower.year + lower.month // 12, lower.month % 12 + 1, 1)
+            suffix = '{:%Y_%m}'.format(lower)
+        bounds.append((suffix, lower, upper))
+        lower = upper
+    return bounds
+
+
+def format_bound(bound, data_type):
+    """
+    Formats a partition bound as an SQL literal, with timestamps in UTC
+    """
+    if data_type.startswith('timestamp'):
+        return "'{:%Y-%m-%d} 00:00:00+00'".format(bound)
+    return "'{:%Y-%m-%d}'".format(bound)
+
+
+def is_partitioned(cursor, table):
+    """
+    Checks whether a table is a partitioned table
+    """
+    cursor.execute("select relkind from pg_class where oid = %s::regclass", [table])
+    return cursor.fetchone()[0] == 'p'
+
+
+def get_column_type(cursor, table, column):
+    """
+    Returns the data type of a column, as per information_schema.columns
+    """
+    cursor.execute("select data_type from information_schema.columns "
+                   "where table_name = %s and column_name = %s", [table, column])
+    return cursor.fetchone()[0]
+
+
+def get_partitions(cursor, table):
+    """
+    Returns the partitions of a partitioned table
+
+    Parameters
+    ----------
+    cursor : cursor
+        a database cursor
+    table : str
+        the partitioned table
+
+    Returns
+    -------
+    list
+        (partition name, lower bound, upper bound) tuples, in date order,
+        excluding the default partition
+    """
+    cursor.execute("select child.relname, pg_get_expr(child.relpartbound, child.oid) "
+                   "from pg_inherits "
+                   "join pg_class child on child.oid = pg_inherits.inhrelid "
+                   "where pg_inherits.inhparent = %s::regclass", [table])
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = re.search(r"FROM \('(\d{4})-(\d{2})-(\d{2})[^)]*\) TO \('(\d{4})-(\d{2})-(\d{2})",
+                          bound)
+        if match is None:
+            continue
+        values = [int(x) for x in match.groups()]
+        partitions.append((name, dt.date(*values[:3]), dt.date(*values[3:])))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def add_partition(cursor, table, column, suffix, lower, upper, data_type):
+    """
+    Adds a partition to a partitioned table, moving any rows within its
+    bounds from the default partition
+
+    Parameters
+    ----------
+    cursor : cursor
+        a database cursor
+    table : str
+        the partitioned table
+    column : str
+        the partition column
+    suffix : str
+        the partition name suffix, as per get_partition_bounds
+    lower : date
+        the lower bound (inclusive)
+    upper : date
+        the upper bound (exclusive)
+    data_type : str
+        the data type of the partition column
+    """
+    partition = '{}_{}'.format(table, suffix)
+    condition = '{column} >= {lower} and {column} < {upper}'.format(
+        column=column, lower=format_bound(lower, data_type), upper=format_bound(upper, data_type))
+    cursor.execute('create table {} (like {} including defaults)'.format(partition, table))
+    cursor.execute('insert into {} select * from {}_default where {}'.format(
+        partition, table, condition))
+    cursor.execute('delete from {}_default where {}'.format(table, condition))
+    cursor.execute('alter table {} attach partition {} for values from ({}) to ({})'.format(
+        table, partition, format_bound(lower, data_type), format_bound(upper, data_type)))
+
+
+def get_constraints(cursor, table):
+    """
+    Returns the primary key, unique and foreign key constraints of a table
+
+    Returns
+    -------
+    list
+        (name, type, columns, definition, referenced table kind) tuples,
+        type being 'p', 'u' or 'f'
+    """
+    cursor.execute("select con.conname, con.contype, "
+                   "array(select attname from pg_attribute "
+                   "where attrelid = con.conrelid and attnum = any(con.conkey)), "
+                   "pg_get_constraintdef(con.oid), ref.relkind "
+                   "from pg_constraint con "
+                   "left join pg_class ref on ref.oid = con.confrelid "
+                   "where con.conrelid = %s::regclass and con.contype in ('p', 'u', 'f')",
+                   [table])
+    return cursor.fetchall()
+
+
+def partition_table(cursor, table, column, interval, until, stdout=None):
+    """
+    Converts a table to a partitioned table, moving the existing rows. The
+    table is renamed, a partitioned table created with the same columns,
+    the rows moved and the old table dropped, so should be run within a
+    transaction
+
+    Parameters
+    ----------
+    cursor : cursor
+        a database cursor
+    table : str
+        the table to be partitioned
+    column : str
+        the partition column
+    interval : str
+        'month' or 'year'
+    until : date
+        the last date for which partitions are created, from the earliest
+        date in the table
+    stdout : OutputWrapper
+        optional output for messages on constraints not recreated
+    """
+    old_table = '{}_unpartitioned'.format(table)
+    data_type = get_column_type(cursor, table, column)
+    constraints = get_constraints(cursor, table)
+    cursor.execute("select pg_get_indexdef(ind.indexrelid), ind.indisunique, "
+                   "array(select attname from pg_attribute "
+                   "where attrelid = ind.indrelid and attnum = any(ind.indkey)) "
+                   "from pg_index ind where ind.indrelid = %s::regclass "
+                   "and not exists (select 1 from pg_constraint "
+                   "where pg_constraint.conindid = ind.indexrelid)", [table])
+    indexes = cursor.fetchall()
+    cursor.execute("select con.conname, con.conrelid::regclass::text from pg_constraint con "
+                   "where con.confrelid = %s::regclass and con.contype = 'f'", [table])
+    referencing = cursor.fetchall()
+    cursor.execute("select count(*) from information_schema.columns "
+                   "where table_name = %s and column_name = 'id'", [table])
+    has_id = cursor.fetchone()[0] > 0
+    cursor.execute('select min({}) from {}'.format(column, table))
+    first = cursor.fetchone()[0] or dt.date.today()
+    if isinstance(first, dt.datetime):
+        first = first.date()
+
+    cursor.execute('alter table {} rename to {}'.format(table, old_table))
+    cursor.execute('create table {} (like {}) partition by range ({})'.format(
+        table, old_table, column))
+    cursor.execute('create table {0}_default partition of {0} default'.format(table))
+    for suffix, lower, upper in get_partition_bounds(first, until, interval):
+        cursor.execute('create table {}_{} partition of {} for values from ({}) to ({})'.format(
+            table, suffix, table, format_bound(lower, data_type), format_bound(upper, data_type)))
+    cursor.execute('insert into {} select * from {}'.format(table, old_table))
+    cursor.execute('drop table {} cascade'.format(old_table))
+
+    for name, contype, columns, definition, ref_kind in constraints:
+        if contype == 'p':
+            if column not in columns:
+                columns = list(columns) + [column]
+            cursor.execute('alter table {} add constraint {} primary key ({})'.format(
+                table, name, ', '.join(columns)))
+        elif contype == 'u' and column in columns:
+            cursor.execute('alter table {} add constraint {} {}'.format(table, name, definition))
+        elif contype == 'f' and ref_kind != 'p':
+            cursor.execute('alter table {} add constraint {} {}'.format(table, name, definition))
+        elif stdout is not None:
+            stdout.write('{}: constraint {} not recreated'.format(table, name))
+    for indexdef, unique, columns in indexes:
+        if unique and column not in columns:
+            if stdout is not None:
+                stdout.write('{}: unique index not recreated: {}'.format(table, indexdef))
+            continue
+        cursor.execute(indexdef)
+    if stdout is not None:
+        for name, referencing_table in referencing:
+            stdout.write('{}: foreign key {} dropped'.format(referencing_table, name))
+    if has_id:
+        # the sequence of the old table is dropped with it
+        cursor.execute('create sequence {0}_id_seq owned by {0}.id'.format(table))
+        cursor.execute("alter table {0} alter column id set default nextval('{0}_id_seq')".format(
+            table))
+        cursor.execute("select setval('{0}_id_seq', coalesce(max(id), 0) + 1, false) "
+                       "from {0}".format(table))
+    cursor.execute('analyze {}'.format(table))
+
+
+def extend_partitions(cursor, table, column, interval, until):
+    """
+    Adds partitions to a partitioned table following its latest partition,
+    up to a given date
+
+    Returns
+    -------
+    list
+        the suffixes of the partitions added
+    """
+    partitions = get_partitions(cursor, table)
+    if len(partitions) == 0 or partitions[-1][2] > until:
+        return []
+    data_type = get_column_type(cursor, table, column)
+    bounds = get_partition_bounds(partitions[-1][2], until, interval)
+    for suffix, lower, upper in bounds:
+        add_partition(cursor, table, column, suffix, lower, upper, data_type)
+    return [suffix for suffix, _, _ in bounds]
+
+
+def detach_partitions(cursor, table, before):
+    """
+    Detaches the partitions of a table with an upper bound on or before a
+    given date. Detached partitions remain as standalone tables, which may
+    be archived or dropped
+
+    Returns
+    -------
+    list
+        the names of the partitions detached
+    """
+    detached = []
+    for name, _, upper in get_partitions(cursor, table):
+        if upper <= before:
+            cursor.execute('alter table {} detach partition {}'.format(table, name))
+            detached.append(name)
+    return detached
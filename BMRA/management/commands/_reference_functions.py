@@ -0,0 +1,151 @@
+"""
+Helper functions for looking up the core entities (BMUs, fuel types, zones
+and distribution system operators) referenced by BMRA messages
+
+The ids of existing entries are loaded into memory in a single query per
+table, so that messages referencing known entries require no queries to
+resolve their references. Missing entries are created in bulk ahead of the
+messages which reference them
+
+Entries are created with INSERT ... ON CONFLICT DO NOTHING (see
+_conflict_functions), so that entries created since the ids were loaded,
+e.g. by another process ingesting a different day, are skipped rather than
+failing the insert, and are not reported as created
+
+"""
+from ._data_definitions import PROCESSED_MESSAGES
+from ._conflict_functions import insert_ignore_conflicts
+
+# message dictionary keys referencing core entities, by model name. Keys
+# are checked in the message header and in each data point
+REFERENCE_MESSAGE_KEYS = {
+    'BMU': 'bmu_id',
+    'ZI': 'ZI',
+    'FT': 'FT',
+    'LDSO': 'DS',
+}
+
+# message types for which new BMUs are logged (as per insert_data)
+NEW_BMU_MESSAGE_TYPES = ('BM', 'DYNAMIC')
+
+
+class ReferenceCache:
+    """
+    In-memory set of the ids of existing core entities, loaded from the
+    database for each table when first used
+
+    A cache should only be used within the transaction in which any entries
+    it creates are inserted, as entries rolled back are not removed from
+    the cache
+    """
+
+    def __init__(self):
+        self.known_ids = {}
+
+    def get_known_ids(self, model):
+        """
+        Returns the set of known ids for a model, loading the ids of all
+        existing entries in a single query if not previously loaded
+        """
+        known_ids = self.known_ids.get(model.__name__)
+        if known_ids is None:
+            known_ids = set(model.objects.values_list('id', flat=True))
+            self.known_ids[model.__name__] = known_ids
+        return known_ids
+
+    def get(self, model, ref_id):
+        """
+        Returns the entry with a given id, creating it if it does not
+        already exist
+
+        Parameters
+        ----------
+        model : Model
+            the core entity model, e.g. BMU
+        ref_id : str
+            the id of the entry
+
+        Returns
+        -------
+        tuple
+            the entry and whether it was created, as per get_or_create
+        """
+        known_ids = self.get_known_ids(model)
+        entry = model(id=ref_id)
+        if ref_id in known_ids:
+            return entry, False
+        created = len(insert_ignore_conflicts([entry], key=('id',))) > 0
+        known_ids.add(ref_id)
+        return entry, created
+
+    def create(self, model, ref_ids):
+        """
+        Creates any entries with the given ids which do not already exist,
+        in a single query
+
+        Parameters
+        ----------
+        model : Model
+            the core entity model, e.g. BMU
+        ref_ids : iterable
+            the ids of the entries
+
+        Returns
+        -------
+        list
+            the ids of the entries created, in the order given, excluding
+            any created since the known ids were loaded
+        """
+        known_ids = self.get_known_ids(model)
+        new_ids = [ref_id for ref_id in dict.fromkeys(ref_ids) if ref_id not in known_ids]
+        if len(new_ids) == 0:
+            return []
+        created = insert_ignore_conflicts([model(id=new_id) for new_id in new_ids], key=('id',))
+        known_ids.update(new_ids)
+        return [entry.id for entry in created]
+
+    def create_references(self, message_dicts):
+        """
+        Creates any entries referenced by the given messages which do not
+        already exist, in a single query per table. Only messages of
+        processed subtypes are checked
+
+        Parameters
+        ----------
+        message_dicts : list
+            message dictionaries, as returned by message_to_dict
+
+        Returns
+        -------
+        list
+            the ids of new BMUs referenced by BM or DYNAMIC messages, in
+            the order first referenced, as per the new_bmus insert log
+        """
+        import BMRA.models as bmra_models
+
+        ref_ids = {model_name: [] for model_name in REFERENCE_MESSAGE_KEYS}
+        bmu_ids = []
+        for message_dict in message_dicts:
+            if message_dict is None or message_dict['message_subtype'] not in \
+                    PROCESSED_MESSAGES.get(message_dict['message_type'], []):
+                continue
+            sources = [message_dict] + list(message_dict.get('data_points', {}).values())
+            for model_name, key in REFERENCE_MESSAGE_KEYS.items():
+                ref_ids[model_name].extend(source[key] for source in sources if key in source)
+            if 'bmu_id' in message_dict:
+                bmu_ids.append((message_dict['bmu_id'],
+                                message_dict['message_type'] in NEW_BMU_MESSAGE_TYPES))
+
+        new_ids = {model_name: self.create(getattr(bmra_models, model_name), ids)
+                   for model_name, ids in ref_ids.items() if len(ids) > 0}
+
+        # as per insert_data, new BMUs are only logged if first referenced
+        # by a BM or DYNAMIC message
+        new_bmus = []
+        unlogged_bmus = set(new_ids.get('BMU', []))
+        for bmu_id, logged in bmu_ids:
+            if bmu_id in unlogged_bmus:
+                unlogged_bmus.remove(bmu_id)
+                if logged:
+                    new_bmus.append(bmu_id)
+        return new_bmus
@@ -0,0 +1,685 @@
+"""
+Helper functions for generating annual data summaries
+
+Each metric is retrieved for all BMUs in a subset with a single query,
+grouped by BMU, settlement date and settlement period, and pivoted to a
+DataFrame with (sd, sp) rows and a column per BMU
+
+Summaries may be updated incrementally, recording a watermark for each
+metric in the output directory. Later runs only recompute days after the
+watermark, or for which data has since been ingested, merging the result
+into the existing output files
+
+"""
+import datetime as dt
+import json
+import os
+import re
+import pandas as pd
+from django.utils.dateparse import parse_datetime
+from ._integration_functions import integrate_levels, unpack_levels_frame, combine_levels
+
+# output formats for summary files, with file extensions
+SUMMARY_FORMATS = {
+    'csv': '.csv',
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+
+
+def sql_list(values):
+    """
+    Formats a list of strings as a quoted, comma-separated SQL list
+
+    Parameters
+    ----------
+    values : iterable
+        the strings to be formatted
+
+    Returns
+    -------
+    str
+        the values in quotes, with any quotes within values escaped
+    """
+    return ', '.join("'{}'".format(str(value).replace("'", "''")) for value in values)
+
+
+def pivot_summary(df, value_column, blank_df):
+    """
+    Pivots a long DataFrame of values by BMU, settlement date and settlement
+    period to a wide DataFrame with the index and columns of blank_df. Where
+    more than one value is found for a BMU and settlement period the first
+    is taken
+
+    Parameters
+    ----------
+    df : DataFrame
+        long DataFrame with bmu_id, sd, sp and value columns
+    value_column : str
+        the name of the value column
+    blank_df : DataFrame
+        empty DataFrame indexed by (sd, sp) with a column per BMU
+
+    Returns
+    -------
+    DataFrame
+        DataFrame of values indexed by (sd, sp) with a column per BMU
+    """
+    if len(df) == 0:
+        return blank_df.copy()
+    df = df.assign(sd=pd.to_datetime(df['sd']))
+    wide_df = df.groupby(['sd', 'sp', 'bmu_id'])[value_column].first().unstack('bmu_id')
+    return wide_df.reindex(index=blank_df.index, columns=blank_df.columns)
+
+
+def get_bmu_condition(column, bmu_ids):
+    """
+    Returns an SQL condition restricting a query to a list of BMUs, or an
+    empty string if bmu_ids is None (i.e. all BMUs)
+    """
+    if bmu_ids is None:
+        return ''
+    return 'and {} in ({})'.format(column, sql_list(bmu_ids))
+
+
+def query_acceptance_volumes(conn, bmu_ids, start_date, end_date, volume_column):
+    """
+    Returns the total bid (bv) or offer (ov) acceptance volumes by BMU and
+    settlement period
+
+    Parameters
+    ----------
+    conn : connection
+        the database connection, as used by pandas.read_sql
+    bmu_ids : list
+        the BMU ids, or None for all BMUs
+    start_date : date
+        the first settlement date
+    end_date : date
+        the last settlement date
+    volume_column : str
+        'bv' for bid volumes or 'ov' for offer volumes
+
+    Returns
+    -------
+    DataFrame
+        long DataFrame with bmu_id, sd, sp and value columns
+    """
+    query = 'SELECT bmu_id, sd, sp, sum({}) as value \
+    FROM bmra_boav \
+    where sd>=\'{:%Y-%m-%d}\' \
+    and sd<=\'{:%Y-%m-%d}\' \
+    {} \
+    group by bmu_id, sd, sp'.format(volume_column, start_date, end_date,
+                                    get_bmu_condition('bmu_id', bmu_ids))
+    return pd.read_sql(query, conn)
+
+
+def query_cashflows(conn, bmu_ids, start_date, end_date, cashflow_column):
+    """
+    Returns the total offer (oc) or bid (bc) cashflows by BMU and settlement
+    period
+
+    Parameters
+    ----------
+    conn : connection
+        as per query_acceptance_volumes
+    bmu_ids : list
+        as per query_acceptance_volumes
+    start_date : date
+        as per query_acceptance_volumes
+    end_date : date
+        as per query_acceptance_volumes
+    cashflow_column : str
+        'oc' for offer cashflows or 'bc' for bid cashflows
+
+    Returns
+    -------
+    DataFrame
+        as per query_acceptance_volumes
+    """
+    query = 'SELECT bmu_id, sd, sp, sum({}) as value \
+    FROM bmra_ebocf \
+    where sd>=\'{:%Y-%m-%d}\' \
+    and sd<=\'{:%Y-%m-%d}\' \
+    {} \
+    group by bmu_id, sd, sp'.format(cashflow_column, start_date, end_date,
+                                    get_bmu_condition('bmu_id', bmu_ids))
+    return pd.read_sql(query, conn)
+
+
+def query_packed_levels(conn, table, columns, bmu_ids, start_date, end_date):
+    """
+    Returns the entries of a table with packed levels (see
+    BMRA.models.profiles) within a date range, with their levels unpacked
+    to one row per level
+
+    Parameters
+    ----------
+    conn : connection
+        as per query_acceptance_volumes
+    table : str
+        the table, e.g. 'bmra_fpn'
+    columns : list
+        the columns of the table to be returned, e.g. ['bmu_id', 'sd', 'sp']
+    bmu_ids : list
+        as per query_acceptance_volumes
+    start_date : date
+        as per query_acceptance_volumes
+    end_date : date
+        as per query_acceptance_volumes
+
+    Returns
+    -------
+    DataFrame
+        as per unpack_levels_frame, with the levels in a value column
+    """
+    query = 'SELECT {columns}, levels \
+    FROM {table} \
+    where levels is not null \
+    and sd>=\'{start_date:%Y-%m-%d}\' \
+    and sd<=\'{end_date:%Y-%m-%d}\' \
+    {bmu_condition}'.format(
+        columns=', '.join(columns),
+        table=table,
+        start_date=start_date,
+        end_date=end_date,
+        bmu_condition=get_bmu_condition('bmu_id', bmu_ids))
+    return unpack_levels_frame(pd.read_sql(query, conn), 'value')
+
+
+def query_fpn_volumes(conn, bmu_ids, start_date, end_date):
+    """
+    Returns the energy (MWh) of the FPN of each BMU by settlement period
+
+    Parameters
+    ----------
+    conn : connection
+        as per query_acceptance_volumes
+    bmu_ids : list
+        as per query_acceptance_volumes
+    start_date : date
+        as per query_acceptance_volumes
+    end_date : date
+        as per query_acceptance_volumes
+
+    Returns
+    -------
+    DataFrame
+        as per query_acceptance_volumes
+    """
+    query = 'SELECT bmu_id, sd, sp, bmra_fpnlevel.ts, vp \
+    FROM bmra_fpnlevel \
+    left join bmra_fpn \
+    on bmra_fpnlevel.fpn_id = bmra_fpn.id \
+    where sd>=\'{start_date:%Y-%m-%d}\' \
+    and sd<=\'{end_date:%Y-%m-%d}\' \
+    and bmra_fpnlevel.ts>=\'{ts_start:%Y-%m-%d}\' \
+    and bmra_fpnlevel.ts<\'{ts_end:%Y-%m-%d}\' \
+    {bmu_condition} \
+    order by bmu_id, sd, sp, bmra_fpnlevel.ts, bmra_fpnlevel.id'.format(
+        start_date=start_date,
+        end_date=end_date,
+        ts_start=start_date - dt.timedelta(days=1),
+        ts_end=end_date + dt.timedelta(days=2),
+        bmu_condition=get_bmu_condition('bmra_fpn.bmu_id', bmu_ids))
+    # levels are within their settlement period, so the bounds on ts only
+    # allow partitions of the level table to be pruned
+    df = pd.read_sql(query, conn, parse_dates=['ts'])
+    packed_df = query_packed_levels(conn, 'bmra_fpn', ['bmu_id', 'sd', 'sp'],
+                                    bmu_ids, start_date, end_date)
+    df = combine_levels(df, packed_df.rename(columns={'value': 'vp'}),
+                        ['bmu_id', 'sd', 'sp', 'ts'])
+    return integrate_levels(df, 'vp').rename(columns={'mwh': 'value'})
+
+
+def query_mel_volumes(conn, bmu_ids, start_date, end_date):
+    """
+    Returns the energy (MWh) of the most recently received MEL of each BMU
+    by settlement period
+
+    Parameters
+    ----------
+    conn : connection
+        as per query_acceptance_volumes
+    bmu_ids : list
+        as per query_acceptance_volumes
+    start_date : date
+        as per query_acceptance_volumes
+    end_date : date
+        as per query_acceptance_volumes
+
+    Returns
+    -------
+    DataFrame
+        as per query_acceptance_volumes
+    """
+    query = 'SELECT bmu_id, bmra_mel.ts as tsr, sd, sp, bmra_mellevel.ts, ve \
+    FROM bmra_mellevel \
+    left join bmra_mel \
+    on bmra_mellevel.mel_id = bmra_mel.id \
+    where sd>=\'{start_date:%Y-%m-%d}\' \
+    and sd<=\'{end_date:%Y-%m-%d}\' \
+    and bmra_mellevel.ts>=\'{ts_start:%Y-%m-%d}\' \
+    and bmra_mellevel.ts<\'{ts_end:%Y-%m-%d}\' \
+    {bmu_condition} \
+    order by bmu_id, sd, sp, bmra_mellevel.ts, bmra_mellevel.id'.format(
+        start_date=start_date,
+        end_date=end_date,
+        ts_start=start_date - dt.timedelta(days=1),
+        ts_end=end_date + dt.timedelta(days=2),
+        bmu_condition=get_bmu_condition('bmra_mel.bmu_id', bmu_ids))
+    df = pd.read_sql(query, conn, parse_dates=['tsr', 'ts'])
+    packed_df = query_packed_levels(conn, 'bmra_mel', ['bmu_id', 'ts as tsr', 'sd', 'sp'],
+                                    bmu_ids, start_date, end_date)
+    df = combine_levels(df, packed_df.rename(columns={'value': 've'}),
+                        ['bmu_id', 'sd', 'sp', 'ts'], ts_columns=('tsr', 'ts'))
+    # only the levels of the most recent MEL for each settlement period are used
+    latest_tsr = df.groupby(['bmu_id', 'sd', 'sp'])['tsr'].transform('max')
+    df = df[df['tsr'] == latest_tsr]
+    return integrate_levels(df, 've').rename(columns={'mwh': 'value'})
+
+
+def query_metered_volumes(conn, bmu_ids, start_date, end_date):
+    """
+    Returns the P114 metered volumes of each BMU by settlement period, taken
+    from the latest settlement run available, i.e. the run of the latest
+    settlement run type with the highest run number
+
+    Parameters
+    ----------
+    conn : connection
+        as per query_acceptance_volumes
+    bmu_ids : list
+        as per query_acceptance_volumes
+    start_date : date
+        as per query_acceptance_volumes
+    end_date : date
+        as per query_acceptance_volumes
+
+    Returns
+    -------
+    DataFrame
+        as per query_acceptance_volumes
+    """
+    # runs are ranked by settlement run type, then by run number and
+    # aggregation date among runs of the same type (e.g. RF runs 1 and 2)
+    query = 'SELECT bmu_id, sd, sp, value \
+    FROM \
+    (SELECT p114_abv.bmu_id as bmu_id, p114_abv.sd as sd, p114_abp.sp as sp, \
+    p114_abp.vol as value, \
+    row_number() over (partition by p114_abv.bmu_id, p114_abv.sd, p114_abp.sp \
+    order by p114_sr_type."order" desc, p114_abv.run_no desc, p114_abv.agg_date desc, \
+    p114_abv.id desc, p114_abp.id desc) as run_rank \
+    FROM p114_abv \
+    inner join p114_abp \
+    on p114_abv.id = p114_abp.abv_id \
+    inner join p114_sr_type \
+    on p114_abv.sr_type_id = p114_sr_type.id \
+    where p114_sr_type."order" is not null \
+    and p114_abv.sd>=\'{start_date:%Y-%m-%d}\' \
+    and p114_abv.sd<=\'{end_date:%Y-%m-%d}\' \
+    {bmu_condition}) as ranked_runs \
+    where run_rank = 1 \
+    order by bmu_id, sd, sp'.format(bmu_condition=get_bmu_condition('p114_abv.bmu_id', bmu_ids),
+                                    start_date=start_date,
+                                    end_date=end_date)
+    return pd.read_sql(query, conn)
+
+
+def get_acceptance_volumes(conn, bmu_ids, start_date, end_date, blank_df, volume_column):
+    """
+    Returns the acceptance volumes of query_acceptance_volumes, pivoted as
+    per pivot_summary
+    """
+    return pivot_summary(query_acceptance_volumes(conn, bmu_ids, start_date, end_date,
+                                                  volume_column),
+                         'value', blank_df)
+
+
+def get_cashflows(conn, bmu_ids, start_date, end_date, blank_df, cashflow_column):
+    """
+    Returns the cashflows of query_cashflows, pivoted as per pivot_summary
+    """
+    return pivot_summary(query_cashflows(conn, bmu_ids, start_date, end_date, cashflow_column),
+                         'value', blank_df)
+
+
+def get_fpn_volumes(conn, bmu_ids, start_date, end_date, blank_df):
+    """
+    Returns the FPN energy of query_fpn_volumes, pivoted as per pivot_summary
+    """
+    return pivot_summary(query_fpn_volumes(conn, bmu_ids, start_date, end_date),
+                         'value', blank_df)
+
+
+def get_mel_volumes(conn, bmu_ids, start_date, end_date, blank_df):
+    """
+    Returns the MEL energy of query_mel_volumes, pivoted as per pivot_summary
+    """
+    return pivot_summary(query_mel_volumes(conn, bmu_ids, start_date, end_date),
+                         'value', blank_df)
+
+
+def get_metered_volumes(conn, bmu_ids, start_date, end_date, blank_df):
+    """
+    Returns the metered volumes of query_metered_volumes, pivoted as per
+    pivot_summary
+    """
+    return pivot_summary(query_metered_volumes(conn, bmu_ids, start_date, end_date),
+                         'value', blank_df)
+
+
+def write_summary(df, save_path, name, output_format='csv'):
+    """
+    Writes a summary DataFrame to file. Parquet and feather files (which
+    require pyarrow) are compressed, with typed columns, and require string
+    column names, so DataFrames with periods as columns (e.g. summaries by
+    BMU type) are written transposed, with a column per BMU type. Feather
+    files do not store an index, so index levels are written as columns
+
+    Parameters
+    ----------
+    df : DataFrame
+        the summary DataFrame
+    save_path : str
+        the directory in which the file is saved
+    name : str
+        the file name, without extension
+    output_format : str
+        one of SUMMARY_FORMATS
+
+    Returns
+    -------
+    str
+        the path of the file written
+    """
+    filename = os.path.join(save_path, name + SUMMARY_FORMATS[output_format])
+    if output_format == 'csv':
+        df.to_csv(filename)
+        return filename
+    if not all(isinstance(column, str) for column in df.columns):
+        df = df.T
+    df = df.copy()
+    df.columns = [str(column) for column in df.columns]
+    if output_format == 'parquet':
+        df.to_parquet(filename, compression='snappy')
+    else:
+        df.reset_index().to_feather(filename, compression='zstd')
+    return filename
+
+
+# name of the file in which summary watermarks are recorded
+WATERMARK_FILENAME = 'summary_watermark.json'
+
+
+def read_summary(save_path, name, output_format='csv'):
+    """
+    Reads a summary DataFrame with (sd, sp) rows written by write_summary
+
+    Parameters
+    ----------
+    save_path : str
+        the directory in which the file is saved
+    name : str
+        the file name, without extension
+    output_format : str
+        one of SUMMARY_FORMATS
+
+    Returns
+    -------
+    DataFrame
+        the summary DataFrame indexed by (sd, sp), or None if no file exists
+    """
+    filename = os.path.join(save_path, name + SUMMARY_FORMATS[output_format])
+    if not os.path.exists(filename):
+        return None
+    if output_format == 'csv':
+        return pd.read_csv(filename, index_col=[0, 1], parse_dates=[0], float_precision='round_trip')
+    if output_format == 'parquet':
+        return pd.read_parquet(filename)
+    return pd.read_feather(filename).set_index(['sd', 'sp'])
+
+
+def load_watermark(save_path):
+    """
+    Loads the summary watermarks recorded in an output directory
+
+    Parameters
+    ----------
+    save_path : str
+        the output directory
+
+    Returns
+    -------
+    dict
+        watermark entries by metric name, each with the last settlement
+        date summarised ('last_sd'), the time at which the run summarising
+        it started ('updated') and the output format ('format'). Metered
+        entries also record the latest P114 aggregation date
+        ('last_agg_date'). Empty if no watermark has been recorded
+    """
+    filename = os.path.join(save_path, WATERMARK_FILENAME)
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as file:
+        return json.load(file)
+
+
+def save_watermark(save_path, watermark):
+    """
+    Records summary watermarks in an output directory, as per load_watermark
+    """
+    filename = os.path.join(save_path, WATERMARK_FILENAME)
+    with open(filename + '.tmp', 'w') as file:
+        json.dump(watermark, file, indent=2, sort_keys=True)
+    os.replace(filename + '.tmp', filename)
+
+
+def get_date_ranges(dates):
+    """
+    Groups dates into ranges of consecutive dates
+
+    Parameters
+    ----------
+    dates : iterable
+        the dates
+
+    Returns
+    -------
+    list
+        (first date, last date) tuples, in date order
+    """
+    date_ranges = []
+    for date in sorted(set(dates)):
+        if len(date_ranges) > 0 and date - date_ranges[-1][1] == dt.timedelta(days=1):
+            date_ranges[-1] = (date_ranges[-1][0], date)
+        else:
+            date_ranges.append((date, date))
+    return date_ranges
+
+
+def get_bmra_file_dates(file_date):
+    """
+    Returns the settlement dates which may be affected by a daily BMRA file,
+    which includes messages for the previous and following settlement dates
+
+    Parameters
+    ----------
+    file_date : date
+        the date of the BMRA file
+
+    Returns
+    -------
+    list
+        the settlement dates
+    """
+    return [file_date + dt.timedelta(days=offset) for offset in (-1, 0, 1)]
+
+
+def get_bmra_updated_dates(updated):
+    """
+    Returns the settlement dates which may be affected by BMRA files
+    ingested since a given time, according to the ingestion ledger, as per
+    get_bmra_file_dates
+
+    Parameters
+    ----------
+    updated : datetime
+        the time since which files have been ingested
+
+    Returns
+    -------
+    set
+        the settlement dates
+    """
+    from BMRA.models import ProcessedFile
+
+    dates = set()
+    for filename in ProcessedFile.objects.filter(source='BMRA',
+                                                 status='completed',
+                                                 finished__gte=updated)\
+            .values_list('filename', flat=True):
+        match = re.search(r'(\d{4})-(\d{2})-(\d{2})', filename)
+        if match is None:
+            continue
+        dates.update(get_bmra_file_dates(dt.date(*[int(x) for x in match.groups()])))
+    return dates
+
+
+def get_p114_updated_dates(conn, updated, last_agg_date):
+    """
+    Returns the settlement dates of P114 data aggregated after a given
+    date, or aggregated on the date of any P114 file ingested since a
+    given time, according to the ingestion ledger
+
+    Parameters
+    ----------
+    conn : connection
+        as per query_acceptance_volumes
+    updated : datetime
+        the time since which files have been ingested
+    last_agg_date : date
+        the latest aggregation date previously summarised
+
+    Returns
+    -------
+    set
+        the settlement dates
+    """
+    from BMRA.models import ProcessedFile
+
+    agg_dates = set()
+    for filename in ProcessedFile.objects.filter(source='P114',
+                                                 status='completed',
+                                                 finished__gte=updated)\
+            .values_list('filename', flat=True):
+        match = re.search(r'(\d{4})(\d{2})(\d{2})', filename)
+        if match is not None:
+            agg_dates.add(dt.date(*[int(x) for x in match.groups()]))
+    query = 'select distinct sd from p114_abv where agg_date>\'{:%Y-%m-%d}\''.format(last_agg_date)
+    if len(agg_dates) > 0:
+        query += ' or agg_date in ({})'.format(sql_list(['{:%Y-%m-%d}'.format(agg_date)
+                                                         for agg_date in agg_dates]))
+    return set(pd.to_datetime(pd.read_sql(query, conn)['sd']).dt.date)
+
+
+def get_last_agg_date(conn):
+    """
+    Returns the latest P114 aggregation date, or None if no P114 data
+    """
+    last_agg_date = pd.read_sql('select max(agg_date) as agg_date from p114_abv',
+                                conn)['agg_date'][0]
+    if last_agg_date is None or pd.isnull(last_agg_date):
+        return None
+    return pd.Timestamp(last_agg_date).date()
+
+
+# summary metrics, giving the source of the data, the function retrieving
+# the metric (as per get_acceptance_volumes) and any additional arguments
+SUMMARY_METRICS = {
+    'BAVs': {'source': 'BMRA', 'function': get_acceptance_volumes, 'args': ('bv',)},
+    'OAVs': {'source': 'BMRA', 'function': get_acceptance_volumes, 'args': ('ov',)},
+    'FPNs': {'source': 'BMRA', 'function': get_fpn_volumes, 'args': ()},
+    'MELs': {'source': 'BMRA', 'function': get_mel_volumes, 'args': ()},
+    'offer_cashflows': {'source': 'BMRA', 'function': get_cashflows, 'args': ('oc',)},
+    'bid_cashflows': {'source': 'BMRA', 'function': get_cashflows, 'args': ('bc',)},
+    'metered': {'source': 'P114', 'function': get_metered_volumes, 'args': ()},
+}
+
+
+def get_summary_dates(conn, name, start_date, end_date, watermark_entry):
+    """
+    Returns the settlement dates of a metric to be recomputed, being the
+    dates after the last settlement date summarised and any dates for which
+    data has since been ingested
+
+    Parameters
+    ----------
+    conn : connection
+        as per query_acceptance_volumes
+    name : str
+        the metric name, one of SUMMARY_METRICS
+    start_date : date
+        the first settlement date of the summary
+    end_date : date
+        the last settlement date of the summary
+    watermark_entry : dict
+        the watermark entry of the metric, as per load_watermark
+
+    Returns
+    -------
+    list
+        the settlement dates, in date order
+    """
+    last_sd = dt.datetime.strptime(watermark_entry['last_sd'], '%Y-%m-%d').date()
+    updated = parse_datetime(watermark_entry['updated'])
+    dates = {start_date + dt.timedelta(days=x) for x in range((end_date - start_date).days + 1)
+             if start_date + dt.timedelta(days=x) > last_sd}
+    if SUMMARY_METRICS[name]['source'] == 'BMRA':
+        dates.update(get_bmra_updated_dates(updated))
+    elif watermark_entry.get('last_agg_date') is None:
+        dates.update(get_p114_updated_dates(conn, updated, dt.date(1900, 1, 1)))
+    else:
+        dates.update(get_p114_updated_dates(
+            conn, updated, dt.datetime.strptime(watermark_entry['last_agg_date'], '%Y-%m-%d').date()))
+    return sorted(date for date in dates if start_date <= date <= end_date)
+
+
+def update_summary(conn, name, bmu_ids, blank_df, dates, existing_df=None):
+    """
+    Computes a metric for the given settlement dates, merging the result
+    into an existing summary. Each range of consecutive dates is retrieved
+    in a single query
+
+    Parameters
+    ----------
+    conn : connection
+        as per query_acceptance_volumes
+    name : str
+        the metric name, one of SUMMARY_METRICS
+    bmu_ids : list
+        the BMU ids
+    blank_df : DataFrame
+        as per pivot_summary, covering the whole summary period
+    dates : list
+        the settlement dates to be computed
+    existing_df : DataFrame
+        the existing summary, as per read_summary, or None if all dates are
+        to be computed
+
+    Returns
+    -------
+    DataFrame
+        the updated summary, with the index and columns of blank_df
+    """
+    definition = SUMMARY_METRICS[name]
+    if existing_df is None:
+        summary_df = blank_df.copy()
+    else:
+        summary_df = existing_df.reindex(index=blank_df.index, columns=blank_df.columns)
+    for range_start, range_end in get_date_ranges(dates):
+        range_df = blank_df.loc[pd.Timestamp(range_start):pd.Timestamp(range_end)]
+        summary_df.loc[range_df.index] = definition['function'](
+            conn, bmu_ids, range_start, range_end, range_df, *definition['args'])
+    return summary_df
@@ -9,6 +9,8 @@ from django.core.mail import send_mail
 from ._data_definitions import PROCESSED_MESSAGES, ACCEPTED_MESSAGES, IGNORED_MESSAGES, FIELD_CASTING_FUNCS
 from ._corrupt_message_list import CORRUPT_MESSAGES
 from ._ignored_message_list import IGNORED_SYSMSG, IGNORED_SYSWARN
+from ._message_parsers import MESSAGE_PARSERS
+from ._conflict_functions import insert_ignore_conflicts
 from GBEnergyDataManager.settings import SYS_WARN_EMAIL_RECIPIENTS, EMAIL_HOST_USER
 
 
@@ -81,7 +83,7 @@ def message_part_to_points(raw_message,
     return data_dict
 
 
-def message_to_dict(raw_message):
+def message_to_dict(raw_message, compiled=True):
     """
     Converts a raw message string to a dictionary with
     key/value pairs and metadata
@@ -90,6 +92,10 @@ def message_to_dict(raw_message):
     ----------
     raw_message : string
         the BM data string
+    compiled : bool
+        if True, key/value pairs are parsed using the parser compiled for
+        the message type and subtype (see _message_parsers), otherwise
+        using the generic parsing below, which gives identical output
 
     Returns
     -------
@@ -108,20 +114,21 @@ def message_to_dict(raw_message):
     """
     message_dict = dict()
 
-    message_parts = raw_message.split(',')
-    if message_parts[0].strip() in CORRUPT_MESSAGES:
+    message_header = raw_message.split(',', 1)[0]
+    if message_header.strip() in CORRUPT_MESSAGES:
         return None
-    received_time_string = message_parts[0].split(' ')[0]
+    header_fields = message_header.split(' ')
+    received_time_string = header_fields[0]
     message_dict['received_time'] = dt.datetime(
         *[int(x) for x in received_time_string.split(':')[:6]], tzinfo=timezone.utc)
 
-    message_type_list = message_parts[0].split(' ')[1].split('.')
+    message_type_list = header_fields[1].split('.')
     if len(message_type_list) < 2:
         # occasional badly-formatted messages
         print('Not able to parse message type for message: {}'.format(raw_message))
         return None
     message_type = message_type_list[1]
-    message_dict['subject'] = message_parts[0].split(' ')[1].split('=')[1]
+    message_dict['subject'] = header_fields[1].split('=')[1]
     message_dict['message_type'] = message_type
     if message_type in ['BM', 'BP', 'DYNAMIC']:
         message_dict['bmu_id'] = message_type_list[2]
@@ -152,6 +159,9 @@ def message_to_dict(raw_message):
                           message_type,
                           raw_message))
 
+    if compiled:
+        return MESSAGE_PARSERS[(message_type, message_subtype)](raw_message, message_dict)
+
     key_values = raw_message[raw_message.find('{') + 1:raw_message.rfind('}')]
 
     for key_value in key_values.split(','):
@@ -188,7 +198,74 @@ def message_to_dict(raw_message):
     return message_dict
 
 
-def insert_data(message_dict):
+def new_insert_log():
+    """
+    Creates an empty combined insert log, to which the insert logs
+    of individual messages may be merged
+
+    Returns
+    -------
+    dict
+        empty combined insert log
+    """
+    return {'new_bmus': [],
+            'inserts': {},
+            'unprocessed_msg': {},
+            'duplicate_msg': {},
+            }
+
+
+def merge_insert_log(combined_insert_log, insert_log):
+    """
+    Merges the insert log returned for one or more messages into
+    a combined insert log
+
+    Parameters
+    ----------
+    combined_insert_log : dict
+        combined insert log, as returned by new_insert_log
+    insert_log : dict
+        insert log as returned by insert_data
+    """
+    if 'new_bmu' in insert_log:
+        combined_insert_log['new_bmus'].append(insert_log['new_bmu'])
+    for log_key, combined_key in [('new_entries', 'inserts'),
+                                  ('unprocessed_msg', 'unprocessed_msg'),
+                                  ('duplicate_msg', 'duplicate_msg')]:
+        if log_key in insert_log:
+            for key, value in insert_log[log_key].items():
+                if key in combined_insert_log[combined_key]:
+                    combined_insert_log[combined_key][key] += value
+                else:
+                    combined_insert_log[combined_key][key] = value
+
+
+def get_reference(model, ref_id, reference_cache=None):
+    """
+    Gets the core entity (e.g. BMU) with a given id, creating it if it does
+    not already exist
+
+    Parameters
+    ----------
+    model : Model
+        the core entity model, e.g. BMU
+    ref_id : str
+        the id of the entry
+    reference_cache : ReferenceCache
+        (optional) cache of known entries, to avoid querying the database
+        for each message
+
+    Returns
+    -------
+    tuple
+        the entry and whether it was created, as per get_or_create
+    """
+    if reference_cache is not None:
+        return reference_cache.get(model, ref_id)
+    return model.objects.get_or_create(id=ref_id)
+
+
+def insert_data(message_dict, reference_cache=None):
     """
     Converts a message dictionary to Django ORM object, checking first
     if message has already been processed
@@ -197,6 +274,8 @@ def insert_data(message_dict):
     ----------
     message_dict : dict
         the BM data dictionary
+    reference_cache : ReferenceCache
+        (optional) as per get_reference
 
     Returns
     -------
@@ -215,11 +294,11 @@ def insert_data(message_dict):
         return {'unprocessed_msg': {message_dict['message_subtype']: 1}}
 
     if message_dict['message_type'] == 'SYSTEM':
-        return insert_system_data(message_dict)
+        return insert_system_data(message_dict, reference_cache)
     if message_dict['message_type'] == 'BM':
-        return insert_bm_data(message_dict)
+        return insert_bm_data(message_dict, reference_cache)
     if message_dict['message_type'] == 'DYNAMIC':
-        return insert_dynamic_data(message_dict)
+        return insert_dynamic_data(message_dict, reference_cache)
     if message_dict['message_type'] == 'INFO':
         return insert_info_data(message_dict)
     if message_dict['message_type'] == 'BP':
@@ -228,7 +307,34 @@ def insert_data(message_dict):
                      % message_dict['message_type'])
 
 
-def insert_bm_data(message_dict):
+def pack_message_levels(entry, message_dict, value_key):
+    """
+    Sets the packed levels of an FPN, MEL, MIL, QPN, BOAL or BOALF entry
+    from the data points of its message, if levels are stored packed (see
+    BMRA.models.profiles)
+
+    Parameters
+    ----------
+    entry: unsaved model instance
+    message_dict: message dictionary
+    value_key: the data point key of the level value, e.g. 'VP'
+
+    Returns
+    -------
+    bool
+        True if the levels were packed, False if level rows are to be
+        inserted
+    """
+    from BMRA.models.profiles import use_packed_levels, pack_levels
+
+    if not use_packed_levels():
+        return False
+    entry.levels = pack_levels((data_point['TS'], data_point[value_key])
+                               for data_point in message_dict['data_points'].values())
+    return True
+
+
+def insert_bm_data(message_dict, reference_cache=None):
     """
     Generates and saves Django ORM object from message dictionary
     in order to insert a row of BMUID-level data to DB
@@ -236,6 +342,7 @@ def insert_bm_data(message_dict):
     Parameters
     ----------
     message: message dictionary
+    reference_cache: (optional) as per get_reference
 
     Returns
     -------
@@ -255,29 +362,25 @@ def insert_bm_data(message_dict):
     insert_log = {}
 
     # check if BMUID already in db, if not insert and log
-    try:
-        bmu = BMU.objects.get(id=message_dict['bmu_id'])
-    except BMU.DoesNotExist:
+    bmu, created = get_reference(BMU, message_dict['bmu_id'], reference_cache)
+    if created:
         insert_log['new_bmu'] = message_dict['bmu_id']
-        bmu = BMU(id=message_dict['bmu_id'])
-        bmu.save()
 
     # construct associated BM object
     if message_dict['message_subtype'] in ['FPN']:
-        if FPN.objects.filter(bmu=bmu,
-                              sd=message_dict['SD'],
-                              sp=message_dict['SP']).exists():
-            return {'duplicate_msg': {message_dict['message_subtype']: 1}}
         fpn = FPN(bmu=bmu,
                   ts=message_dict['received_time'],
                   sd=message_dict['SD'],
                   sp=message_dict['SP'])
-        fpn.save()
-        for data_point in message_dict['data_points'].values():
-            fpn_level = FPNlevel(fpn=fpn,
-                                 ts=data_point['TS'],
-                                 vp=data_point['VP'])
-            fpn_level.save()
+        packed = pack_message_levels(fpn, message_dict, 'VP')
+        if not insert_ignore_conflicts([fpn]):
+            return {'duplicate_msg': {message_dict['message_subtype']: 1}}
+        if not packed:
+            for data_point in message_dict['data_points'].values():
+                fpn_level = FPNlevel(fpn=fpn,
+                                     ts=data_point['TS'],
+                                     vp=data_point['VP'])
+                fpn_level.save()
         insert_log['new_entries'] = {'fpn': 1}
         return insert_log
 
@@ -291,12 +394,14 @@ def insert_bm_data(message_dict):
                   ts=message_dict['received_time'],
                   sd=message_dict['SD'],
                   sp=message_dict['SP'])
+        packed = pack_message_levels(mel, message_dict, 'VE')
         mel.save()
-        for data_point in message_dict['data_points'].values():
-            mel_level = MELlevel(mel=mel,
-                                 ts=data_point['TS'],
-                                 ve=data_point['VE'])
-            mel_level.save()
+        if not packed:
+            for data_point in message_dict['data_points'].values():
+                mel_level = MELlevel(mel=mel,
+                                     ts=data_point['TS'],
+                                     ve=data_point['VE'])
+                mel_level.save()
         insert_log['new_entries'] = {'mel': 1}
         return insert_log
 
@@ -310,12 +415,14 @@ def insert_bm_data(message_dict):
                   ts=message_dict['received_time'],
                   sd=message_dict['SD'],
                   sp=message_dict['SP'])
+        packed = pack_message_levels(mil, message_dict, 'VF')
         mil.save()
-        for data_point in message_dict['data_points'].values():
-            mil_level = MILlevel(mil=mil,
-                                 ts=data_point['TS'],
-                                 vf=data_point['VF'])
-            mil_level.save()
+        if not packed:
+            for data_point in message_dict['data_points'].values():
+                mil_level = MILlevel(mil=mil,
+                                     ts=data_point['TS'],
+                                     vf=data_point['VF'])
+                mil_level.save()
         insert_log['new_entries'] = {'mil': 1}
         return insert_log
 
@@ -329,12 +436,14 @@ def insert_bm_data(message_dict):
                     nk=message_dict['NK'],
                     ta=message_dict['TA'],
                     ad=message_dict['AD'])
+        packed = pack_message_levels(boal, message_dict, 'VA')
         boal.save()
-        for data_point in message_dict['data_points'].values():
-            boal_level = BOALlevel(boal=boal,
-                                   ts=data_point['TS'],
-                                   va=data_point['VA'])
-            boal_level.save()
+        if not packed:
+            for data_point in message_dict['data_points'].values():
+                boal_level = BOALlevel(boal=boal,
+                                       ts=data_point['TS'],
+                                       va=data_point['VA'])
+                boal_level.save()
         insert_log['new_entries'] = {'boal': 1}
         return insert_log
 
@@ -352,22 +461,18 @@ def insert_bm_data(message_dict):
                       pf=message_dict.get('PF'),
                       rn=message_dict.get('RN'),
                       sc=message_dict.get('SC'))
+        packed = pack_message_levels(boalf, message_dict, 'VA')
         boalf.save()
-        for data_point in message_dict['data_points'].values():
-            boalf_level = BOALFlevel(boalf=boalf,
-                                     ts=data_point['TS'],
-                                     va=data_point['VA'])
-            boalf_level.save()
+        if not packed:
+            for data_point in message_dict['data_points'].values():
+                boalf_level = BOALFlevel(boalf=boalf,
+                                         ts=data_point['TS'],
+                                         va=data_point['VA'])
+                boalf_level.save()
         insert_log['new_entries'] = {'boalf': 1}
         return insert_log
 
     if message_dict['message_subtype'] in ['BOD']:
-        if BOD.objects.filter(bmu=bmu,
-                              ts=message_dict['received_time'],
-                              sd=message_dict['SD'],
-                              sp=message_dict['SP'],
-                              nn=message_dict['NN']).exists():
-            return {'duplicate_msg': {message_dict['message_subtype']: 1}}
         # expecting 2 data pairs, raise error if note
         if len(message_dict['data_points']) != 2:
             raise ValueError('2 data points expected for BOD entry, %d found' %
@@ -383,17 +488,12 @@ def insert_bm_data(message_dict):
                   vb1=message_dict['data_points'][1]['VB'],
                   ts2=message_dict['data_points'][2]['TS'],
                   vb2=message_dict['data_points'][2]['VB'])
-        bod.save()
+        if not insert_ignore_conflicts([bod]):
+            return {'duplicate_msg': {message_dict['message_subtype']: 1}}
         insert_log['new_entries'] = {'bod': 1}
         return insert_log
 
     if message_dict['message_subtype'] in ['BOAV']:
-        if BOAV.objects.filter(bmu=bmu,
-                               nk=message_dict['NK'],
-                               sd=message_dict['SD'],
-                               sp=message_dict['SP'],
-                               nn=message_dict['NN']).exists():
-            return {'duplicate_msg': {message_dict['message_subtype']: 1}}
         boav = BOAV(bmu=bmu,
                     ts=message_dict['received_time'],
                     nk=message_dict['NK'],
@@ -403,7 +503,8 @@ def insert_bm_data(message_dict):
                     ov=message_dict['OV'],
                     bv=message_dict['BV'],
                     sa=message_dict['SA'])
-        boav.save()
+        if not insert_ignore_conflicts([boav]):
+            return {'duplicate_msg': {message_dict['message_subtype']: 1}}
         insert_log['new_entries'] = {'boav': 1}
         return insert_log
 
@@ -432,11 +533,6 @@ def insert_bm_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['EBOCF']:
-        if EBOCF.objects.filter(bmu=bmu,
-                                sd=message_dict['SD'],
-                                sp=message_dict['SP'],
-                                nn=message_dict['NN']).exists():
-            return {'duplicate_msg': {message_dict['message_subtype']: 1}}
         ebocf = EBOCF(bmu=bmu,
                       ts=message_dict['received_time'],
                       sd=message_dict['SD'],
@@ -444,7 +540,8 @@ def insert_bm_data(message_dict):
                       nn=message_dict['NN'],
                       oc=message_dict['OC'],
                       bc=message_dict['BC'])
-        ebocf.save()
+        if not insert_ignore_conflicts([ebocf]):
+            return {'duplicate_msg': {message_dict['message_subtype']: 1}}
         insert_log['new_entries'] = {'ebocf': 1}
         return insert_log
 
@@ -488,12 +585,14 @@ def insert_bm_data(message_dict):
                   ts=message_dict['received_time'],
                   sd=message_dict['SD'],
                   sp=message_dict['SP'])
+        packed = pack_message_levels(qpn, message_dict, 'VP')
         qpn.save()
-        for data_point in message_dict['data_points'].values():
-            qpn_level = QPNlevel(qpn=qpn,
-                                 ts=data_point['TS'],
-                                 vp=data_point['VP'])
-            qpn_level.save()
+        if not packed:
+            for data_point in message_dict['data_points'].values():
+                qpn_level = QPNlevel(qpn=qpn,
+                                     ts=data_point['TS'],
+                                     vp=data_point['VP'])
+                qpn_level.save()
         insert_log['new_entries'] = {'qpn': 1}
         return insert_log
 
@@ -501,7 +600,7 @@ def insert_bm_data(message_dict):
                      % message_dict['message_subtype'])
 
 
-def insert_system_data(message_dict):
+def insert_system_data(message_dict, reference_cache=None):
     """
     Generates and saves Django ORM object from message dictionary
     in order to insert a row of SYSTEM-level data to DB
@@ -509,6 +608,7 @@ def insert_system_data(message_dict):
     Parameters
     ----------
     message_dict: message dictionary
+    reference_cache: (optional) as per get_reference
 
     Returns
     -------
@@ -550,11 +650,7 @@ def insert_system_data(message_dict):
         dcontrol = DCONTROL(tp=message_dict['TP'])
         dcontrol.save()
         for data_point in message_dict['data_points'].values():
-            try:
-                ldso = LDSO.objects.get(id=data_point['DS'])
-            except LDSO.DoesNotExist:
-                ldso = LDSO(id=data_point['DS'])
-                ldso.save()
+            ldso = get_reference(LDSO, data_point['DS'], reference_cache)[0]
             dcontrol_level = DCONTROLlevel(dcontrol=dcontrol,
                                            ds=ldso,
                                            dcid=data_point['ID'],
@@ -570,24 +666,20 @@ def insert_system_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['DF']:
-        zi = ZI.objects.get_or_create(id=message_dict['ZI'])[0]
+        zi = get_reference(ZI, message_dict['ZI'], reference_cache)[0]
         for data_point in message_dict['data_points'].values():
-            if DF.objects.filter(zi=zi,
-                                 tp=data_point['TP'],
-                                 sd=data_point['SD'],
-                                 sp=data_point['SP']).exists():
-                return {'duplicate_msg': {message_dict['message_subtype']: 1}}
             df = DF(zi=zi,
                     tp=data_point['TP'],
                     sd=data_point['SD'],
                     sp=data_point['SP'],
                     vd=data_point['VD'])
-            df.save()
+            if not insert_ignore_conflicts([df]):
+                return {'duplicate_msg': {message_dict['message_subtype']: 1}}
         insert_log['new_entries'] = {'df': 1}
         return insert_log
 
     if message_dict['message_subtype'] in ['NDF']:
-        zi = ZI.objects.get_or_create(id=message_dict['ZI'])[0]
+        zi = get_reference(ZI, message_dict['ZI'], reference_cache)[0]
         for data_point in message_dict['data_points'].values():
             if NDF.objects.filter(zi=zi,
                                   tp=data_point['TP'],
@@ -604,7 +696,7 @@ def insert_system_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['TSDF']:
-        zi = ZI.objects.get_or_create(id=message_dict['ZI'])[0]
+        zi = get_reference(ZI, message_dict['ZI'], reference_cache)[0]
         for data_point in message_dict['data_points'].values():
             if TSDF.objects.filter(zi=zi,
                                    tp=data_point['TP'],
@@ -621,7 +713,7 @@ def insert_system_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['IMBALNGC']:
-        zi = ZI.objects.get_or_create(id=message_dict['ZI'])[0]
+        zi = get_reference(ZI, message_dict['ZI'], reference_cache)[0]
         for data_point in message_dict['data_points'].values():
             if IMBALNGC.objects.filter(zi=zi,
                                        tp=data_point['TP'],
@@ -638,7 +730,7 @@ def insert_system_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['INDGEN']:
-        zi = ZI.objects.get_or_create(id=message_dict['ZI'])[0]
+        zi = get_reference(ZI, message_dict['ZI'], reference_cache)[0]
         for data_point in message_dict['data_points'].values():
             if INDGEN.objects.filter(zi=zi,
                                      tp=data_point['TP'],
@@ -655,7 +747,7 @@ def insert_system_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['MELNGC']:
-        zi = ZI.objects.get_or_create(id=message_dict['ZI'])[0]
+        zi = get_reference(ZI, message_dict['ZI'], reference_cache)[0]
         for data_point in message_dict['data_points'].values():
             if MELNGC.objects.filter(zi=zi,
                                      tp=data_point['TP'],
@@ -672,7 +764,7 @@ def insert_system_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['INDDEM']:
-        zi = ZI.objects.get_or_create(id=message_dict['ZI'])[0]
+        zi = get_reference(ZI, message_dict['ZI'], reference_cache)[0]
         for data_point in message_dict['data_points'].values():
             if INDDEM.objects.filter(zi=zi,
                                      tp=data_point['TP'],
@@ -885,7 +977,7 @@ def insert_system_data(message_dict):
 
     if message_dict['message_subtype'] in ['FOU2T14D']:
         for data_point in message_dict['data_points'].values():
-            ft = FT.objects.get_or_create(id=data_point['FT'])[0]
+            ft = get_reference(FT, data_point['FT'], reference_cache)[0]
             if FOU2T14D.objects.filter(tp=message_dict['TP'],
                                        ft=ft,
                                        sd=data_point['SD']).exists():
@@ -900,7 +992,7 @@ def insert_system_data(message_dict):
 
     if message_dict['message_subtype'] in ['FOU2T52W']:
         for data_point in message_dict['data_points'].values():
-            ft = FT.objects.get_or_create(id=data_point['FT'])[0]
+            ft = get_reference(FT, data_point['FT'], reference_cache)[0]
             if FOU2T52W.objects.filter(tp=message_dict['TP'],
                                        ft=ft,
                                        cy=data_point['CY'],
@@ -917,7 +1009,7 @@ def insert_system_data(message_dict):
 
     if message_dict['message_subtype'] in ['FOU2T3YW']:
         for data_point in message_dict['data_points'].values():
-            ft = FT.objects.get_or_create(id=data_point['FT'])[0]
+            ft = get_reference(FT, data_point['FT'], reference_cache)[0]
             if FOU2T3YW.objects.filter(tp=message_dict['TP'],
                                        ft=ft,
                                        cy=data_point['CY'],
@@ -933,9 +1025,9 @@ def insert_system_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['UOU2T14D']:
-        bmu = BMU.objects.get_or_create(id=message_dict['bmu_id'])[0]
+        bmu = get_reference(BMU, message_dict['bmu_id'], reference_cache)[0]
         for data_point in message_dict['data_points'].values():
-            ft = FT.objects.get_or_create(id=data_point['FT'])[0]
+            ft = get_reference(FT, data_point['FT'], reference_cache)[0]
             if UOU2T14D.objects.filter(tp=message_dict['TP'],
                                        bmu=bmu,
                                        ft=ft,
@@ -951,9 +1043,9 @@ def insert_system_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['UOU2T52W']:
-        bmu = BMU.objects.get_or_create(id=message_dict['bmu_id'])[0]
+        bmu = get_reference(BMU, message_dict['bmu_id'], reference_cache)[0]
         for data_point in message_dict['data_points'].values():
-            ft = FT.objects.get_or_create(id=data_point['FT'])[0]
+            ft = get_reference(FT, data_point['FT'], reference_cache)[0]
             if UOU2T52W.objects.filter(tp=message_dict['TP'],
                                        bmu=bmu,
                                        ft=ft,
@@ -971,9 +1063,9 @@ def insert_system_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['UOU2T3YW']:
-        bmu = BMU.objects.get_or_create(id=message_dict['bmu_id'])[0]
+        bmu = get_reference(BMU, message_dict['bmu_id'], reference_cache)[0]
         for data_point in message_dict['data_points'].values():
-            ft = FT.objects.get_or_create(id=data_point['FT'])[0]
+            ft = get_reference(FT, data_point['FT'], reference_cache)[0]
             if UOU2T3YW.objects.filter(tp=message_dict['TP'],
                                        bmu=bmu,
                                        ft=ft,
@@ -1083,31 +1175,19 @@ def insert_system_data(message_dict):
         return insert_log
 
     if message_dict['message_subtype'] in ['FUELHH']:
-        try:
-            ft = FT.objects.get(id=message_dict['FT'])
-        except FT.DoesNotExist:
-            ft = FT(id=message_dict['FT'])
-            ft.save()
-        if FUELHH.objects.filter(sd=message_dict['SD'],
-                                 sp=message_dict['SP'],
-                                 tp=message_dict['TP'],
-                                 ft=ft).exists():
-            return {'duplicate_msg': {message_dict['message_subtype']: 1}}
+        ft = get_reference(FT, message_dict['FT'], reference_cache)[0]
         fuelhh = FUELHH(tp=message_dict['TP'],
                         sd=message_dict['SD'],
                         sp=message_dict['SP'],
                         ft=ft,
                         fg=message_dict['FG'])
-        fuelhh.save()
+        if not insert_ignore_conflicts([fuelhh]):
+            return {'duplicate_msg': {message_dict['message_subtype']: 1}}
         insert_log['new_entries'] = {'fuelhh': 1}
         return insert_log
 
     if message_dict['message_subtype'] in ['FUELINST']:
-        try:
-            ft = FT.objects.get(id=message_dict['FT'])
-        except FT.DoesNotExist:
-            ft = FT(id=message_dict['FT'])
-            ft.save()
+        ft = get_reference(FT, message_dict['FT'], reference_cache)[0]
         if FUELINST.objects.filter(sd=message_dict['SD'],
                                    sp=message_dict['SP'],
                                    ts=message_dict['TS'],
@@ -1402,7 +1482,7 @@ def insert_system_data(message_dict):
         return insert_log
 
 
-def insert_dynamic_data(message_dict):
+def insert_dynamic_data(message_dict, reference_cache=None):
     """
     Generates and saves Django ORM object from message dictionary
     in order to insert a row of BMUID-level dynamic data to DB
@@ -1410,6 +1490,7 @@ def insert_dynamic_data(message_dict):
     Parameters
     ----------
     message: message dictionary
+    reference_cache: (optional) as per get_reference
 
     Returns
     -------
@@ -1426,12 +1507,9 @@ def insert_dynamic_data(message_dict):
     insert_log = {}
 
     # check if BMUID already in db, if not insert and log
-    try:
-        bmu = BMU.objects.get(id=message_dict['bmu_id'])
-    except BMU.DoesNotExist:
-        bmu = BMU(id=message_dict['bmu_id'])
+    bmu, created = get_reference(BMU, message_dict['bmu_id'], reference_cache)
+    if created:
         insert_log['new_bmu'] = message_dict['bmu_id']
-        bmu.save()
 
     if message_dict['message_subtype'] in ['SIL']:
         sil, created = SIL.objects.get_or_create(bmu=bmu,
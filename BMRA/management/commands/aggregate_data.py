@@ -5,7 +5,8 @@ command to download and process BMRA data for specific date
 import datetime as dt
 from django.core.management.base import BaseCommand, CommandError
 from ._aggregate_functions import get_BMU_timeseries
-from GBEnergyDataManager.utils import get_sp_list
+import pandas as pd
+from GBEnergyDataManager.utils import get_sp_index
 
 class Command(BaseCommand):
     help = 'downloads BMRA data for specific date, expected argument yyyy-m-d'
@@ -22,14 +23,14 @@ class Command(BaseCommand):
         self.stdout.write('Generating aggregate timeseries for BMU %s' % bmu)
         self.stdout.write('Start date: {:%Y-%m-%d %H:%M:%S}'.format(start_date))
         self.stdout.write('Start date: {:%Y-%m-%d %H:%M:%S}'.format(end_date))
-        sp_list = get_sp_list(start_date, end_date)
-        #self.stdout.write(str(sp_list))
-        df = get_BMU_timeseries(bmu, start_date, end_date)
-        for curr_sd, curr_sp in sp_list:
-            self.stdout.write(str(curr_sd)+" "+str(curr_sp))
-            fpns = df[(df.SD == curr_sd) & (df.SP == curr_sp)]['VP']
+        sp_index = get_sp_index(start_date, end_date)
+        df, df_mwh = get_BMU_timeseries(bmu, start_date, end_date)
+        fpn_mwh = df_mwh.assign(SD=pd.to_datetime(df_mwh.SD)).set_index(['SD', 'SP'])['MWh']
+        fpn_mwh = fpn_mwh.reindex(sp_index)
+        for (curr_sd, curr_sp), curr_mwh in fpn_mwh.items():
+            self.stdout.write(str(curr_sd.date())+" "+str(curr_sp))
+            fpns = df[(df.SD == curr_sd.date()) & (df.SP == curr_sp)]['VP']
             self.stdout.write(str(fpns))
-            #fpn_mwh = fpns[0]
-            #self.stdout.write(str(fpn_mwh))
+            self.stdout.write(str(curr_mwh))
 
         self.stdout.write(df.to_string())
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+command to convert the levels of existing entries between level rows and
+packed storage
+"""
+import datetime as dt
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from ._level_storage_functions import LEVEL_STORAGE_MODELS, pack_entry_levels, \
+    unpack_entry_levels
+
+
+class Command(BaseCommand):
+    help = 'converts FPN/MEL/MIL/QPN/BOAL/BOALF levels for a date range to packed storage ' \
+           'or level rows, expected 2 arguments of form yyyy-m-d'
+
+    def add_arguments(self, parser):
+        parser.add_argument('date', nargs=2, type=str)
+        parser.add_argument('--storage', choices=['packed', 'rows'], default='packed',
+                            help='storage the levels are converted to')
+        parser.add_argument('--models', nargs='+', choices=list(LEVEL_STORAGE_MODELS),
+                            default=list(LEVEL_STORAGE_MODELS),
+                            help='models to be converted, all by default')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Started: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
+        start_date = dt.date(*[int(x) for x in options['date'][0].split('-')[:3]])
+        end_date = dt.date(*[int(x) for x in options['date'][1].split('-')[:3]])
+        if end_date < start_date:
+            raise CommandError('end date is before start date')
+        convert = pack_entry_levels if options['storage'] == 'packed' else unpack_entry_levels
+        date = start_date
+        while date <= end_date:
+            # each day is converted in its own transaction
+            with transaction.atomic():
+                counts = [(model_name, convert(model_name, date, date))
+                          for model_name in options['models']]
+            self.stdout.write('{:%Y-%m-%d}: {}'.format(
+                date, ', '.join('{} {}'.format(count, model_name)
+                                for model_name, count in counts)))
+            date += dt.timedelta(days=1)
+        self.stdout.write('Finished: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
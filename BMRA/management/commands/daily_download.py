@@ -6,6 +6,8 @@ import sys
 import datetime as dt
 from django.core.management.base import BaseCommand, CommandError
 from ._download_functions import process_bmra_file
+from ._bmu_period_functions import update_bmu_periods, get_bmra_period_dates, \
+    get_p114_period_dates
 from P114.management.commands._download_functions import process_p114_date
 from django.core.mail import send_mail
 
@@ -16,6 +18,17 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('days_back', nargs='?', type=int, default=0)
         parser.add_argument('--no_insert', action='store_true', help='process but don\'t insert into db')
+        parser.add_argument('--batch_size', type=int, default=5000,
+                            help='insert BMRA messages in batches of this size per message subtype, '
+                                 'or individually if 0')
+        parser.add_argument('--parse_workers', type=int, default=None,
+                            help='parse BMRA messages using this number of worker processes')
+        parser.add_argument('--loader', choices=['orm', 'copy'], default='orm',
+                            help='method used to load level rows, copy requires PostgreSQL')
+        parser.add_argument('--force', action='store_true',
+                            help='reprocess files already completed in the ingestion ledger')
+        parser.add_argument('--no_bmu_periods', action='store_true',
+                            help='don\'t update the BMU period table for the dates ingested')
 
     def handle(self, *args, **options):
         email_log = {}
@@ -26,8 +39,16 @@ class Command(BaseCommand):
         self.stdout.write('downloading data for {:%Y-%m-%d}'.format(date))
         email_log[dt.datetime.now()] = 'downloading data for {:%Y-%m-%d}'.format(date)
         try:
-            combined_insert_log = process_bmra_file(date, no_insert=options['no_insert'])
-            email_log[dt.datetime.now()] = 'BMRA processing completed'
+            combined_insert_log = process_bmra_file(date,
+                                                    no_insert=options['no_insert'],
+                                                    batch_size=options['batch_size'] or None,
+                                                    parse_workers=options['parse_workers'],
+                                                    force=options['force'],
+                                                    loader=options['loader'])
+            if combined_insert_log.get('skipped'):
+                email_log[dt.datetime.now()] = 'BMRA file already completed, skipped'
+            else:
+                email_log[dt.datetime.now()] = 'BMRA processing completed'
             formatted_report += '\n {} BMRA messages processed'.format(combined_insert_log['count'])
             for new_bmu in combined_insert_log['new_bmus']:
                 formatted_report += '\n New BMU created: {}'.format(new_bmu)
@@ -42,11 +63,21 @@ class Command(BaseCommand):
             email_log[dt.datetime.now()] = 'BMRA processing failed with error: {} {}'.format(type(e).__name__, e.args)
             print(email_log)
         try:
-            p114_processed_log = process_p114_date(date, no_insert=options['no_insert'])
+            p114_processed_log = process_p114_date(date,
+                                                   no_insert=options['no_insert'],
+                                                   force=options['force'])
             email_log[dt.datetime.now()] = 'P114 processing completed'
         except Exception as e:
             email_log[dt.datetime.now()] = 'P114 processing failed with error: {} {}'.format(type(e).__name__, e.args)
             print(email_log)
+        if not options['no_insert'] and not options['no_bmu_periods']:
+            try:
+                period_dates = get_bmra_period_dates([date]) | get_p114_period_dates([date])
+                count = update_bmu_periods(period_dates)
+                email_log[dt.datetime.now()] = 'BMU periods updated: {} rows'.format(count)
+            except Exception as e:
+                email_log[dt.datetime.now()] = 'BMU period update failed with error: {} {}'.format(type(e).__name__, e.args)
+                print(email_log)
         self.stdout.write('Finished: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
         email_log[dt.datetime.now()] = 'Finished'
         formatted_report += '\n' + '\n'.join("{:%Y-%m-%d %H:%M:%S} {}".format(k, v) for (k, v) in email_log.items())
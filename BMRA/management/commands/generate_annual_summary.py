@@ -5,14 +5,16 @@ command to generate annual datafiles for given data subsets
 import datetime as dt
 import pandas as pd
 import numpy as np
-import pytz
 import psycopg2
 from sqlalchemy import create_engine
 import os
-from tqdm import tqdm
 from django.core.management.base import BaseCommand, CommandError
 from django.core.mail import send_mail
+from django.utils import timezone
 from GBEnergyDataManager.settings import BASE_DIR, DATABASES, NETA_USER, NETA_PWD, NETA_BMU_LIST_URL, DATA_SUMMARY_LOCS
+from GBEnergyDataManager.utils import get_sp_index
+from ._summary_functions import write_summary, read_summary, load_watermark, save_watermark, \
+    get_last_agg_date, get_summary_dates, update_summary, SUMMARY_FORMATS, SUMMARY_METRICS
 
 
 def email_log(log_dict):
@@ -25,9 +27,21 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('subset', nargs=1, type=str)
         parser.add_argument('year', nargs=1, type=int)
+        parser.add_argument('--format', dest='output_format', choices=sorted(SUMMARY_FORMATS),
+                            default='csv',
+                            help='output file format (parquet and feather require pyarrow)')
+        parser.add_argument('--incremental', action='store_true',
+                            help='only recompute dates after the last run, or with data '
+                                 'ingested since, merging into the existing output')
 
     def handle(self, *args, **options):
         log = {}
+        output_format = options['output_format']
+        if output_format != 'csv':
+            try:
+                import pyarrow
+            except ImportError:
+                raise CommandError('pyarrow is required for {} output'.format(output_format))
         self.stdout.write('{:%Y-%m-%d %H:%M:%S} Started'.format(dt.datetime.now()))
         log['{:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now())] = 'Started'
 
@@ -55,10 +69,6 @@ class Command(BaseCommand):
         self.stdout.write('{:%Y-%m-%d %H:%M:%S} Creating blank dataframe'.format(dt.datetime.now()))
         log['{:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now())] = 'Creating blank dataframe'
 
-        # create list of clock change dates
-        transition_days = [dt.date(x.year, x.month, x.day) for x in
-                           pytz.timezone('Europe/London')._utc_transition_times]
-
         # set up blank dataframe, with settlement periods as index
         # and subset BMUIDs as columns
         if options['subset'][0] == 'scotland':
@@ -90,25 +100,7 @@ class Command(BaseCommand):
                 options['subset'][0])
             raise ValueError('subset {} not recognised'.format(options['subset'][0]))
 
-        blank_df = pd.DataFrame(columns=['sd', 'sp'])
-        curr_date = start_date
-        while curr_date <= end_date:
-            curr_sp = 1
-            if curr_date in [x for x in transition_days if x.month < 6]:  # clocks go forward
-                max_sp = 46
-            elif curr_date in [x for x in transition_days if x.month > 6]:  # clocks go back
-                max_sp = 50
-            else:
-                max_sp = 48
-            while curr_sp <= max_sp:
-                new_data = pd.DataFrame([[pd.to_datetime(curr_date), curr_sp]], columns=['sd', 'sp'])
-                #blank_df = blank_df.append(new_data)
-                blank_df = pd.concat([blank_df, new_data])
-                curr_sp += 1
-            curr_date += dt.timedelta(days=1)
-        blank_df = blank_df.set_index(['sd', 'sp'])
-        for bmu_id in bmu_ids:
-            blank_df[bmu_id] = np.nan
+        blank_df = pd.DataFrame(np.nan, index=get_sp_index(start_date, end_date), columns=pd.unique(bmu_ids))
 
         # connect to DB
         # --TODO: convert to ORM
@@ -124,278 +116,87 @@ class Command(BaseCommand):
         #                                                                                     'PASSWORD']))
         #cur = conn.cursor()
 
-        # generate bid acceptance values
-        self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating BAVs'.format(dt.datetime.now()))
-        combined_BAVs = blank_df.copy()
-
-        bav_query = 'SELECT sd, sp, sum(bmra_boav.bv) \
-        FROM public.bmra_boav \
-        where bmra_boav.bmu_id=\'{}\' \
-        and sd>=\'{:%Y-%m-%d}\' \
-        and sd<=\'{:%Y-%m-%d}\' \
-        group by sd, sp \
-        order by sd, sp'
-
-        for bmu_id in tqdm(bmu_ids, desc='total'):
-            sql_df = pd.read_sql(bav_query.format(bmu_id, start_date, end_date), conn)
-            sql_df = sql_df.set_index(['sd', 'sp'])
-            combined_BAVs[bmu_id] = sql_df
-
-        combined_BAVs.to_csv(os.path.join(save_path, 'BAVs.csv'))
-
-        # generate offer acceptance values
-        self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating OAVs'.format(dt.datetime.now()))
-        combined_OAVs = blank_df.copy()
-
-        oav_query = 'SELECT sd, sp, sum(bmra_boav.ov) \
-        FROM public.bmra_boav \
-        where bmra_boav.bmu_id=\'{}\' \
-        and sd>=\'{:%Y-%m-%d}\' \
-        and sd<=\'{:%Y-%m-%d}\' \
-        group by sd, sp \
-        order by sd, sp'
-
-        for bmu_id in tqdm(bmu_ids, desc='total'):
-            sql_df = pd.read_sql(oav_query.format(bmu_id, start_date, end_date), conn)
-            sql_df = sql_df.set_index(['sd', 'sp'])
-            combined_OAVs[bmu_id] = sql_df
-
-        combined_OAVs.to_csv(os.path.join(save_path, 'OAVs.csv'))
-
-        # generate FPN values
-        self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating FPNs'.format(dt.datetime.now()))
-        combined_FPNs = blank_df.copy()
-
-        query = 'SELECT sd, sp, bmra_fpnlevel.ts, vp \
-        FROM public.bmra_fpnlevel \
-        left join public.bmra_fpn \
-        on bmra_fpnlevel.fpn_id = bmra_fpn.id \
-        where bmra_fpn.bmu_id=\'{}\' \
-        and sd>=\'{:%Y-%m-%d}\' \
-        and sd<=\'{:%Y-%m-%d}\' \
-        order by sd, sp, bmra_fpnlevel.ts'
-
-        for bmu_id in tqdm(bmu_ids, desc='total'):
-            bmu_fpns = []
-            df = pd.read_sql(query.format(bmu_id,
-                                          start_date - dt.timedelta(days=1),
-                                          end_date + dt.timedelta(days=1)),
-                             conn)
-            prev_SD, prev_SP, prev_VP, prev_TS = None, None, None, None
-            total_mwh = 0.0
-            for key, values in df.iterrows():
-                SD, SP, TS, VP = values['sd'], values['sp'], values['ts'], values['vp']
-                if SD == prev_SD and SP == prev_SP:
-                    time_diff = (TS - prev_TS).total_seconds() / 3600.0
-                    total_mwh += (prev_VP * time_diff + (0.5 * (VP - prev_VP) * time_diff))
-                elif prev_SD is not None and prev_SP is not None:
-                    bmu_fpns.append([dt.date(prev_SD.year, prev_SD.month, prev_SD.day), prev_SP, total_mwh])
-                    #bmu_fpns = pd.concat([bmu_fpns, pd.DataFrame([dt.date(prev_SD.year, prev_SD.month, prev_SD.day), prev_SP, total_mwh])])
-                    total_mwh = 0.0
-                prev_SD, prev_SP, prev_VP, prev_TS = SD, SP, VP, TS
-            new_data = pd.DataFrame(bmu_fpns, columns=['sd', 'sp', bmu_id])
-            new_data = new_data.set_index(['sd', 'sp'])
-            combined_FPNs.update(new_data)
-
-        combined_FPNs.to_csv(os.path.join(save_path, 'FPNs.csv'))
-
-        # generate MELvalues
-        self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating MELs'.format(dt.datetime.now()))
-        combined_MELs = blank_df.copy()
-
-        query = 'SELECT bmra_mel.ts as tsr, sd, sp, bmra_mellevel.ts, ve \
-        FROM public.bmra_mellevel \
-        left join public.bmra_mel \
-        on bmra_mellevel.mel_id = bmra_mel.id \
-        where bmra_mel.bmu_id=\'{}\' \
-        and sd>=\'{:%Y-%m-%d}\' \
-        and sd<=\'{:%Y-%m-%d}\' \
-        order by sd, sp, bmra_mel.ts desc, bmra_mellevel.ts'
-
-        for bmu_id in tqdm(bmu_ids, desc='total'):
-            bmu_mels = []
-            df = pd.read_sql(query.format(bmu_id,
-                                          start_date - dt.timedelta(days=1),
-                                          end_date + dt.timedelta(days=1)),
-                             conn)
-            prev_SD, prev_SP, prev_VP, prev_TS, prev_TSR, last_msg_time = None, None, None, None, None, None
-            total_mwh, total_time = 0.0, 0.0
-            for key, values in df.iterrows():
-                SD, SP, TS, VP, TSR = values['sd'], values['sp'], values['ts'], values['ve'], values['tsr']
-                if SD == prev_SD and SP == prev_SP:
-                    if TSR == last_msg_time:
-                        time_diff = (TS - prev_TS).total_seconds() / 3600.0
-                        total_mwh += (prev_VP * time_diff + (0.5 * (VP - prev_VP) * time_diff))
-                        total_time += time_diff
-                elif prev_SD is not None and prev_SP is not None:
-                    bmu_mels.append([dt.date(prev_SD.year, prev_SD.month, prev_SD.day), prev_SP, total_mwh])
-                    #bmu_mels = pd.concat([bmu_mels, pd.DataFrame([dt.date(prev_SD.year, prev_SD.month, prev_SD.day), prev_SP, total_mwh])])
-                    # if not math.isclose(0.5, total_time, rel_tol=1e-5):
-                    #    print(prev_SD, prev_SP)
-                    #    print('total time duration: {:+06.2f}'.format(total_time))
-                    total_mwh, total_time = 0.0, 0.0
-                    last_msg_time = values['tsr']
-                prev_SD, prev_SP, prev_VP, prev_TS = SD, SP, VP, TS
-            new_data = pd.DataFrame(bmu_mels, columns=['sd', 'sp', bmu_id])
-            new_data = new_data.set_index(['sd', 'sp'])
-            combined_MELs.update(new_data)
-
-        combined_MELs.to_csv(os.path.join(save_path, 'MELs.csv'))
-
-        # calculate cashflow by settlement period
-        self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating cashflows'.format(dt.datetime.now()))
-        combined_cashflows = blank_df.copy()
-
-        query = 'SELECT sd, sp, sum(oc) as cashflow \
-        FROM public.bmra_ebocf \
-        where bmu_id=\'{}\' \
-        and sd>=\'{:%Y-%m-%d}\' \
-        and sd<=\'{:%Y-%m-%d}\' \
-        group by sd, sp \
-        order by sd, sp;'
-
-        for bmu_id in tqdm(bmu_ids, desc='total'):
-            sql_df = pd.read_sql(query.format(bmu_id,
-                                              start_date,
-                                              end_date),
-                                 conn)
-            sql_df = sql_df.set_index(['sd', 'sp'])
-            sql_df.rename(columns={'cashflow': bmu_id}, inplace=True)
-            combined_cashflows.update(sql_df)
-
-        combined_cashflows.to_csv(os.path.join(save_path, 'offer_cashflows.csv'))
-
-        combined_cashflows = blank_df.copy()
-
-        query = 'SELECT sd, sp, sum(bc) as cashflow \
-                FROM public.bmra_ebocf \
-                where bmu_id=\'{}\' \
-                and sd>=\'{:%Y-%m-%d}\' \
-                and sd<=\'{:%Y-%m-%d}\' \
-                group by sd, sp \
-                order by sd, sp;'
-
-        for bmu_id in tqdm(bmu_ids, desc='total'):
-            sql_df = pd.read_sql(query.format(bmu_id,
-                                              start_date,
-                                              end_date),
-                                 conn)
-            sql_df = sql_df.set_index(['sd', 'sp'])
-            sql_df.rename(columns={'cashflow': bmu_id}, inplace=True)
-            combined_cashflows.update(sql_df)
-
-        combined_cashflows.to_csv(os.path.join(save_path, 'bid_cashflows.csv'))
-
-        # calculate P114 metered values by settlement period
-        self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating metered values'.format(dt.datetime.now()))
-        combined_metered = blank_df.copy()
-
-        P114_query = 'select distinct p114_abv.sd as sd, p114_abp.sp as sp, vol \
-        from p114_abv \
-        left join p114_abp \
-        on p114_abv.id = p114_abp.abv_id \
-        left join p114_sr_type \
-        on p114_abv.sr_type_id = p114_sr_type.id \
-        inner join \
-        (SELECT sd, sp, max(p114_sr_type.order) as ordinal \
-        FROM p114_abv \
-        left join p114_abp \
-        on p114_abv.id = p114_abp.abv_id \
-        left join p114_sr_type \
-        on p114_abv.sr_type_id = p114_sr_type.id \
-        where bmu_id=\'{}\' \
-        and p114_abv.sd>=\'{}\' \
-        and p114_abv.sd<=\'{}\' \
-        group by sd, sp \
-        order by sd, sp) as inner_query \
-        on inner_query.sd = p114_abv.sd \
-        and inner_query.sp = p114_abp.sp \
-        and inner_query.ordinal = p114_sr_type.order \
-        where bmu_id=\'{}\' \
-        and p114_abv.sd>=\'{}\' \
-        and p114_abv.sd<=\'{}\' \
-        order by sd, sp;'
-
-        for bmu_id in tqdm(bmu_ids, desc='total'):
-            sql_df = pd.read_sql(P114_query.format(bmu_id,
-                                                   start_date.strftime('%Y-%m-%d'),
-                                                   end_date.strftime('%Y-%m-%d'),
-                                                   bmu_id,
-                                                   start_date.strftime('%Y-%m-%d'),
-                                                   end_date.strftime('%Y-%m-%d')), conn)
-            sql_df = sql_df.set_index(['sd', 'sp'])
-            sql_df.rename(columns={'vol': bmu_id}, inplace=True)
-            combined_metered[bmu_id] = sql_df
-
-        combined_metered.to_csv(os.path.join(save_path, 'metered.csv'))
+        # each metric is retrieved for all BMUs in a single grouped query
+        # and pivoted to the (sd, sp) x BMU layout of blank_df. In incremental
+        # mode only dates after the watermark, or with data ingested since,
+        # are retrieved and merged into the existing output
+        watermark = load_watermark(save_path) if options['incremental'] else {}
+        run_started = timezone.now()
+        last_agg_date = get_last_agg_date(conn)
+        combined = {}
+        for name in SUMMARY_METRICS:
+            existing_df = None
+            watermark_entry = watermark.get(name)
+            if watermark_entry is not None and watermark_entry.get('format') == output_format:
+                existing_df = read_summary(save_path, name, output_format)
+            if existing_df is not None and set(existing_df.columns) != set(blank_df.columns):
+                # BMUs in subset changed, so all dates recomputed
+                existing_df = None
+            if existing_df is None:
+                dates = [start_date + dt.timedelta(days=x)
+                         for x in range((end_date - start_date).days + 1)]
+            else:
+                dates = get_summary_dates(conn, name, start_date, end_date, watermark_entry)
+            self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating {} ({} days)'.format(
+                dt.datetime.now(), name, len(dates)))
+            combined[name] = update_summary(conn, name, bmu_ids, blank_df, dates, existing_df)
+            write_summary(combined[name], save_path, name, output_format)
+            watermark[name] = {'last_sd': '{:%Y-%m-%d}'.format(end_date),
+                               'updated': run_started.isoformat(),
+                               'format': output_format}
+            if SUMMARY_METRICS[name]['source'] == 'P114' and last_agg_date is not None:
+                watermark[name]['last_agg_date'] = '{:%Y-%m-%d}'.format(last_agg_date)
+            save_watermark(save_path, watermark)
+        combined_BAVs = combined['BAVs']
+        combined_OAVs = combined['OAVs']
+        combined_FPNs = combined['FPNs']
+        combined_MELs = combined['MELs']
+        combined_cashflows = combined['bid_cashflows']
+        combined_metered = combined['metered']
 
         # generate monthly summaries by BMU
         self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating monthly BMU aggregate values'.format(dt.datetime.now()))
-        combined_BAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().to_csv(
-            os.path.join(save_path, 'monthly_BAVs.csv'))
-        combined_OAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().to_csv(
-            os.path.join(save_path, 'monthly_OAVs.csv'))
-        combined_FPNs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().to_csv(
-            os.path.join(save_path, 'monthly_FPNs.csv'))
-        combined_MELs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().to_csv(
-            os.path.join(save_path, 'monthly_MELs.csv'))
-        combined_cashflows.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().to_csv(
-            os.path.join(save_path, 'monthly_cashflows.csv'))
-        combined_metered.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().to_csv(
-            os.path.join(save_path, 'monthly_metered.csv'))
+        write_summary(combined_BAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum(), save_path, 'monthly_BAVs', output_format)
+        write_summary(combined_OAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum(), save_path, 'monthly_OAVs', output_format)
+        write_summary(combined_FPNs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum(), save_path, 'monthly_FPNs', output_format)
+        write_summary(combined_MELs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum(), save_path, 'monthly_MELs', output_format)
+        write_summary(combined_cashflows.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum(), save_path, 'monthly_cashflows', output_format)
+        write_summary(combined_metered.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum(), save_path, 'monthly_metered', output_format)
 
         # generate daily summaries by BMU
         self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating daily BMU aggregate values'.format(dt.datetime.now()))
-        combined_BAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().to_csv(
-            os.path.join(save_path, 'daily_BAVs.csv'))
-        combined_OAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().to_csv(
-            os.path.join(save_path, 'daily_OAVs.csv'))
-        combined_FPNs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().to_csv(
-            os.path.join(save_path, 'daily_FPNs.csv'))
-        combined_MELs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().to_csv(
-            os.path.join(save_path, 'daily_MELs.csv'))
-        combined_cashflows.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().to_csv(
-            os.path.join(save_path, 'daily_cashflows.csv'))
-        combined_metered.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().to_csv(
-            os.path.join(save_path, 'daily_metered.csv'))
+        write_summary(combined_BAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum(), save_path, 'daily_BAVs', output_format)
+        write_summary(combined_OAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum(), save_path, 'daily_OAVs', output_format)
+        write_summary(combined_FPNs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum(), save_path, 'daily_FPNs', output_format)
+        write_summary(combined_MELs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum(), save_path, 'daily_MELs', output_format)
+        write_summary(combined_cashflows.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum(), save_path, 'daily_cashflows', output_format)
+        write_summary(combined_metered.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum(), save_path, 'daily_metered', output_format)
 
         # generate monthly summaries by BMU Type
         self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating monthly BMU Type aggregate values'.format(dt.datetime.now()))
-        combined_BAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'monthly_BAVs_bytype.csv'))
-        combined_OAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'monthly_OAVs_bytype.csv'))
-        combined_FPNs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'monthly_FPNs_bytype.csv'))
-        combined_MELs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'monthly_MELs_bytype.csv'))
-        combined_cashflows.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'monthly_cashflows_bytype.csv'))
-        combined_metered.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'monthly_metered_bytype.csv'))
+        write_summary(combined_BAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'monthly_BAVs_bytype', output_format)
+        write_summary(combined_OAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'monthly_OAVs_bytype', output_format)
+        write_summary(combined_FPNs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'monthly_FPNs_bytype', output_format)
+        write_summary(combined_MELs.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'monthly_MELs_bytype', output_format)
+        write_summary(combined_cashflows.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'monthly_cashflows_bytype', output_format)
+        write_summary(combined_metered.groupby(level=0).sum().groupby(pd.Grouper(freq='M')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'monthly_metered_bytype', output_format)
 
         # generate daily summaries by BMU
         self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating daily BMU Type aggregate values'.format(dt.datetime.now()))
-        combined_BAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'daily_BAVs_bytype.csv'))
-        combined_OAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'daily_OAVs_bytype.csv'))
-        combined_FPNs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'daily_FPNs_bytype.csv'))
-        combined_MELs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'daily_MELs_bytype.csv'))
-        combined_cashflows.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'daily_cashflows_bytype.csv'))
-        combined_metered.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum().to_csv(
-            os.path.join(save_path, 'daily_metered_bytype.csv'))
+        write_summary(combined_BAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'daily_BAVs_bytype', output_format)
+        write_summary(combined_OAVs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'daily_OAVs_bytype', output_format)
+        write_summary(combined_FPNs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'daily_FPNs_bytype', output_format)
+        write_summary(combined_MELs.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'daily_MELs_bytype', output_format)
+        write_summary(combined_cashflows.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'daily_cashflows_bytype', output_format)
+        write_summary(combined_metered.groupby(level=0).sum().groupby(pd.Grouper(freq='D')).sum().T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'daily_metered_bytype', output_format)
 
         # generate summaries by BMU Type
         self.stdout.write('{:%Y-%m-%d %H:%M:%S} Generating BMU Type aggregate values'.format(dt.datetime.now()))
-        combined_BAVs.T.groupby(BMU_types.Type.to_dict()).sum().to_csv(os.path.join(save_path, 'BAVs_bytype.csv'))
-        combined_OAVs.T.groupby(BMU_types.Type.to_dict()).sum().to_csv(os.path.join(save_path, 'OAVs_bytype.csv'))
-        combined_FPNs.T.groupby(BMU_types.Type.to_dict()).sum().to_csv(os.path.join(save_path, 'FPNs_bytype.csv'))
-        combined_MELs.T.groupby(BMU_types.Type.to_dict()).sum().to_csv(os.path.join(save_path, 'MELs_bytype.csv'))
-        combined_cashflows.T.groupby(BMU_types.Type.to_dict()).sum().to_csv(os.path.join(save_path, 'cashflows_bytype.csv'))
-        combined_metered.T.groupby(BMU_types.Type.to_dict()).sum().to_csv(os.path.join(save_path, 'metered_bytype.csv'))
+        write_summary(combined_BAVs.T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'BAVs_bytype', output_format)
+        write_summary(combined_OAVs.T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'OAVs_bytype', output_format)
+        write_summary(combined_FPNs.T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'FPNs_bytype', output_format)
+        write_summary(combined_MELs.T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'MELs_bytype', output_format)
+        write_summary(combined_cashflows.T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'cashflows_bytype', output_format)
+        write_summary(combined_metered.T.groupby(BMU_types.Type.to_dict()).sum(), save_path, 'metered_bytype', output_format)
 
         self.stdout.write('{:%Y-%m-%d %H:%M:%S} Finished'.format(dt.datetime.now()))
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+command to partition the largest BMRA tables by date (PostgreSQL only)
+"""
+import datetime as dt
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from ._partition_functions import PARTITIONED_TABLES, PARTITION_INTERVALS, is_partitioned, \
+    partition_table, extend_partitions, detach_partitions
+
+
+class Command(BaseCommand):
+    help = 'partitions BMRA tables by month or year, moving existing data, or adds partitions ' \
+           'to tables already partitioned'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tables', nargs='*', type=str,
+                            help='tables to be partitioned, by default all of {}'.format(
+                                ', '.join(PARTITIONED_TABLES)))
+        parser.add_argument('--interval', choices=PARTITION_INTERVALS, default='year',
+                            help='period covered by each partition')
+        parser.add_argument('--until', type=str, default=None,
+                            help='create partitions up to this date, yyyy-m-d, by default the '
+                                 'end of next year')
+        parser.add_argument('--detach_before', type=str, default=None,
+                            help='detach partitions ending on or before this date, yyyy-m-d, '
+                                 'leaving them as standalone tables')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('partitioning requires PostgreSQL')
+        if connection.pg_version < 110000:
+            raise CommandError('partitioning requires PostgreSQL 11 or later')
+        tables = options['tables'] or list(PARTITIONED_TABLES)
+        for table in tables:
+            if table not in PARTITIONED_TABLES:
+                raise CommandError('{} is not a partitioned table'.format(table))
+        if options['until'] is None:
+            until = dt.date(dt.date.today().year + 1, 12, 31)
+        else:
+            until = dt.date(*[int(x) for x in options['until'].split('-')[:3]])
+
+        self.stdout.write('Started: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
+        for table in tables:
+            column = PARTITIONED_TABLES[table]['column']
+            # each table is converted in its own transaction
+            with transaction.atomic(), connection.cursor() as cursor:
+                if not is_partitioned(cursor, table):
+                    self.stdout.write('{:%Y-%m-%d %H:%M:%S} partitioning {} by {} of {}'.format(
+                        dt.datetime.now(), table, options['interval'], column))
+                    partition_table(cursor, table, column, options['interval'], until,
+                                    stdout=self.stdout)
+                else:
+                    added = extend_partitions(cursor, table, column, options['interval'], until)
+                    self.stdout.write('{}: {} partitions added'.format(table, len(added)))
+                if options['detach_before'] is not None:
+                    before = dt.date(*[int(x) for x in options['detach_before'].split('-')[:3]])
+                    for name in detach_partitions(cursor, table, before):
+                        self.stdout.write('{}: {} detached'.format(table, name))
+        self.stdout.write('Finished: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+command to remove duplicate entries prior to creating natural key constraints
+"""
+import datetime as dt
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ._conflict_functions import get_unique_key, remove_duplicates
+
+
+class Command(BaseCommand):
+    help = 'deletes all but the first entry of each natural key of BMRA models with a ' \
+           'unique constraint, to be run before migrating to the constraints'
+
+    def handle(self, *args, **options):
+        from django.apps import apps
+
+        self.stdout.write('Started: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
+        for model in apps.get_app_config('BMRA').get_models():
+            if get_unique_key(model) is None:
+                continue
+            with transaction.atomic():
+                count = remove_duplicates(model)
+            self.stdout.write('{}: {} duplicate entries removed'.format(model.__name__, count))
+        self.stdout.write('Finished: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
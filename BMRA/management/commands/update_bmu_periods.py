@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+command to rebuild the BMU period table for a settlement date range
+"""
+import datetime as dt
+from django.core.management.base import BaseCommand, CommandError
+from ._bmu_period_functions import update_bmu_periods, get_date_chunks
+
+
+class Command(BaseCommand):
+    help = 'rebuilds BMU period rows for a settlement date range, expected 2 arguments of form yyyy-m-d'
+
+    def add_arguments(self, parser):
+        parser.add_argument('date', nargs=2, type=str)
+        parser.add_argument('--days', type=int, default=7,
+                            help='number of settlement dates updated per transaction')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Started: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
+        start_date = dt.date(*[int(x) for x in options['date'][0].split('-')[:3]])
+        end_date = dt.date(*[int(x) for x in options['date'][1].split('-')[:3]])
+        if end_date < start_date:
+            raise CommandError('end date is before start date')
+        dates = [start_date + dt.timedelta(days=x)
+                 for x in range((end_date - start_date).days + 1)]
+        for chunk_start, chunk_end in get_date_chunks(dates, options['days']):
+            count = update_bmu_periods([chunk_start + dt.timedelta(days=x)
+                                        for x in range((chunk_end - chunk_start).days + 1)],
+                                       days=options['days'])
+            self.stdout.write('{:%Y-%m-%d} to {:%Y-%m-%d}: {} BMU periods'.format(
+                chunk_start, chunk_end, count))
+        self.stdout.write('Finished: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
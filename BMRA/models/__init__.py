@@ -2,7 +2,7 @@
 combined model import
 """
 
-from .core import BMU, ZI, FT, LDSO
+from .core import ProcessedFile, BMU, ZI, FT, LDSO
 from .balancing import BOAL, BOALlevel, BOALF, BOALFlevel, BOAV, BOD, \
     DISPTAV, EBOCF, FPN, FPNlevel, MEL, MELlevel, MIL, MILlevel, \
     PTAV, QAS, QPN, QPNlevel
@@ -15,3 +15,4 @@ from .forecast import DF, NDF, TSDF, IMBALNGC, INDGEN, MELNGC, INDDEM,  \
 from .outturn import FREQ, TEMP, INDO, ITSDO, LOLP, LOLPlevel, NONBM, \
     INDOD, FUELINST, FUELHH
 from .dynamic import MDP, MDV, MNZT, MZT, NDZ, NTB, NTO, RDRE, RDRI, RURE, RURI, SEL, SIL
+from .summary import BMUPeriod
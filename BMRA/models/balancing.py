@@ -10,6 +10,7 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from GBEnergyDataManager.settings import BMRA_DATA_START_DATE
 from .core import BMU
+from .profiles import PackedLevelsModel
 
 def check_dates(value):
     """
@@ -18,7 +19,7 @@ def check_dates(value):
     if value < BMRA_DATA_START_DATE or value > dt.date.today():
         raise ValidationError('Date or timestamp not in valid BMRA range')
 
-class BOAL(models.Model):
+class BOAL(PackedLevelsModel):
     """
     Bid-offer acceptance level (prior to P217 implementation on 2009-11-09)
     """
@@ -33,6 +34,9 @@ class BOAL(models.Model):
                               validators=[check_dates])
     ad = models.BooleanField(verbose_name='Deemed bid-offer flag',
                              help_text='True for an acceptance of a bid-offer')
+    level_relation = 'boallevel_set'
+    level_value_field = 'va'
+
     class Meta:
         db_table = 'bmra_boal'
         index_together = ('bmu', 'ta')
@@ -51,7 +55,7 @@ class BOALlevel(models.Model):
         index_together = ('boal', 'ts')
 
 
-class BOALF(models.Model):
+class BOALF(PackedLevelsModel):
     """
     Bid-offer acceptance level flagged (following P217 implementation on 2009-11-09)
     """
@@ -83,6 +87,9 @@ class BOALF(models.Model):
                              Reserve schedule',
                              blank=True,
                              null=True)
+    level_relation = 'boalflevel_set'
+    level_value_field = 'va'
+
     class Meta:
         db_table = 'bmra_boalf'
         index_together = ('bmu', 'ta')
@@ -130,7 +137,7 @@ class BOD(models.Model):
                             help_text='MW')
     class Meta:
         db_table = 'bmra_bod'
-        index_together = ('bmu', 'sd', 'sp')
+        unique_together = ('bmu', 'sd', 'sp', 'nn', 'ts')
 
 class BOAV(models.Model):
     """
@@ -158,7 +165,7 @@ class BOAV(models.Model):
                              help_text='True indicates acceptance was short duration')
     class Meta:
         db_table = 'bmra_boav'
-        index_together = ('bmu', 'sd', 'sp')
+        unique_together = ('bmu', 'sd', 'sp', 'nn', 'nk')
 
 class DISPTAV(models.Model):
     """
@@ -217,9 +224,9 @@ class EBOCF(models.Model):
                            help_text='£')
     class Meta:
         db_table = 'bmra_ebocf'
-        index_together = ('bmu', 'sd', 'sp')
+        unique_together = ('bmu', 'sd', 'sp', 'nn')
 
-class FPN(models.Model):
+class FPN(PackedLevelsModel):
     """
     Final physical notification
     """
@@ -231,10 +238,12 @@ class FPN(models.Model):
     sp = models.IntegerField(verbose_name='Settlement period',
                              validators=[MinValueValidator(1),
                                          MaxValueValidator(50)])
+    level_relation = 'fpnlevel_set'
+    level_value_field = 'vp'
 
     class Meta:
         db_table = 'bmra_fpn'
-        index_together = ('bmu', 'sd', 'sp')
+        unique_together = ('bmu', 'sd', 'sp')
 
 class FPNlevel(models.Model):
     """
@@ -249,7 +258,7 @@ class FPNlevel(models.Model):
         db_table = 'bmra_fpnlevel'
         index_together = ('fpn', 'ts')
 
-class MEL(models.Model):
+class MEL(PackedLevelsModel):
     """
     Maximum export limit
     """
@@ -261,6 +270,9 @@ class MEL(models.Model):
     sp = models.IntegerField(verbose_name='Settlement period',
                              validators=[MinValueValidator(1),
                                          MaxValueValidator(50)])
+    level_relation = 'mellevel_set'
+    level_value_field = 've'
+
     class Meta:
         db_table = 'bmra_mel'
         index_together = ('bmu', 'sd', 'sp')
@@ -278,7 +290,7 @@ class MELlevel(models.Model):
         db_table = 'bmra_mellevel'
         index_together = ('mel', 'ts')
 
-class MIL(models.Model):
+class MIL(PackedLevelsModel):
     """
     Minimum import limit
     """
@@ -290,6 +302,9 @@ class MIL(models.Model):
     sp = models.IntegerField(verbose_name='Settlement period',
                              validators=[MinValueValidator(1),
                                          MaxValueValidator(50)])
+    level_relation = 'millevel_set'
+    level_value_field = 'vf'
+
     class Meta:
         db_table = 'bmra_mil'
         index_together = ('bmu', 'sd', 'sp')
@@ -348,7 +363,7 @@ class QAS(models.Model):
         db_table = 'bmra_qas'
         index_together = ('bmu', 'sd', 'sp')
 
-class QPN(models.Model):
+class QPN(PackedLevelsModel):
     """
     Quiescent physical notification
     """
@@ -360,6 +375,9 @@ class QPN(models.Model):
     sp = models.IntegerField(verbose_name='Settlement period',
                              validators=[MinValueValidator(1),
                                          MaxValueValidator(50)])
+    level_relation = 'qpnlevel_set'
+    level_value_field = 'vp'
+
     class Meta:
         db_table = 'bmra_qpn'
         index_together = ('bmu', 'sd', 'sp')
@@ -21,6 +21,33 @@ class ProcessedMessage(models.Model):
         index_together = ('timestamp', 'subject')
 
 
+class ProcessedFile(models.Model):
+    """
+    Ingestion ledger entry for a downloaded BMRA or P114 file
+    """
+    STATUS_CHOICES = (('started', 'Started'),
+                      ('completed', 'Completed'),
+                      ('failed', 'Failed'))
+    filename = models.CharField(max_length=100, unique=True)
+    source = models.CharField(max_length=10)
+    checksum = models.CharField(max_length=64, verbose_name='SHA-256 checksum')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    message_count = models.IntegerField(blank=True, null=True)
+    insert_count = models.IntegerField(blank=True, null=True)
+    duplicate_count = models.IntegerField(blank=True, null=True)
+    started = models.DateTimeField()
+    finished = models.DateTimeField(blank=True, null=True)
+    duration = models.FloatField(blank=True, null=True, help_text='s')
+    error = models.TextField(blank=True)
+
+    class Meta:
+        db_table = 'bmra_processedfile'
+        index_together = ('source', 'status')
+
+    def __str__(self):
+        return '{} {}'.format(self.filename, self.status)
+
+
 class BMU(models.Model):
     """
     Balancing Mechanism Unit
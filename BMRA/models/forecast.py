@@ -39,7 +39,7 @@ class DF(models.Model):
 
     class Meta:
         db_table = 'bmra_df'
-        index_together = ('zi', 'sd', 'sp', 'tp')
+        unique_together = ('zi', 'sd', 'sp', 'tp')
 
 
 class NDF(models.Model):
@@ -216,4 +216,4 @@ class FUELHH(models.Model):
                              help_text='MW')
     class Meta:
         db_table = 'bmra_fuelhh'
-        index_together = ['sd', 'sp', 'tp']
+        unique_together = ['sd', 'sp', 'tp', 'ft']
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Packed storage of the levels (timestamped spot points) of FPN, MEL, MIL,
+QPN, BOAL and BOALF submissions
+
+By default each level is held as a row of the related level table (e.g.
+FPNlevel). Where the BMRA_LEVEL_STORAGE setting is 'packed', the levels of
+each submission are instead held on the submission itself, as a binary
+array of timestamps and values, avoiding a level row (and its index
+entries) per spot point. get_levels returns the same points in either case
+"""
+from __future__ import unicode_literals
+
+import datetime as dt
+import numpy as np
+from django.conf import settings
+from django.db import models
+
+# each level is packed as a little-endian int64 timestamp (seconds since
+# the epoch, UTC) followed by a float64 value, so that the packed levels of
+# many submissions may be concatenated and unpacked as a single array
+LEVEL_DTYPE = np.dtype([('ts', '<i8'), ('value', '<f8')])
+
+LEVEL_STORAGE_MODES = ('rows', 'packed')
+
+
+def use_packed_levels():
+    """
+    Checks whether levels of new submissions are to be stored packed, as per
+    the BMRA_LEVEL_STORAGE setting ('rows' if not set)
+    """
+    storage = getattr(settings, 'BMRA_LEVEL_STORAGE', 'rows')
+    if storage not in LEVEL_STORAGE_MODES:
+        raise ValueError('BMRA_LEVEL_STORAGE must be one of {}'.format(LEVEL_STORAGE_MODES))
+    return storage == 'packed'
+
+
+def pack_levels(levels):
+    """
+    Packs levels as a binary array, ordered by timestamp
+
+    Parameters
+    ----------
+    levels : iterable
+        (timestamp, value) pairs, timestamps being timezone-aware datetimes
+
+    Returns
+    -------
+    bytes
+        the packed levels, as per LEVEL_DTYPE
+    """
+    # the sort is stable, so levels with equal timestamps keep the order
+    # given, as do level rows ordered by timestamp and id
+    array = np.array([(int(ts.timestamp()), value)
+                      for ts, value in sorted(levels, key=lambda level: level[0])],
+                     dtype=LEVEL_DTYPE)
+    return array.tobytes()
+
+
+def unpack_levels(packed):
+    """
+    Unpacks levels packed by pack_levels
+
+    Parameters
+    ----------
+    packed : bytes
+        the packed levels (or a memoryview, as returned by psycopg2)
+
+    Returns
+    -------
+    list
+        (timestamp, value) pairs, ordered by timestamp, timestamps being
+        datetimes in UTC
+    """
+    array = np.frombuffer(bytes(packed), dtype=LEVEL_DTYPE)
+    return [(dt.datetime.fromtimestamp(int(ts), tz=dt.timezone.utc), float(value))
+            for ts, value in array]
+
+
+class PackedLevelsModel(models.Model):
+    """
+    Abstract model of a submission with levels, which may be held packed on
+    the submission or as rows of a related level table
+    """
+    levels = models.BinaryField(verbose_name='Packed levels',
+                                help_text='Timestamps and values of levels, if stored packed',
+                                blank=True,
+                                null=True)
+
+    # related name of the level table and name of its value field, set by
+    # each subclass
+    level_relation = None
+    level_value_field = None
+
+    class Meta:
+        abstract = True
+
+    def get_levels(self):
+        """
+        Returns the levels of the submission, ordered by timestamp, whether
+        stored packed or as level rows
+
+        Returns
+        -------
+        list
+            (timestamp, value) pairs
+        """
+        if self.levels is not None:
+            return unpack_levels(self.levels)
+        return list(getattr(self, self.level_relation)
+                    .order_by('ts', 'id')
+                    .values_list('ts', self.level_value_field))
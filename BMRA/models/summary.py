@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Models of derived BMU-level data, materialised from the raw BMRA and P114
+data after ingestion
+"""
+from __future__ import unicode_literals
+
+from django.db import models
+from django.core.validators import MinValueValidator, MaxValueValidator
+from .core import BMU
+
+
+class BMUPeriod(models.Model):
+    """
+    Summary of a BMU in a settlement period, with one row per BMU and
+    settlement period for which any data is held
+    """
+    bmu = models.ForeignKey(BMU, on_delete=models.PROTECT)
+    sd = models.DateField(verbose_name='Settlement date')
+    sp = models.IntegerField(verbose_name='Settlement period',
+                             validators=[MinValueValidator(1),
+                                         MaxValueValidator(50)])
+    fpn = models.FloatField(verbose_name='FPN energy',
+                            help_text='MWh',
+                            blank=True,
+                            null=True)
+    mel = models.FloatField(verbose_name='MEL energy',
+                            help_text='MWh, from the most recently received MEL',
+                            blank=True,
+                            null=True)
+    bav = models.FloatField(verbose_name='Bid acceptance volume',
+                            help_text='MWh',
+                            blank=True,
+                            null=True)
+    oav = models.FloatField(verbose_name='Offer acceptance volume',
+                            help_text='MWh',
+                            blank=True,
+                            null=True)
+    bid_cashflow = models.FloatField(verbose_name='Bid cashflow',
+                                     help_text='£',
+                                     blank=True,
+                                     null=True)
+    offer_cashflow = models.FloatField(verbose_name='Offer cashflow',
+                                       help_text='£',
+                                       blank=True,
+                                       null=True)
+    metered = models.FloatField(verbose_name='Metered volume',
+                                help_text='MWh, from the latest settlement run',
+                                blank=True,
+                                null=True)
+
+    class Meta:
+        db_table = 'bmra_bmuperiod'
+        unique_together = ('bmu', 'sd', 'sp')
+        index_together = ('sd', 'sp')
+
+    def __str__(self):
+        return '{} {} {}'.format(self.bmu_id, self.sd, self.sp)
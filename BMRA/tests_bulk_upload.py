@@ -0,0 +1,286 @@
+"""
+Tests for batched insertion of BMRA messages
+
+Each test inserts the same messages through insert_data and through
+BulkInserter, checking that the resulting rows and insert logs match
+"""
+from __future__ import unicode_literals
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from BMRA.management.commands._upload_functions import message_to_dict, insert_data,\
+    merge_insert_log, new_insert_log
+from BMRA.management.commands._bulk_upload_functions import BulkInserter
+from BMRA.management.commands._copy_functions import rows_to_csv
+from BMRA.management.commands._conflict_functions import get_unique_key, \
+    insert_ignore_conflicts, remove_duplicates
+from BMRA.management.commands._reference_functions import ReferenceCache
+from BMRA.models import BMU, FT, ZI, FPN, FPNlevel, MEL, MELlevel, BOALF, BOALFlevel, BOD, \
+    BOAV, EBOCF, FREQ, FUELHH, DF, UOU2T14D, SOSO, SEL
+
+# models populated by the test messages, in the order in which entries may
+# be deleted
+TEST_MODELS = [FPNlevel, MELlevel, BOALFlevel, FPN, MEL, BOALF, BOD, BOAV, EBOCF, FREQ, FUELHH,
+               DF, UOU2T14D, SOSO, SEL, BMU, FT, ZI]
+
+FPN_STRS = ['2017:03:29:00:02:03:GMT: subject=BMRA.BM.T_ABTH9.FPN, '
+            'message={SD=2017:03:29:00:00:00:GMT,SP=5,NP=2,'
+            'TS=2017:03:29:01:00:00:GMT,VP=0.0,TS=2017:03:29:01:30:00:GMT,VP=0.0}',
+            '2017:03:29:00:02:03:GMT: subject=BMRA.BM.T_DRAXX2.FPN, '
+            'message={SD=2017:03:29:00:00:00:GMT,SP=5,NP=2,'
+            'TS=2017:03:29:01:00:00:GMT,VP=400.0,TS=2017:03:29:01:30:00:GMT,VP=410.0}']
+FREQ_STR = '2017:03:29:00:02:03:GMT: subject=BMRA.SYSTEM.FREQ, '\
+           'message={TS=2017:03:29:00:00:00:GMT,SF=50.1,TS=2017:03:29:00:00:15:GMT,SF=49.9}'
+UOU_STR = '2017:03:29:00:02:03:GMT: subject=BMRA.SYSTEM.T_DRAXX1.UOU2T14D, '\
+          'message={TP=2017:03:29:00:00:00:GMT,NR=1,FT=COAL,SD=2017:03:30:00:00:00:GMT,OU=600}'
+FUELHH_STR = '2017:03:29:00:02:03:GMT: subject=BMRA.SYSTEM.FUELHH, '\
+             'message={TP=2017:03:29:00:05:00:GMT,SD=2017:03:29:00:00:00:GMT,SP=5,FT=CCGT,FG=10000}'
+
+# messages covering each shape of bulk definition, as per
+# BULK_INSERT_DEFINITIONS, and messages passed through to insert_data
+SHAPE_STRS = {
+    'level, sd range': FPN_STRS,
+    'level, received time in key': [
+        '2017:03:29:00:02:16:GMT: subject=BMRA.BM.T_SIZB2.MEL, '
+        'message={SD=2017:03:29:00:00:00:GMT,SP=5,NP=2,'
+        'TS=2017:03:29:01:00:00:GMT,VE=602.0,TS=2017:03:29:01:30:00:GMT,VE=602.0}'],
+    'level, ts range': [
+        '2017:04:21:00:00:43:GMT: subject=BMRA.BM.T_SCCL1.BOALF, '
+        'message={NK=52908,SO=T,PF=F,TA=2017:04:20:23:59:00:GMT,AD=F,NP=4,'
+        'TS=2017:04:21:00:05:00:GMT,VA=367.0,TS=2017:04:21:00:09:00:GMT,VA=310.0,'
+        'TS=2017:04:21:00:35:00:GMT,VA=310.0,TS=2017:04:21:00:39:00:GMT,VA=367.0}'],
+    'data points count': [
+        '2017:03:29:00:02:02:GMT: subject=BMRA.BM.T_DRAXX1.BOD.4, '
+        'message={SD=2017:03:29:00:00:00:GMT,SP=5,NN=4,OP=45.0,BP=250.0,NP=2,'
+        'TS=2017:03:29:01:00:00:GMT,VB=645.0,TS=2017:03:29:01:30:00:GMT,VB=645.0}'],
+    'sd range, unique key': [
+        '2017:04:21:00:21:54:GMT: subject=BMRA.BM.T_EECL-1.BOAV.1, '
+        'message={SD=2017:04:21:00:00:00:GMT,SP=2,NN=1,NK=88365,OV=0.0833,BV=0.0,SA=L}',
+        '2017:04:21:00:21:54:GMT: subject=BMRA.BM.T_EECL-1.EBOCF.1, '
+        'message={SD=2017:04:21:00:00:00:GMT,SP=2,NN=1,OC=4.95,BC=0.0}'],
+    'per point, tp range': [
+        '2009:01:01:00:16:52:GMT: subject=BMRA.SYSTEM.DF.A, '
+        'message={ZI=A,NR=2,TP=2008:12:31:23:47:00:GMT,SD=2009:01:01:00:00:00:GMT,SP=1,'
+        'VD=6177.0,TP=2009:01:01:00:16:00:GMT,SD=2009:01:01:00:00:00:GMT,SP=2,VD=6210.0}',
+        '2017:04:21:12:40:35:GMT: subject=BMRA.SYSTEM.2__PPGEN001.UOU2T14D, '
+        'message={TP=2017:04:21:12:38:00:GMT,NR=2,SD=2017:04:23:00:00:00:GMT,FT=WIND,OU=12.0,'
+        'SD=2017:04:24:00:00:00:GMT,FT=WIND,OU=26.0}'],
+    'tp range': [FUELHH_STR],
+    'ts range': [FREQ_STR],
+    'st range': [
+        '2017:04:21:00:10:51:GMT: subject=BMRA.SYSTEM.SOSO, '
+        'message={TT=EWIC_NG,ST=2017:04:21:02:00:00:GMT,TD=A02,'
+        'IC=NG_20170421_0200_1,TQ=25.0,PT=39.75}'],
+    'not defined': [
+        '2017:04:21:01:21:21:GMT: subject=BMRA.DYNAMIC.T_ROCK-1.SEL, '
+        'message={TE=2017:04:21:01:20:00:GMT,SE=240.0}'],
+}
+
+
+def insert_serial(message_strs):
+    """inserts messages one at a time using insert_data"""
+    combined_insert_log = new_insert_log()
+    for message_str in message_strs:
+        merge_insert_log(combined_insert_log, insert_data(message_to_dict(message_str)))
+    return combined_insert_log
+
+
+def insert_batched(message_strs, batch_size, loader='orm'):
+    """inserts messages in batches using BulkInserter"""
+    bulk_inserter = BulkInserter(batch_size=batch_size, loader=loader)
+    for message_str in message_strs:
+        bulk_inserter.add(message_to_dict(message_str))
+    return bulk_inserter.close()
+
+
+def model_contents(model):
+    """
+    returns the entries of a model, with any reference to a parent entry
+    given by the BMU and received time of the parent rather than its id
+    """
+    fields = []
+    for field in model._meta.concrete_fields:
+        if field is model._meta.auto_field:
+            continue
+        if field.is_relation and field.related_model._meta.auto_field is not None:
+            fields.extend([field.name + '__bmu_id', field.name + '__ts'])
+        else:
+            fields.append(field.attname)
+    return sorted(model.objects.values_list(*fields), key=repr)
+
+
+def table_contents():
+    """returns the contents of the tables populated by the test messages"""
+    return [model_contents(model) for model in TEST_MODELS]
+
+
+def clear_tables():
+    """removes all entries from the tables populated by the test messages"""
+    for model in TEST_MODELS:
+        model.objects.all().delete()
+
+
+def drop_unique_constraint(model):
+    """drops the natural key constraint of a model, so that duplicates may be created"""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # deferred foreign key checks prevent the table being altered
+            cursor.execute('set constraints all immediate')
+        for name, constraint in connection.introspection.get_constraints(cursor, table).items():
+            if constraint['unique'] and constraint['columns'] == list(get_unique_key(model)):
+                if connection.vendor == 'sqlite':
+                    cursor.execute('drop index {}'.format(connection.ops.quote_name(name)))
+                else:
+                    cursor.execute('alter table {} drop constraint {}'.format(
+                        connection.ops.quote_name(table), connection.ops.quote_name(name)))
+
+
+class BulkInsertCase(TestCase):
+    """
+    Tests for BulkInserter
+    """
+
+    def assertMatchesSerial(self, message_strs, batch_size, loader='orm'):
+        """checks batched insertion gives the same result as serial insertion"""
+        clear_tables()
+        serial_log = insert_serial(message_strs)
+        serial_contents = table_contents()
+        clear_tables()
+        batched_log = insert_batched(message_strs, batch_size, loader)
+        self.assertEqual(table_contents(), serial_contents)
+        self.assertEqual(sorted(batched_log['new_bmus']), sorted(serial_log['new_bmus']))
+        for key in ['inserts', 'duplicate_msg', 'unprocessed_msg']:
+            self.assertEqual(batched_log[key], serial_log[key])
+
+    def test_bulk_insert(self):
+        """batched insertion matches insert_data"""
+        self.assertMatchesSerial(FPN_STRS + [FREQ_STR], batch_size=10)
+
+    def test_bulk_insert_duplicates(self):
+        """duplicates within and across batches are logged and not inserted"""
+        self.assertMatchesSerial(FPN_STRS + [FREQ_STR] + FPN_STRS + [FREQ_STR], batch_size=1)
+        self.assertMatchesSerial(FPN_STRS * 3, batch_size=2)
+
+    def test_bulk_insert_shapes(self):
+        """batched insertion matches insert_data for each shape of bulk definition"""
+        for shape, message_strs in SHAPE_STRS.items():
+            with self.subTest(shape=shape):
+                self.assertMatchesSerial(message_strs * 2, batch_size=1)
+                self.assertMatchesSerial(message_strs, batch_size=10)
+        all_strs = [message_str for message_strs in SHAPE_STRS.values()
+                    for message_str in message_strs]
+        self.assertMatchesSerial(all_strs + all_strs[::-1], batch_size=3)
+
+    def test_bulk_insert_existing(self):
+        """entries already in the database are detected in one query per subtype"""
+        clear_tables()
+        insert_serial(FPN_STRS + [FREQ_STR])
+        # one query for the existing BMUs, the FPN insert (skipping existing
+        # keys) and a query for the existing FREQ keys
+        with self.assertNumQueries(3):
+            insert_log = insert_batched(FPN_STRS + [FREQ_STR], batch_size=10)
+        self.assertEqual(insert_log['inserts'], {})
+        self.assertEqual(insert_log['duplicate_msg'], {'FPN': 2, 'FREQ': 1})
+
+    def test_insert_ignore_conflicts(self):
+        """entries with existing natural keys are skipped, with keys of new entries set"""
+        clear_tables()
+        insert_serial(FPN_STRS[:1])
+        bmu = BMU.objects.create(id='T_DRAXX2')
+        fpns = [FPN(bmu=BMU.objects.get(id='T_ABTH9'), ts=FPN.objects.get().ts,
+                    sd=FPN.objects.get().sd, sp=5),
+                FPN(bmu=bmu, ts=FPN.objects.get().ts, sd=FPN.objects.get().sd, sp=5)]
+        self.assertEqual(insert_ignore_conflicts(fpns), fpns[1:])
+        self.assertIsNone(fpns[0].pk)
+        self.assertEqual(FPN.objects.get(bmu=bmu).pk, fpns[1].pk)
+        self.assertEqual(insert_ignore_conflicts(fpns), [])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            FPN.objects.create(bmu=bmu, ts=fpns[1].ts, sd=fpns[1].sd, sp=5)
+
+    def test_remove_duplicates(self):
+        """all but the first entry of each natural key are removed, with their levels"""
+        clear_tables()
+        drop_unique_constraint(FPN)
+        insert_serial(FPN_STRS)
+        first_pks = sorted(FPN.objects.values_list('pk', flat=True))
+        levels = model_contents(FPNlevel)
+        for fpn in list(FPN.objects.all()):
+            for offset in [1.0, 2.0]:
+                duplicate = FPN.objects.create(bmu_id=fpn.bmu_id, ts=fpn.ts, sd=fpn.sd, sp=fpn.sp)
+                FPNlevel.objects.bulk_create([FPNlevel(fpn=duplicate, ts=level.ts,
+                                                       vp=level.vp + offset)
+                                              for level in fpn.fpnlevel_set.all()])
+        self.assertEqual(FPNlevel.objects.count(), 3 * len(levels))
+        self.assertEqual(remove_duplicates(FPN, batch_size=3), 4)
+        self.assertEqual(sorted(FPN.objects.values_list('pk', flat=True)), first_pks)
+        self.assertEqual(model_contents(FPNlevel), levels)
+        self.assertEqual(remove_duplicates(FPN), 0)
+
+    def test_bulk_insert_copy(self):
+        """loading levels with COPY (or the ORM where not supported) matches insert_data"""
+        self.assertMatchesSerial(FPN_STRS + [FREQ_STR] + FPN_STRS, batch_size=2, loader='copy')
+
+    def test_rows_to_csv(self):
+        """values are formatted for COPY"""
+        import datetime as dt
+        from django.utils import timezone
+        csv_file = rows_to_csv([('T_ABTH9', dt.date(2017, 3, 29), 5,
+                                 dt.datetime(2017, 3, 29, 1, tzinfo=timezone.utc), 0.5, True, None)])
+        self.assertEqual(csv_file.read(),
+                         'T_ABTH9,2017-03-29,5,2017-03-29T01:00:00+00:00,0.5,t,\r\n')
+
+
+class ReferenceCacheCase(TestCase):
+    """
+    Tests for creating and looking up referenced BMUs etc. using ReferenceCache
+    """
+
+    def test_create_references(self):
+        """referenced entries are created in bulk, with new BMUs logged as per insert_data"""
+        BMU.objects.create(id='T_ABTH9')
+        message_dicts = [message_to_dict(message_str)
+                         for message_str in [UOU_STR] + FPN_STRS + [FUELHH_STR]]
+        reference_cache = ReferenceCache()
+        with self.assertNumQueries(4):
+            new_bmus = reference_cache.create_references(message_dicts)
+        # T_DRAXX1 is first referenced by a SYSTEM message, so is not logged
+        self.assertEqual(new_bmus, ['T_DRAXX2'])
+        self.assertEqual(sorted(BMU.objects.values_list('id', flat=True)),
+                         ['T_ABTH9', 'T_DRAXX1', 'T_DRAXX2'])
+        self.assertEqual(sorted(FT.objects.values_list('id', flat=True)), ['CCGT', 'COAL'])
+        with self.assertNumQueries(0):
+            self.assertEqual(reference_cache.get(BMU, 'T_DRAXX1')[1], False)
+            self.assertEqual(reference_cache.create_references(message_dicts), [])
+
+    def test_insert_with_cache(self):
+        """insertion using the cache matches insert_data without"""
+        clear_tables()
+        serial_log = insert_serial(FPN_STRS * 2)
+        serial_contents = table_contents()
+        clear_tables()
+        reference_cache = ReferenceCache()
+        combined_insert_log = new_insert_log()
+        for message_str in FPN_STRS * 2:
+            merge_insert_log(combined_insert_log,
+                             insert_data(message_to_dict(message_str), reference_cache))
+        self.assertEqual(table_contents(), serial_contents)
+        self.assertEqual(combined_insert_log, serial_log)
+
+    def test_concurrent_references(self):
+        """entries created by another inserter since ids were loaded are skipped, not logged"""
+        clear_tables()
+        first_inserter = BulkInserter(batch_size=10)
+        second_inserter = BulkInserter(batch_size=10)
+        for bulk_inserter in [first_inserter, second_inserter]:
+            bulk_inserter.reference_cache.get_known_ids(BMU)
+        first_inserter.add(message_to_dict(FPN_STRS[0]))
+        self.assertEqual(first_inserter.close()['new_bmus'], ['T_ABTH9'])
+        second_inserter.add(message_to_dict(FPN_STRS[0].replace('SP=5', 'SP=6')))
+        insert_log = second_inserter.close()
+        self.assertEqual(insert_log['new_bmus'], [])
+        self.assertEqual(insert_log['inserts'], {'fpn': 1})
+        reference_cache = ReferenceCache()
+        reference_cache.get_known_ids(BMU)
+        BMU.objects.create(id='T_DRAXX2')
+        self.assertEqual(reference_cache.get(BMU, 'T_DRAXX2')[1], False)
+        self.assertEqual(reference_cache.create(BMU, ['T_DRAXX2', 'T_DRAXX1']), ['T_DRAXX1'])
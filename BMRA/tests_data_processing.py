@@ -10,8 +10,14 @@ Unit tests for the data processing functions
 
 import unittest
 import datetime as dt
+import gzip
+import os
+import tempfile
+import timeit
 from django.utils import timezone
 from BMRA.management.commands._upload_functions import message_to_dict, message_part_to_points
+from BMRA.management.commands._download_functions import read_bmra_messages, parse_bmra_messages
+from BMRA.management.commands._data_definitions import cast_timestamp, cast_date
 
 unittest.TestCase.maxDiff = None
 
@@ -6514,5 +6520,127 @@ Note	This warning may supersede an NGC System Warning of High Risk of Demand Red
         self.assertEqual(message_to_dict(input_str), expected_dict)
 
 
+class FileReadingTestCase(unittest.TestCase):
+    """
+    Tests reading and parsing of messages from gzipped BMRA files
+    """
+
+    def test_read_bmra_messages(self):
+        """
+        test messages are read in full regardless of decompression chunk size
+        """
+        messages = ['2017:03:29:00:02:03:GMT: subject=BMRA.BM.T_ABTH9.FPN, '
+                    'message={SD=2017:03:29:00:00:00:GMT,SP=5,NP=2,'
+                    'TS=2017:03:29:01:00:00:GMT,VP=0.0,TS=2017:03:29:01:30:00:GMT,VP=0.0}',
+                    '\n2017:03:29:00:02:03:GMT: subject=BMRA.SYSTEM.SYSMSG, '
+                    'message={TP=2017:03:29:00:02:00:GMT,MT=Information,SM=\u00a3100}',
+                    '\n\n']
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, 'tib_messages.2017-03-29.gz')
+            with gzip.open(file_path, 'wb') as file:
+                file.write(''.join(messages).encode('utf-8'))
+            for chunk_size in [1, 7, 1048576]:
+                self.assertEqual(list(read_bmra_messages(file_path, chunk_size)),
+                                 messages[:2])
+
+    def test_parse_bmra_messages(self):
+        """
+        test parsing in worker processes matches parsing in the current process
+        """
+        messages = ['2017:03:29:00:02:03:GMT: subject=BMRA.BM.T_ABTH9.FPN, '
+                    'message={SD=2017:03:29:00:00:00:GMT,SP=%d,NP=2,'
+                    'TS=2017:03:29:01:00:00:GMT,VP=0.0,TS=2017:03:29:01:30:00:GMT,VP=0.0}' % sp
+                    for sp in range(1, 11)]
+        self.assertEqual(list(parse_bmra_messages(messages, parse_workers=2, chunk_size=3)),
+                         [message_to_dict(message) for message in messages])
+
+
+class ParserBenchmarkTestCase(unittest.TestCase):
+    """
+    Compares the compiled message parsers with generic parsing. The timing
+    benchmark only runs if the BMRA_PARSER_BENCHMARK environment variable
+    is set
+    """
+    messages = ['2017:03:29:00:02:02:GMT: subject=BMRA.BM.T_DRAXX1.BOD.4, '
+                'message={SD=2017:03:29:00:00:00:GMT,SP=5,NN=4,OP=45.0,BP=250.0,NP=2,'
+                'TS=2017:03:29:01:00:00:GMT,VB=645.0,TS=2017:03:29:01:30:00:GMT,VB=645.0}',
+                '2017:04:21:00:00:43:GMT: subject=BMRA.BM.T_SCCL1.BOALF, '
+                'message={NK=52908,SO=T,PF=F,TA=2017:04:20:23:59:00:GMT,AD=F,NP=4,'
+                'TS=2017:04:21:00:05:00:GMT,VA=367.0,TS=2017:04:21:00:09:00:GMT,VA=310.0,'
+                'TS=2017:04:21:00:35:00:GMT,VA=310.0,TS=2017:04:21:00:39:00:GMT,VA=367.0}',
+                '2017:03:29:00:02:16:GMT: subject=BMRA.BM.T_SIZB2.MEL, '
+                'message={SD=2017:03:29:00:00:00:GMT,SP=5,NP=2,'
+                'TS=2017:03:29:01:00:00:GMT,VE=602.0,TS=2017:03:29:01:30:00:GMT,VE=602.0}',
+                '2017:03:29:00:00:52:GMT: subject=BMRA.SYSTEM.FREQ, '
+                'message={TS=2017:03:28:23:58:00:GMT,SF=50.058}',
+                '2017:03:29:00:01:10:GMT: subject=BMRA.SYSTEM.FUELINST, '
+                'message={TP=2017:03:29:00:00:00:GMT,SD=2017:03:29:00:00:00:GMT,SP=2,'
+                'TS=2017:03:28:23:55:00:GMT,FT=CCGT,FG=10374}',
+                '2003:01:01:00:20:32:GMT: subject=BMRA.SYSTEM.EBSP, '
+                'message={SD=2002:12:31:00:00:00:GMT,SP=48,PB=15.13,PS=11.10644,'
+                'AO=307.2657,AB=-686.525,AP=36.6594,AC=0.0,PP=5.0,PC=-420.9187,'
+                'BD=F,A1=-5248.75,A2=-417.5,A3=0.0,A4=0.0,A5=0.0,A6=0.0}',
+                '2017:04:21:01:21:21:GMT: subject=BMRA.DYNAMIC.T_ROCK-1.SEL, '
+                'message={TE=2017:04:21:01:20:00:GMT,SE=240.0}']
+
+    def test_compiled_parser_output(self):
+        """
+        test compiled parsers give identical output to generic parsing
+        """
+        for message in self.messages:
+            self.assertEqual(message_to_dict(message, compiled=True),
+                             message_to_dict(message, compiled=False))
+
+    @unittest.skipUnless(os.environ.get('BMRA_PARSER_BENCHMARK'),
+                         'set BMRA_PARSER_BENCHMARK to time message parsing')
+    def test_compiled_parser_benchmark(self):
+        """
+        report messages/sec for compiled and generic parsing
+        """
+        # modes are timed alternately, taking the fastest of several rounds
+        repeats = 200
+        durations = {False: [], True: []}
+        for _ in range(5):
+            for compiled in durations:
+                durations[compiled].append(timeit.timeit(
+                    lambda: [message_to_dict(message, compiled=compiled) for message in self.messages],
+                    number=repeats))
+        rates = {compiled: repeats * len(self.messages) / min(durations[compiled])
+                 for compiled in durations}
+        print('\nmessage parsing: {:.0f} msgs/sec generic, {:.0f} msgs/sec compiled'.format(
+            rates[False], rates[True]))
+
+
+class CastingTestCase(unittest.TestCase):
+    """
+    Tests timestamp and date casting functions
+    """
+
+    def test_cast_timestamp(self):
+        """
+        test timestamps cast to tz-aware UTC datetimes, including repeats
+        """
+        for _ in range(2):
+            self.assertEqual(cast_timestamp('2017:03:29:01:30:00:GMT'),
+                             dt.datetime(2017, 3, 29, 1, 30, tzinfo=timezone.utc))
+            self.assertEqual(cast_timestamp('2017:03:29:01:30:00:GMT').utcoffset(),
+                             dt.timedelta(0))
+        # non fixed-width timestamps cast as per generic parsing
+        self.assertEqual(cast_timestamp('2017:3:29:1:30:GMT'),
+                         dt.datetime(2017, 3, 29, 1, 30, tzinfo=timezone.utc))
+        with self.assertRaises(ValueError):
+            cast_timestamp('2017:03:29:01:30:0::GMT')
+
+    def test_cast_date(self):
+        """
+        test dates cast to dates, ignoring any time component
+        """
+        self.assertEqual(cast_date('2017:03:29:00:00:00:GMT'), dt.date(2017, 3, 29))
+        self.assertEqual(cast_date('2017:03:29'), dt.date(2017, 3, 29))
+        self.assertEqual(cast_date('2017:3:29:00:00:00:GMT'), dt.date(2017, 3, 29))
+        with self.assertRaises(ValueError):
+            cast_date('2017:02:30:00:00:00:GMT')
+
+
 if __name__ == '__main__':
     unittest.main()
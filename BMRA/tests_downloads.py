@@ -0,0 +1,183 @@
+"""
+Tests for the asyncio file downloader, run against a local HTTP server
+standing in for the Elexon endpoints
+"""
+from __future__ import unicode_literals
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from BMRA.management.commands._async_download_functions import download_files, Prefetcher
+
+FILES = {'tib_messages.2017-03-{}.gz'.format(day): bytes(range(256)) * (day * 40)
+         for day in range(20, 26)}
+
+
+class ElexonStandIn(BaseHTTPRequestHandler):
+    """
+    Serves FILES at /download?key=...&filename=..., supporting Range
+    requests. Responses can be made to fail or be truncated by adding
+    filenames to the server's failures and truncations
+    """
+
+    def do_GET(self):
+        server = self.server
+        filename = parse_qs(urlparse(self.path).query)['filename'][0]
+        with server.lock:
+            server.requests.append((filename, self.headers.get('Range')))
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(server.delay)
+            if filename not in FILES:
+                self.send_error(404)
+                return
+            if server.failures.get(filename, 0) > 0:
+                server.failures[filename] -= 1
+                self.send_error(503)
+                return
+            content = FILES[filename]
+            start = 0
+            if self.headers.get('Range') is not None:
+                start = int(self.headers['Range'].split('=')[1].split('-')[0])
+                if start >= len(content):
+                    self.send_error(416)
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                    start, len(content) - 1, len(content)))
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(len(content) - start))
+            self.end_headers()
+            if server.truncations.get(filename, 0) > 0:
+                server.truncations[filename] -= 1
+                self.wfile.write(content[start:start + (len(content) - start) // 2])
+                self.close_connection = True
+                return
+            self.wfile.write(content[start:])
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadCase(unittest.TestCase):
+    """
+    Tests for concurrent downloads with retries and resumption
+    """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), ElexonStandIn)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.active = 0
+        self.server.max_active = 0
+        self.server.delay = 0
+        self.server.failures = {}
+        self.server.truncations = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def download(self, filename):
+        """returns the url and local file path for a filename"""
+        return ('http://127.0.0.1:{}/download?key=KEY&filename={}'.format(
+            self.server.server_address[1], filename),
+                os.path.join(self.temp_dir.name, filename))
+
+    def assertDownloaded(self, filename):
+        """checks the downloaded file matches the served file"""
+        with open(self.download(filename)[1], 'rb') as file:
+            self.assertEqual(file.read(), FILES[filename])
+        self.assertFalse(os.path.isfile(self.download(filename)[1] + '.part'))
+
+    def test_concurrency_limit(self):
+        """all files downloaded with no more than the limit in progress"""
+        self.server.delay = 0.1
+        download_files([self.download(filename) for filename in FILES], max_concurrency=2)
+        for filename in FILES:
+            self.assertDownloaded(filename)
+        self.assertEqual(self.server.max_active, 2)
+
+    def test_retry(self):
+        """temporary server errors are retried"""
+        self.server.failures = {'tib_messages.2017-03-20.gz': 2}
+        download_files([self.download('tib_messages.2017-03-20.gz')], backoff=0.01)
+        self.assertDownloaded('tib_messages.2017-03-20.gz')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retry_limit(self):
+        """errors are raised once retries are exhausted or not temporary"""
+        self.server.failures = {'tib_messages.2017-03-20.gz': 3}
+        with self.assertRaises(urllib.error.HTTPError):
+            download_files([self.download('tib_messages.2017-03-20.gz')], retries=2, backoff=0.01)
+        self.assertEqual(len(self.server.requests), 3)
+        with self.assertRaises(urllib.error.HTTPError):
+            download_files([self.download('tib_messages.2017-03-19.gz')], backoff=0.01)
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_resume(self):
+        """truncated downloads are resumed from the last byte received"""
+        self.server.truncations = {'tib_messages.2017-03-21.gz': 1}
+        download_files([self.download('tib_messages.2017-03-21.gz')], backoff=0.01)
+        self.assertDownloaded('tib_messages.2017-03-21.gz')
+        length = len(FILES['tib_messages.2017-03-21.gz'])
+        self.assertEqual(self.server.requests,
+                         [('tib_messages.2017-03-21.gz', None),
+                          ('tib_messages.2017-03-21.gz', 'bytes={}-'.format(length // 2))])
+
+    def test_resume_partial_file(self):
+        """partial files left by a previous run are resumed"""
+        url, file_path = self.download('tib_messages.2017-03-22.gz')
+        with open(file_path + '.part', 'wb') as file:
+            file.write(FILES['tib_messages.2017-03-22.gz'][:1000])
+        download_files([(url, file_path)])
+        self.assertDownloaded('tib_messages.2017-03-22.gz')
+        self.assertEqual(self.server.requests, [('tib_messages.2017-03-22.gz', 'bytes=1000-')])
+
+    def test_prefetch(self):
+        """prefetched files are downloaded in the background"""
+        self.server.delay = 0.1
+        with Prefetcher(max_concurrency=3) as prefetcher:
+            for filename in FILES:
+                prefetcher.prefetch(*self.download(filename))
+            for filename in sorted(FILES):
+                prefetcher.wait(self.download(filename)[1])
+                self.assertDownloaded(filename)
+        self.assertEqual(self.server.max_active, 3)
+
+    def test_prefetch_close(self):
+        """closing stops downloads in progress and cancels those not started"""
+        self.server.delay = 0.2
+        prefetcher = Prefetcher(max_concurrency=2)
+        for filename in FILES:
+            prefetcher.prefetch(*self.download(filename))
+        time.sleep(0.1)
+        prefetcher.close()
+        self.assertTrue(prefetcher.loop.is_closed())
+        self.assertFalse(any(thread.name.startswith('prefetch')
+                             for thread in threading.enumerate()))
+        contents = sorted(os.listdir(self.temp_dir.name))
+        time.sleep(0.3)
+        self.assertEqual(sorted(os.listdir(self.temp_dir.name)), contents)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_prefetch_workers(self):
+        """prefetching is rejected when days are processed in parallel"""
+        with self.assertRaises(CommandError):
+            call_command('BMRA_bulk_download', '2017-3-20', '2017-3-25',
+                         workers=2, prefetch=1, stdout=io.StringIO())
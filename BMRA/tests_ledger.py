@@ -0,0 +1,55 @@
+"""
+Tests for the ingestion ledger functions
+"""
+from __future__ import unicode_literals
+import os
+import tempfile
+from django.test import TestCase
+from BMRA.management.commands._ledger_functions import get_file_checksum, \
+    get_completed_entry, get_completed_filenames, get_first_incomplete, start_entry, \
+    finish_entry
+
+
+class LedgerCase(TestCase):
+    """
+    Tests for recording processed files in the ingestion ledger
+    """
+
+    def test_file_checksum(self):
+        """checksum is the SHA-256 digest of the file contents"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, 'tib_messages.2017-03-29.gz')
+            with open(file_path, 'wb') as file:
+                file.write(b'abc')
+            self.assertEqual(get_file_checksum(file_path, chunk_size=2),
+                             'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad')
+
+    def test_completed_entry(self):
+        """only files completed with the same checksum are returned"""
+        processed_file = start_entry('tib_messages.2017-03-29.gz', 'BMRA', 'abc')
+        self.assertIsNone(get_completed_entry('tib_messages.2017-03-29.gz'))
+        finish_entry(processed_file, {'count': 3, 'inserts': {'fpn': 2}, 'duplicate_msg': {'FPN': 1}})
+        completed_entry = get_completed_entry('tib_messages.2017-03-29.gz', 'abc')
+        self.assertEqual((completed_entry.message_count,
+                          completed_entry.insert_count,
+                          completed_entry.duplicate_count), (3, 2, 1))
+        self.assertIsNone(get_completed_entry('tib_messages.2017-03-29.gz', 'abd'))
+
+    def test_failed_entry(self):
+        """failed files are recorded with their error and not completed"""
+        processed_file = start_entry('tib_messages.2017-03-29.gz', 'BMRA', 'abc')
+        finish_entry(processed_file, error=ValueError('corrupt message'))
+        processed_file.refresh_from_db()
+        self.assertEqual(processed_file.status, 'failed')
+        self.assertEqual(processed_file.error, "ValueError ('corrupt message',)")
+        self.assertIsNone(get_completed_entry('tib_messages.2017-03-29.gz'))
+
+    def test_first_incomplete(self):
+        """resumes from the first file not completed"""
+        filenames = ['tib_messages.2017-03-{}.gz'.format(day) for day in range(27, 31)]
+        for filename in filenames[:2] + filenames[3:]:
+            finish_entry(start_entry(filename, 'BMRA', 'abc'), {'count': 0})
+        self.assertEqual(get_first_incomplete(filenames), 2)
+        self.assertEqual(get_completed_filenames(filenames), set(filenames[:2] + filenames[3:]))
+        finish_entry(start_entry(filenames[2], 'BMRA', 'abc'), {'count': 0})
+        self.assertEqual(get_first_incomplete(filenames), 4)
@@ -0,0 +1,102 @@
+"""
+Tests for the table partitioning functions
+"""
+from __future__ import unicode_literals
+import datetime as dt
+from unittest import skipUnless
+from django.db import connection, transaction, IntegrityError
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from BMRA.management.commands._partition_functions import get_partition_bounds, format_bound, \
+    get_constraints, get_partitions, partition_table, extend_partitions, detach_partitions
+from BMRA.models import BMU, FPN
+
+
+class PartitionCase(SimpleTestCase):
+    """
+    Tests for partition bounds
+    """
+
+    def test_get_partition_bounds(self):
+        """partitions cover whole months or years, including the end date"""
+        self.assertEqual(get_partition_bounds(dt.date(2018, 11, 15), dt.date(2019, 1, 1), 'month'),
+                         [('2018_11', dt.date(2018, 11, 1), dt.date(2018, 12, 1)),
+                          ('2018_12', dt.date(2018, 12, 1), dt.date(2019, 1, 1)),
+                          ('2019_01', dt.date(2019, 1, 1), dt.date(2019, 2, 1))])
+        self.assertEqual(get_partition_bounds(dt.date(2018, 11, 15), dt.date(2019, 1, 1), 'year'),
+                         [('2018', dt.date(2018, 1, 1), dt.date(2019, 1, 1)),
+                          ('2019', dt.date(2019, 1, 1), dt.date(2020, 1, 1))])
+        self.assertEqual(get_partition_bounds(dt.date(2019, 1, 1), dt.date(2018, 12, 31), 'year'),
+                         [])
+
+    def test_format_bound(self):
+        """timestamp bounds are midnight UTC"""
+        self.assertEqual(format_bound(dt.date(2018, 1, 1), 'date'), "'2018-01-01'")
+        self.assertEqual(format_bound(dt.date(2018, 1, 1), 'timestamp with time zone'),
+                         "'2018-01-01 00:00:00+00'")
+
+
+@skipUnless(connection.vendor == 'postgresql', 'partitioning requires PostgreSQL')
+class PartitionTableCase(TestCase):
+    """
+    Tests for partitioning a table, adding partitions and detaching them
+    """
+
+    def setUp(self):
+        self.bmu = BMU.objects.create(id='T_DRAXX2')
+        for sd in [dt.date(2018, 11, 15), dt.date(2018, 12, 10), dt.date(2019, 3, 1)]:
+            self.create_fpn(sd)
+        self.cursor = connection.cursor()
+        # foreign key checks of the rows created are deferred to the end of
+        # the transaction, which prevents the table being altered
+        self.cursor.execute('set constraints all immediate')
+        partition_table(self.cursor, 'bmra_fpn', 'sd', 'month', dt.date(2019, 1, 31))
+
+    def tearDown(self):
+        self.cursor.close()
+
+    def create_fpn(self, sd, sp=1):
+        return FPN.objects.create(bmu=self.bmu, sd=sd, sp=sp,
+                                  ts=timezone.make_aware(dt.datetime.combine(sd, dt.time(0))))
+
+    def count_rows(self, table):
+        self.cursor.execute('select count(*) from {}'.format(table))
+        return self.cursor.fetchone()[0]
+
+    def test_partition_table(self):
+        """rows are moved to their partitions, keeping keys and the id sequence"""
+        self.assertEqual([name for name, _, _ in get_partitions(self.cursor, 'bmra_fpn')],
+                         ['bmra_fpn_2018_11', 'bmra_fpn_2018_12', 'bmra_fpn_2019_01'])
+        self.assertEqual(FPN.objects.count(), 3)
+        self.assertEqual([self.count_rows('bmra_fpn_2018_11'),
+                          self.count_rows('bmra_fpn_2018_12'),
+                          self.count_rows('bmra_fpn_2019_01'),
+                          self.count_rows('bmra_fpn_default')], [1, 1, 0, 1])
+        constraints = {contype: sorted(columns)
+                       for _, contype, columns, _, _ in get_constraints(self.cursor, 'bmra_fpn')}
+        self.assertEqual(constraints['p'], ['id', 'sd'])
+        self.assertEqual(constraints['u'], ['bmu_id', 'sd', 'sp'])
+        last_id = FPN.objects.order_by('-id').values_list('id', flat=True)[0]
+        self.assertEqual(self.create_fpn(dt.date(2019, 1, 5)).id, last_id + 1)
+        self.assertEqual(self.count_rows('bmra_fpn_2019_01'), 1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.create_fpn(dt.date(2018, 12, 10))
+
+    def test_extend_partitions(self):
+        """rows are moved from the default partition to the partitions added"""
+        self.assertEqual(extend_partitions(self.cursor, 'bmra_fpn', 'sd', 'month',
+                                           dt.date(2019, 3, 31)), ['2019_02', '2019_03'])
+        self.assertEqual(self.count_rows('bmra_fpn_2019_03'), 1)
+        self.assertEqual(self.count_rows('bmra_fpn_default'), 0)
+        self.assertEqual(FPN.objects.count(), 3)
+        self.assertEqual(extend_partitions(self.cursor, 'bmra_fpn', 'sd', 'month',
+                                           dt.date(2019, 3, 31)), [])
+
+    def test_detach_partitions(self):
+        """detached partitions are kept as tables, their rows no longer in the table"""
+        self.assertEqual(detach_partitions(self.cursor, 'bmra_fpn', dt.date(2019, 1, 1)),
+                         ['bmra_fpn_2018_11', 'bmra_fpn_2018_12'])
+        self.assertEqual(FPN.objects.count(), 1)
+        self.assertEqual(self.count_rows('bmra_fpn_2018_11'), 1)
+        self.assertEqual([name for name, _, _ in get_partitions(self.cursor, 'bmra_fpn')],
+                         ['bmra_fpn_2019_01'])
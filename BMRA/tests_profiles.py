@@ -0,0 +1,115 @@
+"""
+Tests for packed storage of levels
+"""
+from __future__ import unicode_literals
+import datetime as dt
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from BMRA.management.commands._upload_functions import message_to_dict, insert_data
+from BMRA.management.commands._bulk_upload_functions import BulkInserter
+from BMRA.management.commands._summary_functions import query_fpn_volumes
+from BMRA.management.commands._aggregate_functions import get_BMU_timeseries
+from BMRA.management.commands._level_storage_functions import pack_entry_levels, \
+    unpack_entry_levels
+from BMRA.models import FPN, FPNlevel
+from BMRA.models.profiles import pack_levels, unpack_levels
+from BMRA.views import sum_fpn_levels
+
+FPN_STRS = ['2017:03:29:00:02:03:GMT: subject=BMRA.BM.T_ABTH9.FPN, '
+            'message={SD=2017:03:29:00:00:00:GMT,SP=5,NP=2,'
+            'TS=2017:03:29:01:00:00:GMT,VP=0.0,TS=2017:03:29:01:30:00:GMT,VP=0.0}',
+            '2017:03:29:00:02:03:GMT: subject=BMRA.BM.T_DRAXX2.FPN, '
+            'message={SD=2017:03:29:00:00:00:GMT,SP=5,NP=3,'
+            'TS=2017:03:29:01:00:00:GMT,VP=400.0,TS=2017:03:29:01:15:00:GMT,VP=420.0,'
+            'TS=2017:03:29:01:30:00:GMT,VP=410.0}']
+
+SD = dt.date(2017, 3, 29)
+
+
+def get_all_levels():
+    """returns the levels of each FPN, as per get_levels"""
+    return {fpn.bmu_id: fpn.get_levels() for fpn in FPN.objects.all()}
+
+
+class PackLevelsCase(SimpleTestCase):
+    """
+    Tests for packing and unpacking levels
+    """
+
+    def test_pack_levels(self):
+        """levels are unpacked in timestamp order, with equal timestamps kept in order"""
+        start = dt.datetime(2017, 3, 29, 1, tzinfo=timezone.utc)
+        levels = [(start + dt.timedelta(minutes=30), 5.5),
+                  (start, 400.0),
+                  (start + dt.timedelta(minutes=30), -1.25)]
+        packed = pack_levels(levels)
+        self.assertEqual(len(packed), 3 * 16)
+        self.assertEqual(unpack_levels(packed), [levels[1], levels[0], levels[2]])
+        self.assertEqual(unpack_levels(memoryview(packed)), unpack_levels(packed))
+        self.assertEqual(unpack_levels(pack_levels([])), [])
+
+
+class PackedStorageCase(TestCase):
+    """
+    Tests for inserting, reading and converting packed levels
+    """
+
+    def setUp(self):
+        for message_str in FPN_STRS:
+            insert_data(message_to_dict(message_str))
+        self.row_levels = get_all_levels()
+
+    def get_fpn_volumes(self):
+        return sorted(query_fpn_volumes(connection, None, SD, SD)
+                      .itertuples(index=False, name=None))
+
+    def test_packed_insert(self):
+        """serial and batched inserts store the same levels packed, without level rows"""
+        FPN.objects.all().delete()
+        with override_settings(BMRA_LEVEL_STORAGE='packed'):
+            for message_str in FPN_STRS:
+                insert_data(message_to_dict(message_str))
+            self.assertEqual(FPNlevel.objects.count(), 0)
+            self.assertEqual(get_all_levels(), self.row_levels)
+            FPN.objects.all().delete()
+            bulk_inserter = BulkInserter(batch_size=10)
+            for message_str in FPN_STRS:
+                bulk_inserter.add(message_to_dict(message_str))
+            bulk_inserter.close()
+            self.assertEqual(FPNlevel.objects.count(), 0)
+            self.assertEqual(get_all_levels(), self.row_levels)
+
+    def test_convert_levels(self):
+        """converted levels are unchanged, as are the volumes integrated from them"""
+        volumes = self.get_fpn_volumes()
+        _, row_mwh = get_BMU_timeseries('T_DRAXX2', SD, SD)
+        self.assertEqual(pack_entry_levels('FPN', SD, SD), 2)
+        self.assertEqual(FPNlevel.objects.count(), 0)
+        self.assertEqual(get_all_levels(), self.row_levels)
+        self.assertEqual(self.get_fpn_volumes(), volumes)
+        _, packed_mwh = get_BMU_timeseries('T_DRAXX2', SD, SD)
+        self.assertTrue(packed_mwh.equals(row_mwh))
+        self.assertEqual(pack_entry_levels('FPN', SD, SD), 0)
+        self.assertEqual(unpack_entry_levels('FPN', SD, SD), 2)
+        self.assertEqual(FPNlevel.objects.count(), 5)
+        self.assertEqual(get_all_levels(), self.row_levels)
+
+    def test_mixed_storage(self):
+        """volumes are integrated from both level rows and packed levels"""
+        volumes = self.get_fpn_volumes()
+        fpn = FPN.objects.get(bmu_id='T_DRAXX2')
+        fpn.levels = pack_levels(fpn.get_levels())
+        fpn.save()
+        fpn.fpnlevel_set.all().delete()
+        self.assertEqual(self.get_fpn_volumes(), volumes)
+
+    def test_regional_totals(self):
+        """regional FPN totals include packed levels"""
+        totals = [sum_fpn_levels(SD, 5, generation) for generation in [True, False]]
+        self.assertEqual(totals[0], [{'fpn__bmu__type__supertype': None,
+                                      'fpn__bmu__gsp_group__name': None,
+                                      'total': 1230.0}])
+        pack_entry_levels('FPN', SD, SD)
+        self.assertEqual([sum_fpn_levels(SD, 5, generation) for generation in [True, False]],
+                         totals)
@@ -0,0 +1,351 @@
+"""
+Tests for the annual summary helper functions
+"""
+from __future__ import unicode_literals
+import datetime as dt
+import importlib.util
+import os
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from BMRA.management.commands._summary_functions import sql_list, pivot_summary, write_summary, \
+    read_summary, load_watermark, save_watermark, get_date_ranges, get_bmra_updated_dates, \
+    get_p114_updated_dates, get_summary_dates, update_summary, query_metered_volumes
+from BMRA.management.commands._integration_functions import integrate_levels, \
+    integrate_profiles
+from BMRA.management.commands._aggregate_functions import get_BMU_timeseries
+from BMRA.management.commands._bmu_period_functions import update_bmu_periods, get_date_chunks
+from BMRA.models import BMU, FPN, FPNlevel, BOAV, EBOCF, BMUPeriod, ProcessedFile
+from P114.models import SR_type, ABV, ABP
+
+
+def level_df(rows, value_column='vp'):
+    """creates a DataFrame of levels from (bmu_id, sd, sp, minute, value) tuples"""
+    return pd.DataFrame(
+        [(bmu_id, sd, sp, dt.datetime(2018, 1, 1, tzinfo=timezone.utc) + dt.timedelta(minutes=minute),
+          value) for bmu_id, sd, sp, minute, value in rows],
+        columns=['bmu_id', 'sd', 'sp', 'ts', value_column])
+
+
+class SummaryCase(SimpleTestCase):
+    """
+    Tests for summary query helpers
+    """
+
+    def setUp(self):
+        self.blank_df = pd.DataFrame(
+            np.nan,
+            index=pd.MultiIndex.from_product([pd.to_datetime([dt.date(2018, 1, 1),
+                                                              dt.date(2018, 1, 2)]),
+                                              [1, 2]],
+                                             names=['sd', 'sp']),
+            columns=['T_A', 'T_B', 'T_C'])
+
+    def test_sql_list(self):
+        """ids are quoted, with quotes escaped"""
+        self.assertEqual(sql_list(['T_A', "T_B'1"]), "'T_A', 'T_B''1'")
+
+    def test_pivot_summary(self):
+        """long values are pivoted to the layout of the blank DataFrame"""
+        df = pd.DataFrame([('T_B', dt.date(2018, 1, 2), 1, 5.0),
+                           ('T_A', dt.date(2018, 1, 1), 2, 3.0),
+                           ('T_A', dt.date(2018, 1, 1), 2, 4.0),
+                           ('T_X', dt.date(2018, 1, 1), 1, 1.0),
+                           ('T_A', dt.date(2018, 1, 3), 1, 1.0)],
+                          columns=['bmu_id', 'sd', 'sp', 'vol'])
+        wide_df = pivot_summary(df, 'vol', self.blank_df)
+        self.assertTrue(wide_df.index.equals(self.blank_df.index))
+        self.assertEqual(list(wide_df.columns), ['T_A', 'T_B', 'T_C'])
+        self.assertEqual(wide_df.loc[(pd.Timestamp(2018, 1, 2), 1), 'T_B'], 5.0)
+        # first value taken for duplicates
+        self.assertEqual(wide_df.loc[(pd.Timestamp(2018, 1, 1), 2), 'T_A'], 3.0)
+        self.assertEqual(wide_df.notna().sum().sum(), 2)
+        self.assertTrue(pivot_summary(df.iloc[:0], 'vol', self.blank_df).isna().all().all())
+
+    def test_integrate_levels(self):
+        """levels are integrated over each BMU and settlement period"""
+        df = level_df([('T_A', dt.date(2018, 1, 1), 1, 0, 100.0),
+                       ('T_A', dt.date(2018, 1, 1), 1, 30, 200.0),
+                       ('T_A', dt.date(2018, 1, 1), 2, 30, 10.0),
+                       ('T_A', dt.date(2018, 1, 1), 2, 45, 10.0),
+                       ('T_A', dt.date(2018, 1, 1), 2, 60, 40.0),
+                       ('T_B', dt.date(2018, 1, 1), 2, 30, 50.0)])
+        result = integrate_levels(df, 'vp')
+        self.assertEqual(list(result.itertuples(index=False, name=None)),
+                         [('T_A', dt.date(2018, 1, 1), 1, 75.0),
+                          ('T_A', dt.date(2018, 1, 1), 2, 2.5 + 6.25),
+                          ('T_B', dt.date(2018, 1, 1), 2, 0.0)])
+
+    def test_integrate_profiles(self):
+        """integration of arrays matches a row by row trapezoidal sum"""
+        rng = np.random.RandomState(0)
+        n_rows = 1000
+        keys = [rng.randint(0, 3, n_rows), rng.randint(0, 20, n_rows)]
+        order = np.lexsort((keys[1], keys[0]))
+        keys = [key[order] for key in keys]
+        ts = pd.Timestamp(2018, 1, 1, tz='UTC') + pd.to_timedelta(np.sort(rng.randint(0, 3600,
+                                                                                     n_rows)),
+                                                                    unit='s')
+        values = rng.rand(n_rows) * 100
+        first_rows, mwh = integrate_profiles(keys, ts, values)
+        expected = {}
+        for row in range(n_rows):
+            key = (keys[0][row], keys[1][row])
+            if row > 0 and key == (keys[0][row - 1], keys[1][row - 1]):
+                hours = (ts[row] - ts[row - 1]).total_seconds() / 3600.0
+                expected[key] += 0.5 * (values[row] + values[row - 1]) * hours
+            else:
+                expected[key] = 0.0
+        self.assertEqual([(keys[0][row], keys[1][row]) for row in first_rows], list(expected))
+        np.testing.assert_allclose(mwh, list(expected.values()))
+        first_rows, mwh = integrate_profiles([[]], [], [])
+        self.assertEqual(len(first_rows), 0)
+        self.assertEqual(len(mwh), 0)
+
+    def test_write_summary_csv(self):
+        """summaries are written as csv by default"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = write_summary(self.blank_df.fillna(1.0), temp_dir, 'FPNs')
+            self.assertEqual(filename, os.path.join(temp_dir, 'FPNs.csv'))
+            df = pd.read_csv(filename, index_col=[0, 1], parse_dates=[0])
+        self.assertTrue(df.equals(self.blank_df.fillna(1.0)))
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'requires pyarrow')
+    def test_write_summary_columnar(self):
+        """summaries are written as parquet and feather, with string column names"""
+        df = self.blank_df.fillna(1.0)
+        df_bytype = df.T.groupby({'T_A': 'Wind', 'T_B': 'Wind', 'T_C': 'CCGT'}).sum()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.assertTrue(pd.read_parquet(write_summary(df, temp_dir, 'FPNs', 'parquet'))
+                            .equals(df))
+            self.assertEqual(list(pd.read_parquet(write_summary(df_bytype, temp_dir, 'bytype',
+                                                                'parquet')).columns),
+                             ['CCGT', 'Wind'])
+            self.assertEqual(list(pd.read_feather(write_summary(df, temp_dir, 'FPNs', 'feather'))
+                                  .columns),
+                             ['sd', 'sp', 'T_A', 'T_B', 'T_C'])
+
+    def test_read_summary(self):
+        """summaries are read back exactly, or None if not written"""
+        df = self.blank_df.copy()
+        df.iloc[:, 0] = np.random.RandomState(0).rand(len(df))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.assertIsNone(read_summary(temp_dir, 'FPNs'))
+            write_summary(df, temp_dir, 'FPNs')
+            self.assertTrue(read_summary(temp_dir, 'FPNs').equals(df))
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'requires pyarrow')
+    def test_read_summary_columnar(self):
+        """parquet and feather summaries are read back exactly, indexed by (sd, sp)"""
+        df = self.blank_df.copy()
+        df.iloc[:, 0] = np.random.RandomState(0).rand(len(df))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for output_format in ['parquet', 'feather']:
+                with self.subTest(output_format=output_format):
+                    self.assertIsNone(read_summary(temp_dir, 'FPNs', output_format))
+                    write_summary(df, temp_dir, 'FPNs', output_format)
+                    read_df = read_summary(temp_dir, 'FPNs', output_format)
+                    self.assertEqual(list(read_df.index.names), ['sd', 'sp'])
+                    self.assertEqual(list(read_df.dtypes), list(df.dtypes))
+                    self.assertTrue(read_df.equals(df))
+                    self.assertTrue(read_df.reindex(index=self.blank_df.index).equals(df))
+
+    def test_watermark(self):
+        """watermarks are recorded in the output directory"""
+        watermark = {'FPNs': {'last_sd': '2018-01-02', 'updated': '2018-01-03T01:00:00+00:00',
+                              'format': 'csv'}}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.assertEqual(load_watermark(temp_dir), {})
+            save_watermark(temp_dir, watermark)
+            self.assertEqual(load_watermark(temp_dir), watermark)
+
+    def test_get_date_ranges(self):
+        """dates are grouped into consecutive ranges"""
+        self.assertEqual(get_date_ranges([dt.date(2018, 1, 5), dt.date(2018, 1, 1),
+                                          dt.date(2018, 1, 2), dt.date(2018, 1, 2),
+                                          dt.date(2018, 1, 4)]),
+                         [(dt.date(2018, 1, 1), dt.date(2018, 1, 2)),
+                          (dt.date(2018, 1, 4), dt.date(2018, 1, 5))])
+        self.assertEqual(get_date_ranges([]), [])
+
+
+class AggregateCase(TestCase):
+    """
+    Tests for BMU timeseries aggregation
+    """
+
+    def test_get_BMU_timeseries(self):
+        """FPN levels are retrieved and integrated by settlement period"""
+        bmu = BMU.objects.create(id='T_A')
+        start = dt.datetime(2018, 1, 1, tzinfo=timezone.utc)
+        for sp, levels in [(2, [(30, 100.0), (60, 0.0)]), (1, [(0, 10.0), (15, 20.0), (30, 20.0)])]:
+            fpn = FPN.objects.create(bmu=bmu, ts=start, sd=dt.date(2018, 1, 1), sp=sp)
+            for minute, value in levels:
+                FPNlevel.objects.create(fpn=fpn, ts=start + dt.timedelta(minutes=minute), vp=value)
+        df_fpn, df_mwh = get_BMU_timeseries('T_A', dt.date(2018, 1, 1), dt.date(2018, 1, 1))
+        self.assertEqual(list(df_fpn.VP), [10.0, 20.0, 20.0, 100.0, 0.0])
+        self.assertEqual(list(df_mwh.itertuples(index=False, name=None)),
+                         [(dt.date(2018, 1, 1), 1, 3.75 + 5.0), (dt.date(2018, 1, 1), 2, 25.0)])
+
+
+class WatermarkCase(TestCase):
+    """
+    Tests for incremental summary dates
+    """
+
+    def test_get_bmra_updated_dates(self):
+        """dates around BMRA files ingested since the watermark are updated"""
+        updated = dt.datetime(2018, 1, 3, tzinfo=timezone.utc)
+        for filename, status, finished in [
+                ('tib_messages.2018-01-01.gz', 'completed', dt.datetime(2018, 1, 2, tzinfo=timezone.utc)),
+                ('tib_messages.2018-01-02.gz', 'completed', dt.datetime(2018, 1, 4, tzinfo=timezone.utc)),
+                ('tib_messages.2018-01-10.gz', 'failed', dt.datetime(2018, 1, 4, tzinfo=timezone.utc))]:
+            ProcessedFile.objects.create(filename=filename, source='BMRA', checksum='', status=status,
+                                         started=finished, finished=finished)
+        ProcessedFile.objects.create(filename='C0301_SF_20180105.gz', source='P114', checksum='',
+                                     status='completed', started=updated, finished=updated)
+        self.assertEqual(get_bmra_updated_dates(updated),
+                         {dt.date(2018, 1, 1), dt.date(2018, 1, 2), dt.date(2018, 1, 3)})
+
+    def create_abvs(self, rows):
+        """creates ABVs with a period row from (sd, agg_date) tuples"""
+        bmu = BMU.objects.create(id='T_A')
+        sr_type = SR_type.objects.create(id='SF', order=1)
+        for run_no, (sd, agg_date) in enumerate(rows):
+            abv = ABV.objects.create(bmu=bmu, sd=sd, run_no=run_no, agg_date=agg_date,
+                                     sr_type=sr_type)
+            ABP.objects.create(abv=abv, sp=1, ei=False, ii=False, vol=1.0)
+
+    def test_get_p114_updated_dates(self):
+        """dates aggregated after the watermark, or when files since ingested were, are updated"""
+        updated = dt.datetime(2018, 1, 11, tzinfo=timezone.utc)
+        self.create_abvs([(dt.date(2018, 1, 1), dt.date(2018, 1, 8)),
+                          (dt.date(2018, 1, 2), dt.date(2018, 1, 12)),
+                          (dt.date(2018, 1, 3), dt.date(2018, 1, 9)),
+                          (dt.date(2018, 1, 4), dt.date(2018, 1, 10))])
+        ProcessedFile.objects.create(filename='C0301_R1_20180109.gz', source='P114', checksum='',
+                                     status='completed', started=updated, finished=updated)
+        self.assertEqual(get_p114_updated_dates(connection, updated, dt.date(2018, 1, 10)),
+                         {dt.date(2018, 1, 2), dt.date(2018, 1, 3)})
+
+    def test_get_summary_dates(self):
+        """dates after the last settlement date and dates since ingested are recomputed"""
+        updated = dt.datetime(2018, 1, 6, tzinfo=timezone.utc)
+        for filename, finished in [
+                ('tib_messages.2018-01-01.gz', dt.datetime(2018, 1, 7, tzinfo=timezone.utc)),
+                ('tib_messages.2018-01-02.gz', dt.datetime(2018, 1, 5, tzinfo=timezone.utc))]:
+            ProcessedFile.objects.create(filename=filename, source='BMRA', checksum='',
+                                         status='completed', started=finished, finished=finished)
+        self.create_abvs([(dt.date(2018, 1, 2), dt.date(2018, 1, 4)),
+                          (dt.date(2018, 1, 3), dt.date(2018, 1, 9))])
+        watermark_entry = {'last_sd': '2018-01-03', 'updated': updated.isoformat(), 'format': 'csv'}
+        start_date, end_date = dt.date(2018, 1, 1), dt.date(2018, 1, 5)
+        # the file of the 1st also updates the 31st (outside the summary) and the 2nd
+        self.assertEqual(get_summary_dates(connection, 'FPNs', start_date, end_date,
+                                           watermark_entry),
+                         [dt.date(2018, 1, 1), dt.date(2018, 1, 2), dt.date(2018, 1, 4),
+                          dt.date(2018, 1, 5)])
+        watermark_entry['last_agg_date'] = '2018-01-05'
+        self.assertEqual(get_summary_dates(connection, 'metered', start_date, end_date,
+                                           watermark_entry),
+                         [dt.date(2018, 1, 3), dt.date(2018, 1, 4), dt.date(2018, 1, 5)])
+        watermark_entry['last_agg_date'] = None
+        self.assertEqual(get_summary_dates(connection, 'metered', start_date, end_date,
+                                           watermark_entry),
+                         [dt.date(2018, 1, 2), dt.date(2018, 1, 3), dt.date(2018, 1, 4),
+                          dt.date(2018, 1, 5)])
+
+    def test_update_summary(self):
+        """recomputed dates are merged into the existing summary, other dates unchanged"""
+        bmu = BMU.objects.create(id='T_A')
+        start = dt.datetime(2018, 1, 2, tzinfo=timezone.utc)
+        for sd, sp in [(dt.date(2018, 1, 1), 1), (dt.date(2018, 1, 2), 1)]:
+            fpn = FPN.objects.create(bmu=bmu, ts=start, sd=sd, sp=sp)
+            for minute, value in [(0, 10.0), (30, 20.0)]:
+                FPNlevel.objects.create(fpn=fpn, ts=start + dt.timedelta(minutes=minute), vp=value)
+        blank_df = pd.DataFrame(
+            np.nan,
+            index=pd.MultiIndex.from_product([pd.to_datetime([dt.date(2018, 1, 1),
+                                                              dt.date(2018, 1, 2),
+                                                              dt.date(2018, 1, 3)]),
+                                              [1, 2]],
+                                             names=['sd', 'sp']),
+            columns=['T_A', 'T_B'])
+        # the existing summary has no column for T_B and no rows for the 3rd
+        existing_df = blank_df.iloc[:4, :1].fillna(1.0)
+        summary_df = update_summary(connection, 'FPNs', ['T_A', 'T_B'], blank_df,
+                                    [dt.date(2018, 1, 2)], existing_df)
+        self.assertTrue(summary_df.index.equals(blank_df.index))
+        self.assertEqual(list(summary_df.columns), ['T_A', 'T_B'])
+        np.testing.assert_array_equal(summary_df['T_A'], [1.0, 1.0, 7.5, np.nan, np.nan, np.nan])
+        self.assertTrue(summary_df['T_B'].isna().all())
+        # without an existing summary, dates not computed are blank
+        np.testing.assert_array_equal(update_summary(connection, 'FPNs', ['T_A', 'T_B'], blank_df,
+                                                     [dt.date(2018, 1, 1)])['T_A'],
+                                      [7.5, np.nan, np.nan, np.nan, np.nan, np.nan])
+
+
+class BMUPeriodCase(TestCase):
+    """
+    Tests for the BMU period table
+    """
+
+    def test_update_bmu_periods(self):
+        """rows of the updated dates are replaced with the metrics of each BMU period"""
+        bmu = BMU.objects.create(id='T_A')
+        sd = dt.date(2018, 1, 1)
+        start = dt.datetime(2018, 1, 1, tzinfo=timezone.utc)
+        fpn = FPN.objects.create(bmu=bmu, ts=start, sd=sd, sp=1)
+        for minute, value in [(0, 10.0), (30, 20.0)]:
+            FPNlevel.objects.create(fpn=fpn, ts=start + dt.timedelta(minutes=minute), vp=value)
+        for nn, bv in [(-1, -2.0), (-2, -3.0)]:
+            BOAV.objects.create(bmu=bmu, ts=start, nk=1, sd=sd, sp=2, nn=nn, ov=0.0, bv=bv,
+                                sa=False)
+        EBOCF.objects.create(bmu=bmu, ts=start, sd=sd, sp=2, nn=-1, oc=0.0, bc=-50.0)
+        for sr_type_id, order, vol in [('SF', 1, 4.0), ('R1', 2, 5.0)]:
+            abv = ABV.objects.create(bmu=bmu, sd=sd, run_no=1, agg_date=sd,
+                                     sr_type=SR_type.objects.create(id=sr_type_id, order=order))
+            ABP.objects.create(abv=abv, sp=1, ei=False, ii=False, vol=vol)
+        BMUPeriod.objects.create(bmu=bmu, sd=sd, sp=3, fpn=1.0)
+        BMUPeriod.objects.create(bmu=bmu, sd=dt.date(2018, 1, 2), sp=1, fpn=1.0)
+
+        self.assertEqual(update_bmu_periods([sd]), 2)
+        self.assertEqual(update_bmu_periods([sd]), 2)
+        self.assertEqual(
+            list(BMUPeriod.objects.order_by('sd', 'sp').values_list(
+                'sd', 'sp', 'fpn', 'mel', 'bav', 'oav', 'bid_cashflow', 'offer_cashflow',
+                'metered')),
+            [(sd, 1, 7.5, None, None, None, None, None, 5.0),
+             (sd, 2, None, None, -5.0, 0.0, -50.0, 0.0, None),
+             (dt.date(2018, 1, 2), 1, 1.0, None, None, None, None, None, None)])
+
+    def test_metered_latest_run(self):
+        """metered volumes are taken from the latest run of the latest run type"""
+        bmu = BMU.objects.create(id='T_A')
+        sd = dt.date(2018, 1, 1)
+        sr_types = {sr_type_id: SR_type.objects.create(id=sr_type_id, order=order)
+                    for sr_type_id, order in [('SF', 1), ('RF', 5)]}
+        for sr_type_id, run_no, agg_date, vol in [('SF', 1, dt.date(2018, 1, 5), 9.0),
+                                                  ('RF', 2, dt.date(2019, 6, 1), 6.0),
+                                                  ('RF', 1, dt.date(2019, 3, 1), 2.0)]:
+            abv = ABV.objects.create(bmu=bmu, sd=sd, run_no=run_no, agg_date=agg_date,
+                                     sr_type=sr_types[sr_type_id])
+            ABP.objects.create(abv=abv, sp=1, ei=False, ii=False, vol=vol)
+        df = query_metered_volumes(connection, None, sd, sd)
+        self.assertEqual(list(df.itertuples(index=False, name=None)), [('T_A', sd, 1, 6.0)])
+        update_bmu_periods([sd])
+        self.assertEqual(BMUPeriod.objects.get().metered, 6.0)
+
+    def test_get_date_chunks(self):
+        """consecutive dates are split into chunks of at most the given number of days"""
+        dates = [dt.date(2018, 1, 1) + dt.timedelta(days=x) for x in range(10)] \
+            + [dt.date(2018, 2, 1)]
+        self.assertEqual(get_date_chunks(dates, days=4),
+                         [(dt.date(2018, 1, 1), dt.date(2018, 1, 4)),
+                          (dt.date(2018, 1, 5), dt.date(2018, 1, 8)),
+                          (dt.date(2018, 1, 9), dt.date(2018, 1, 10)),
+                          (dt.date(2018, 2, 1), dt.date(2018, 2, 1))])
@@ -5,7 +5,9 @@ from __future__ import unicode_literals
 import datetime as dt
 from django.test import TestCase
 from django.utils import timezone
-from GBEnergyDataManager.utils import sp_to_dt, dt_to_sp, get_sp_list
+import pandas as pd
+from GBEnergyDataManager.utils import sp_to_dt, dt_to_sp, get_sp_list, get_sp_index, \
+    get_sp_count, sp_to_dt_array, dt_to_sp_array
 
 
 class TimeConversionCase(TestCase):
@@ -348,6 +350,30 @@ class TimeConversionCase(TestCase):
         self.assertEqual(dt_to_sp(dt.datetime(2018, 10, 29, 1, 0, tzinfo=timezone.utc), False),
                          (dt.date(2018, 10, 29), 2))
 
+    def test_sp_to_dt_array(self):
+        """Array conversion matches sp_to_dt over whole years"""
+        sp_list = get_sp_list(dt.date(2018, 1, 1), dt.date(2019, 12, 31))
+        sds = [sd for sd, _ in sp_list]
+        sps = [int(sp) for _, sp in sp_list]
+        for period_start in [True, False]:
+            self.assertEqual(list(sp_to_dt_array(sds, sps, period_start)),
+                             [sp_to_dt(sd, sp, period_start) for sd, sp in zip(sds, sps)])
+        with self.assertRaises(ValueError):
+            sp_to_dt_array([dt.date(2018, 1, 1)], [0])
+        with self.assertRaises(ValueError):
+            sp_to_dt_array([dt.date(2018, 1, 1), dt.date(2018, 3, 25)], [48, 47])
+        with self.assertRaises(ValueError):
+            sp_to_dt_array([dt.date(2018, 1, 1)], [1, 2])
+
+    def test_dt_to_sp_array(self):
+        """Array conversion matches dt_to_sp over whole years"""
+        datetimes = [dt.datetime(2018, 1, 1, tzinfo=timezone.utc) + dt.timedelta(minutes=15 * i)
+                     for i in range(2 * 365 * 96)]
+        for period_start in [True, False]:
+            sds, sps = dt_to_sp_array(datetimes, period_start)
+            self.assertEqual(list(zip(sds.astype(object), sps.tolist())),
+                             [dt_to_sp(datetime, period_start) for datetime in datetimes])
+
 
 class TimeListCase(TestCase):
     """
@@ -556,3 +582,25 @@ class TimeListCase(TestCase):
                           (dt.date(2018, 10, 29), 2),
                           (dt.date(2018, 10, 29), 3),
                           (dt.date(2018, 10, 29), 4)])
+
+    def test_get_sp_index(self):
+        """sp index matches sp list, including clock change days"""
+        for args in [(dt.date(2018, 1, 1), dt.date(2018, 12, 31)),
+                     (dt.date(2018, 3, 25), dt.date(2018, 3, 26), 40, 3),
+                     (dt.date(2018, 10, 28), dt.date(2018, 10, 28), 47, None),
+                     (dt.date(2018, 10, 27), dt.date(2018, 10, 28), None, 49)]:
+            self.assertEqual(list(get_sp_index(*args)),
+                             [(pd.Timestamp(sd), sp) for sd, sp in get_sp_list(*args)])
+        sp_index = get_sp_index(dt.date(2018, 1, 1), dt.date(2018, 12, 31))
+        self.assertEqual(sp_index.names, ['sd', 'sp'])
+        self.assertEqual(len(sp_index), 365 * 48)
+        self.assertEqual(len(get_sp_index(dt.date(2018, 1, 2), dt.date(2018, 1, 1), 2)), 0)
+
+    def test_get_sp_count(self):
+        """Can give number of settlement periods, including clock change days"""
+        self.assertEqual(get_sp_count(dt.date(2018, 1, 1)), 48)
+        self.assertEqual(get_sp_count(dt.date(2018, 3, 25)), 46)
+        self.assertEqual(get_sp_count(dt.date(2018, 10, 28)), 50)
+        self.assertEqual(get_sp_count(dt.date(2019, 3, 31)), 46)
+        self.assertEqual(get_sp_count(dt.date(2019, 10, 27)), 50)
+        self.assertEqual(get_sp_count(dt.date(2019, 10, 28)), 48)
@@ -10,6 +10,7 @@ import csv
 import requests
 from django.core import serializers
 from BMRA.models import BMU, FPN, FPNlevel
+from BMRA.models.profiles import unpack_levels
 import pandas as pd
 import numpy as np
 import os
@@ -62,14 +63,35 @@ def list_unused_BMUs(request):
     return HttpResponse("<h1>Unknown BMUs</h1>"+"<br />".join([str(x) for x in unused_BMUs]))
 
 
+def sum_fpn_levels(sd, sp, generation=True):
+    """
+    totals FPN levels for a settlement period by BMU supertype and GSP
+    group, either levels of 0 or more (generation) or negative levels
+    (demand), whether the levels are held as level rows or packed
+    """
+    group_fields = ['fpn__bmu__type__supertype', 'fpn__bmu__gsp_group__name']
+    level_filter = {'vp__gte': 0} if generation else {'vp__lt': 0}
+    totals = {}
+    for row in FPNlevel.objects.filter(fpn__sd=sd,
+                                       fpn__sp=sp,
+                                       **level_filter).values(*group_fields).annotate(total=Sum('vp')):
+        totals[(row[group_fields[0]], row[group_fields[1]])] = row['total']
+    for supertype, gsp_group, levels in FPN.objects.filter(sd=sd,
+                                                           sp=sp,
+                                                           levels__isnull=False)\
+            .values_list('bmu__type__supertype', 'bmu__gsp_group__name', 'levels'):
+        values = [value for _, value in unpack_levels(levels) if (value >= 0) == generation]
+        if len(values) > 0:
+            totals[(supertype, gsp_group)] = totals.get((supertype, gsp_group), 0) + sum(values)
+    return [{group_fields[0]: supertype, group_fields[1]: gsp_group, 'total': total}
+            for (supertype, gsp_group), total in totals.items()]
+
+
 def regional_generation_bytype(request):
     """
     generates list of
     """
-    fpns = FPNlevel.objects.filter(vp__gte=0,
-                                   fpn__sd='2020-01-01',
-                                   fpn__sp=1).values('fpn__bmu__type__supertype',
-                                                     'fpn__bmu__gsp_group__name').annotate(total=Sum('vp'))
+    fpns = sum_fpn_levels('2020-01-01', 1, generation=True)
     print(fpns)
     # post_list = serializers.serialize('json', fpns)
     # return HttpResponse(post_list, content_type="text/json-comment-filtered")
@@ -97,10 +119,7 @@ def regional_demand(request):
     """
     generates list of
     """
-    fpns = FPNlevel.objects.filter(vp__lt=0,
-                                   fpn__sd='2020-01-03',
-                                   fpn__sp=1).values('fpn__bmu__type__supertype',
-                                                     'fpn__bmu__gsp_group__name').annotate(total=Sum('vp'))
+    fpns = sum_fpn_levels('2020-01-03', 1, generation=False)
     print(fpns)
     # post_list = serializers.serialize('json', fpns)
     # return HttpResponse(post_list, content_type="text/json-comment-filtered")
@@ -131,6 +131,11 @@ BMRA_INPUT_DIR = '/Users/graeme/ElexonData/Unprocessed/'
 BMRA_PROCESSED_DIR = '/Users/graeme/ElexonData/Processed/'
 P114_INPUT_DIR = ''
 
+# Storage of FPN/MEL/MIL/QPN/BOAL/BOALF levels, either 'rows' (one row per
+# level in the level tables) or 'packed' (arrays of timestamps and values
+# held on each submission)
+BMRA_LEVEL_STORAGE = 'rows'
+
 # Locations for saving flat file data summaries
 # each key should be a recognised BMU subset hardcoded within
 # /BMRA/management/commands/generate_annual_summary.py
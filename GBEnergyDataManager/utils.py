@@ -3,9 +3,52 @@
 common helper functions
 """
 import numpy as np
+import pandas as pd
 import datetime as dt
 import pytz
 
+LONDON_TZ = pytz.timezone('Europe/London')
+
+# DST transition dates, precomputed for constant-time lookups
+# clocks go forward on FORWARD_TRANSITION_DAYS, 46 settlement periods
+# clocks go back on BACKWARD_TRANSITION_DAYS, 50 settlement periods
+TRANSITION_DAYS = frozenset(dt.date(x.year, x.month, x.day)
+                            for x in LONDON_TZ._utc_transition_times)
+FORWARD_TRANSITION_DAYS = frozenset(x for x in TRANSITION_DAYS if x.month < 6)
+BACKWARD_TRANSITION_DAYS = frozenset(x for x in TRANSITION_DAYS if x.month > 6)
+
+# as above, as arrays for use by the array conversion functions, with the
+# UTC times of each transition and the DST offset (seconds) following it
+_TRANSITION_DAYS_ARRAY = np.array(sorted(TRANSITION_DAYS), dtype='datetime64[D]')
+_FORWARD_TRANSITION_DAYS_ARRAY = np.array(sorted(FORWARD_TRANSITION_DAYS), dtype='datetime64[D]')
+_BACKWARD_TRANSITION_DAYS_ARRAY = np.array(sorted(BACKWARD_TRANSITION_DAYS),
+                                           dtype='datetime64[D]')
+_TRANSITION_TIMES = np.array(LONDON_TZ._utc_transition_times, dtype='datetime64[s]')
+_TRANSITION_DST = np.array([info[1].total_seconds() for info in LONDON_TZ._transition_info],
+                           dtype=int)
+
+
+def get_sp_count(SD):
+    """
+    Gives the number of settlement periods on a settlement date
+
+    Parameters
+    ----------
+    SD : datetime.date object
+        the settlement date
+
+    Returns
+    -------
+    int
+        46 if the clocks go forward, 50 if the clocks go back, otherwise 48
+    """
+    if SD in FORWARD_TRANSITION_DAYS:
+        return 46
+    if SD in BACKWARD_TRANSITION_DAYS:
+        return 50
+    return 48
+
+
 def is_dst(datetime):
     """
     determines if a (timezone-aware) datetime object is within UK daylight savings
@@ -20,7 +63,7 @@ def is_dst(datetime):
     is_dst : boolean
         True if datetime in UK daylight savings, False if not
     """
-    return datetime.astimezone(pytz.timezone('Europe/London')).dst() > dt.timedelta(0)
+    return datetime.astimezone(LONDON_TZ).dst() > dt.timedelta(0)
 
 
 def sp_to_dt(SD, SP, period_start=True):
@@ -52,13 +95,11 @@ def sp_to_dt(SD, SP, period_start=True):
         raise ValueError('SP value of %d less than minimum value of 1' % SP)
 
     #maximum SP value check, taking into account transition days
-    transition_days = [dt.date(x.year, x.month, x.day)
-                       for x in pytz.timezone('Europe/London')._utc_transition_times]
-    if SD in [x for x in transition_days if x.month<6]: #clocks go forward
+    if SD in FORWARD_TRANSITION_DAYS: #clocks go forward
         if SP > 46:
             raise ValueError('SP value of %d exceeds maximum value of 46 \
                              for forward clock change date' % SP)
-    elif SD in [x for x in transition_days if x.month>6]: #clocks go back
+    elif SD in BACKWARD_TRANSITION_DAYS: #clocks go back
         if SP > 50:
             raise ValueError('SP value of %d exceeds maximum value of 50 \
                              for backward clock change date' % SP)
@@ -86,12 +127,12 @@ def sp_to_dt(SD, SP, period_start=True):
 
     # DST shift should only be applied on days after transition day
     # (as does not impact calculation until SP resets to 1)
-    if SD in [x for x in transition_days if x.month<6]:
+    if SD in FORWARD_TRANSITION_DAYS:
         pass
-    elif SD in [x for x in transition_days if x.month>6] and SP > 2:
+    elif SD in BACKWARD_TRANSITION_DAYS and SP > 2:
         datetime -= dt.timedelta(hours=1)
     else:
-        datetime -= datetime.astimezone(pytz.timezone('Europe/London')).dst()
+        datetime -= datetime.astimezone(LONDON_TZ).dst()
     return datetime
 
 def dt_to_sp(datetime, period_start=True):
@@ -118,12 +159,6 @@ def dt_to_sp(datetime, period_start=True):
         the settlement period
     """
 
-    # DST transition dates
-    # clocks go forward on transition_days[::2], 46 settlement periods
-    # clocks go back on transition_days[1::2], 50 settlement periods
-    transition_days = [dt.date(x.year, x.month, x.day)
-                       for x in pytz.timezone('Europe/London')._utc_transition_times]
-
     # initally set SD and SP ignoring DST
     sd_raw = dt.date(datetime.year, datetime.month, datetime.day)
     sp_raw = (datetime.hour*60+datetime.minute) // 30 + 1
@@ -133,10 +168,9 @@ def dt_to_sp(datetime, period_start=True):
     # So:
     # if on day clocks got forward, do not adjust
     # if on day clocks go back, adjust both within and without BST period
-    if (datetime.astimezone(pytz.timezone('Europe/London')).dst() != dt.timedelta(0)\
-    and sd_raw not in [x for x in transition_days if x.month<6])\
-    or (datetime.astimezone(pytz.timezone('Europe/London')).dst() == dt.timedelta(0)\
-    and sd_raw in [x for x in transition_days if x.month>6]):
+    dst = datetime.astimezone(LONDON_TZ).dst()
+    if (dst != dt.timedelta(0) and sd_raw not in FORWARD_TRANSITION_DAYS)\
+    or (dst == dt.timedelta(0) and sd_raw in BACKWARD_TRANSITION_DAYS):
         sp_raw += 2
 
     # shift period by 1 if datetime is ambiguous and to be treated as period end
@@ -148,22 +182,17 @@ def dt_to_sp(datetime, period_start=True):
     # allowing for variable number of SPs on DST transition dates
     if sp_raw < 1:
         sd_raw -= dt.timedelta(days=1)
-        if sd_raw in [x for x in transition_days if x.month<6]:
-            sp_raw = 46 - sp_raw
-        elif sd_raw in [x for x in transition_days if x.month>6]:
-            sp_raw = 50 - sp_raw
-        else:
-            sp_raw = 48 - sp_raw
+        sp_raw = get_sp_count(sd_raw) - sp_raw
 
     # now deal with cases where SP is shifted to next settlement date, allowing
     # for variable number of SPs on DST transition dates
-    if sp_raw > 48 and sd_raw not in transition_days:
+    if sp_raw > 48 and sd_raw not in TRANSITION_DAYS:
         sd_raw += dt.timedelta(days=1)
         sp_raw -= 48
-    if sp_raw > 46 and sd_raw in [x for x in transition_days if x.month<6]:
+    if sp_raw > 46 and sd_raw in FORWARD_TRANSITION_DAYS:
         sd_raw += dt.timedelta(days=1)
         sp_raw -= 46
-    if sp_raw > 50 and sd_raw in [x for x in transition_days if x.month>6]:
+    if sp_raw > 50 and sd_raw in BACKWARD_TRANSITION_DAYS:
         sd_raw += dt.timedelta(days=1)
         sp_raw -= 50
 
@@ -204,14 +233,7 @@ def get_sp_list(sd_start, sd_end, sp_start=None, sp_end=None):
             first_sp = 1
 
         #maximum SP value check, taking into account transition days
-        transition_days = [dt.date(x.year, x.month, x.day)
-                           for x in pytz.timezone('Europe/London')._utc_transition_times]
-        if curr_sd in [x for x in transition_days if x.month<6]: #clocks go forward
-            last_sp = 46
-        elif curr_sd in [x for x in transition_days if x.month>6]: #clocks go back
-            last_sp = 50
-        else:
-            last_sp = 48
+        last_sp = get_sp_count(curr_sd)
         if (curr_sd == sd_end and sp_end is not None) and sp_end < last_sp:
 
             last_sp = sp_end
@@ -221,3 +243,178 @@ def get_sp_list(sd_start, sd_end, sp_start=None, sp_end=None):
         curr_sd += dt.timedelta(days=1)
 
     return sp_list
+
+
+def get_sp_index(sd_start, sd_end, sp_start=None, sp_end=None):
+    """
+    Gives a MultiIndex of settlement dates and periods between two given
+    settlement dates/periods, as per get_sp_list, built with array
+    operations rather than per-period appends
+
+    Parameters
+    ----------
+    sd_start : datetime.date object
+        the first settlement date
+    sd_end : datetime.date object
+        the last settlement date
+    sp_start : int
+        the settlement period to begin with on the first settlement date
+        (assumed 1 if no argument provided)
+    sp_end : int
+        the settlement period to end with on the last settlement date
+        (assumed final settlement period if no argument provided)
+
+    Returns
+    -------
+    pandas.MultiIndex
+        index with levels:
+        sd : datetime64
+            the settlement date
+        sp : int
+            the settlement period
+    """
+    sds = pd.date_range(sd_start, sd_end, freq='D')
+    sp_counts = np.array([get_sp_count(sd) for sd in sds.date], dtype=int)
+
+    # periods are numbered within each day from the offset of the day's
+    # first period
+    day_offsets = np.repeat(np.cumsum(sp_counts) - sp_counts, sp_counts)
+    sps = np.arange(sp_counts.sum()) - day_offsets + 1
+    sp_index = pd.MultiIndex.from_arrays([np.repeat(sds, sp_counts), sps], names=['sd', 'sp'])
+
+    if len(sds) > 0 and (sp_start is not None or sp_end is not None):
+        keep = np.ones(len(sp_index), dtype=bool)
+        if sp_start is not None:
+            keep &= ~((sp_index.get_level_values('sd') == sds[0]) & (sps < sp_start))
+        if sp_end is not None:
+            keep &= ~((sp_index.get_level_values('sd') == sds[-1]) & (sps > sp_end))
+        sp_index = sp_index[keep]
+    return sp_index
+
+
+def _to_date_array(SD):
+    """
+    Converts array-like settlement dates to a datetime64[D] array
+    """
+    return pd.DatetimeIndex(pd.to_datetime(SD)).to_numpy().astype('datetime64[D]')
+
+
+def _dst_seconds(utc_times):
+    """
+    Gives the UK daylight savings offset (seconds) at each of an array of
+    (naive) UTC datetime64 times, as per is_dst
+    """
+    index = np.searchsorted(_TRANSITION_TIMES, utc_times.astype('datetime64[s]'), side='right')
+    return _TRANSITION_DST[np.maximum(index - 1, 0)]
+
+
+def _sp_counts(SD):
+    """
+    Gives the number of settlement periods on each of an array of
+    datetime64[D] settlement dates, as per get_sp_count
+    """
+    return np.where(np.isin(SD, _FORWARD_TRANSITION_DAYS_ARRAY), 46,
+                    np.where(np.isin(SD, _BACKWARD_TRANSITION_DAYS_ARRAY), 50, 48))
+
+
+def sp_to_dt_array(SD, SP, period_start=True):
+    """
+    Converts arrays of settlement dates and settlement periods to UTC
+    datetimes, as per sp_to_dt
+
+    Parameters
+    ----------
+    SD : array-like
+        the settlement dates (datetime.date objects or datetime64 values)
+    SP : array-like
+        the settlement periods (in range 1 to 50)
+    period_start : bool
+        whether the desired datetimes should relate to the start (True)
+        or end (False) of the settlement periods
+
+    Returns
+    -------
+    pandas.DatetimeIndex
+        timezone-aware (UTC) datetimes
+    """
+    SD = _to_date_array(SD)
+    SP = np.asarray(SP, dtype=int)
+    if SD.shape != SP.shape:
+        raise ValueError('Settlement Date and Settlement Period arrays of different lengths')
+
+    #SP value checks, taking into account transition days
+    if (SP < 1).any():
+        raise ValueError('SP value of %d less than minimum value of 1' % SP.min())
+    max_sp = _sp_counts(SD)
+    if (SP > max_sp).any():
+        raise ValueError('SP value of %d exceeds maximum value of %d' %
+                         (SP[SP > max_sp][0], max_sp[SP > max_sp][0]))
+
+    seconds = (SP - 1) * 1800
+    if not period_start:
+        seconds += 1800
+    datetimes = SD.astype('datetime64[s]') + seconds.astype('timedelta64[s]')
+
+    # DST shift should only be applied on days after transition day
+    # (as does not impact calculation until SP resets to 1)
+    shift = np.where(np.isin(SD, _FORWARD_TRANSITION_DAYS_ARRAY), 0,
+                     np.where(np.isin(SD, _BACKWARD_TRANSITION_DAYS_ARRAY) & (SP > 2), 3600,
+                              _dst_seconds(datetimes)))
+    datetimes -= shift.astype('timedelta64[s]')
+    return pd.DatetimeIndex(datetimes).tz_localize('UTC')
+
+
+def dt_to_sp_array(datetimes, period_start=True):
+    """
+    Converts an array of timezone-aware datetimes to settlement dates (BST)
+    and settlement periods, as per dt_to_sp
+
+    Parameters
+    ----------
+    datetimes : array-like
+        the datetimes (naive datetimes are taken as UTC)
+    period_start : bool
+        whether the datetimes relate to the start (True) or end (False) of
+        the settlement periods, if falling exactly on a half-hour period,
+        as per dt_to_sp
+
+    Returns
+    -------
+    SD : numpy.ndarray
+        the settlement dates (datetime64[D])
+    SP : numpy.ndarray
+        the settlement periods
+    """
+    utc_times = pd.DatetimeIndex(pd.to_datetime(datetimes, utc=True)).tz_localize(None).to_numpy()
+
+    # initally set SD and SP ignoring DST
+    SD = utc_times.astype('datetime64[D]')
+    minutes = ((utc_times - SD) // np.timedelta64(1, 'm')).astype(int)
+    SP = minutes // 30 + 1
+
+    # adjust SP for DST, as per dt_to_sp
+    dst = _dst_seconds(utc_times) != 0
+    SP += 2 * ((dst & ~np.isin(SD, _FORWARD_TRANSITION_DAYS_ARRAY))
+               | (~dst & np.isin(SD, _BACKWARD_TRANSITION_DAYS_ARRAY)))
+
+    # shift period by 1 if datetime is ambiguous and to be treated as period end
+    if not period_start:
+        SP -= minutes % 30 == 0
+
+    # periods shifted to previous settlement date
+    previous = SP < 1
+    SD[previous] -= np.timedelta64(1, 'D')
+    SP[previous] = _sp_counts(SD[previous]) - SP[previous]
+
+    # periods shifted to next settlement date
+    for max_sp, days in [(48, None),
+                         (46, _FORWARD_TRANSITION_DAYS_ARRAY),
+                         (50, _BACKWARD_TRANSITION_DAYS_ARRAY)]:
+        if days is None:
+            following = (SP > max_sp) & ~np.isin(SD, _TRANSITION_DAYS_ARRAY)
+        else:
+            following = (SP > max_sp) & np.isin(SD, days)
+        SD[following] += np.timedelta64(1, 'D')
+        SP[following] -= max_sp
+
+    return SD, SP
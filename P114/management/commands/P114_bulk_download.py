@@ -4,23 +4,68 @@ command to download and process BMRA data for specified date rahge
 """
 import datetime as dt
 from django.core.management.base import BaseCommand, CommandError
-from ._download_functions import process_p114_date
+from BMRA.management.commands._bmu_period_functions import update_bmu_periods, \
+    get_p114_period_dates
+from ._download_functions import process_p114_date, prefetch_p114_files, \
+    get_p114_filenames_for_date
+from BMRA.management.commands._async_download_functions import Prefetcher
+from BMRA.management.commands._ledger_functions import get_first_incomplete
 
 class Command(BaseCommand):
     help = 'downloads P114 data for specific date range, expected 2 arguments of form yyyy-m-d'
 
     def add_arguments(self, parser):
         parser.add_argument('date', nargs='+', type=str)
+        parser.add_argument('--prefetch', type=int, default=0,
+                            help='download files for this number of upcoming days in the background')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='process the files of each feed in parallel, each in its own process')
+        parser.add_argument('--force', action='store_true',
+                            help='reprocess files already completed in the ingestion ledger')
+        parser.add_argument('--no_bmu_periods', action='store_true',
+                            help='don\'t update the BMU period table for the settlement dates ingested')
 
     def handle(self, *args, **options):
         self.stdout.write('Started: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
         start_date = dt.datetime(*[int(x) for x in options['date'][0].split('-')[:3]])
         end_date = dt.datetime(*[int(x) for x in options['date'][1].split('-')[:3]])
-        date = start_date
-        while date <= end_date:
-            self.stdout.write('{:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
-            self.stdout.write("downloading data for "
-                              + '{:%Y-%m-%d}'.format(date))
-            process_p114_date(date)
-            date += dt.timedelta(days=1)
+        if not options['force']:
+            # days before the first day with files not completed in the
+            # ledger are skipped without downloading, files already completed
+            # on later days are skipped if their checksum is unchanged
+            resume_date = start_date
+            while resume_date <= end_date:
+                filenames = get_p114_filenames_for_date(resume_date) or []
+                if get_first_incomplete(filenames) < len(filenames):
+                    break
+                resume_date += dt.timedelta(days=1)
+            if resume_date > start_date:
+                self.stdout.write('{} days already completed, resuming from {:%Y-%m-%d}'.format(
+                    (resume_date - start_date).days, resume_date))
+            first_date = resume_date
+        else:
+            first_date = start_date
+        prefetched = {}
+        with Prefetcher() as prefetcher:
+            date = first_date
+            while date <= end_date:
+                self.stdout.write('{:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
+                self.stdout.write("downloading data for "
+                                  + '{:%Y-%m-%d}'.format(date))
+                if options['prefetch'] > 0:
+                    for x in range(options['prefetch'] + 1):
+                        prefetch_date = date + dt.timedelta(days=x)
+                        if prefetch_date <= end_date and prefetch_date not in prefetched:
+                            prefetched[prefetch_date] = prefetch_p114_files(prefetcher, prefetch_date)
+                    for file_path in prefetched.pop(date):
+                        prefetcher.wait(file_path)
+                process_p114_date(date,
+                                  force=options['force'],
+                                  overwrite=(options['prefetch'] == 0),
+                                  workers=options['workers'])
+                date += dt.timedelta(days=1)
+        if not options['no_bmu_periods'] and first_date <= end_date:
+            count = update_bmu_periods(get_p114_period_dates(
+                [first_date + dt.timedelta(days=x) for x in range((end_date - first_date).days + 1)]))
+            self.stdout.write('{} BMU periods updated'.format(count))
         self.stdout.write('Finished: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
@@ -4,6 +4,8 @@ command to download and process P114 data for specific date
 """
 import datetime as dt
 from django.core.management.base import BaseCommand, CommandError
+from BMRA.management.commands._bmu_period_functions import update_bmu_periods, \
+    get_p114_period_dates
 from ._download_functions import process_p114_date
 
 class Command(BaseCommand):
@@ -11,10 +13,19 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('date', nargs='+', type=str)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='process the files of each feed in parallel, each in its own process')
+        parser.add_argument('--force', action='store_true',
+                            help='reprocess files already completed in the ingestion ledger')
+        parser.add_argument('--no_bmu_periods', action='store_true',
+                            help='don\'t update the BMU period table for the settlement dates ingested')
 
     def handle(self, *args, **options):
         self.stdout.write('Started: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
         self.stdout.write("downloading data for %s" % options['date'][0])
         date = dt.datetime(*[int(x) for x in options['date'][0].split('-')[:3]])
-        process_p114_date(date)
+        process_p114_date(date, force=options['force'], workers=options['workers'])
+        if not options['no_bmu_periods']:
+            count = update_bmu_periods(get_p114_period_dates([date]))
+            self.stdout.write('{} BMU periods updated'.format(count))
         self.stdout.write('Finished: {:%Y-%m-%d %H:%M:%S}'.format(dt.datetime.now()))
@@ -0,0 +1,272 @@
+"""
+Helper functions for uploading P114 data to database in batches
+
+Period rows (e.g. ABP) are grouped under the header row (e.g. ABV) which
+precedes them in the file, as per insert_data. Headers are deduplicated
+against existing entries in a single query per batch, and period rows are
+inserted with bulk_create, with duplicates detected against an in-memory
+set of the keys of existing rows under the same headers
+"""
+from collections import defaultdict
+from BMRA.management.commands._reference_functions import ReferenceCache
+from BMRA.management.commands._upload_functions import merge_insert_log, new_insert_log
+
+# definitions of header messages, giving the model created and the
+# reference field, with the referenced model and message key
+PARENT_DEFINITIONS = {
+    'ABV': {'model': 'ABV', 'reference': ('bmu', 'BMU', 'bmu_id')},
+    'AGV': {'model': 'AGV', 'reference': ('gsp_group', 'GSP_group', 'gsp_group')},
+    'MPD': {'model': 'MPD', 'reference': ('gsp_group', 'GSP_group', 'gsp_group')},
+}
+
+# header fields identifying a duplicate entry, following the reference
+# field, and the corresponding message keys
+PARENT_KEY = ('sd', 'sr_type_id', 'run_no', 'agg_date')
+PARENT_MESSAGE_KEYS = ('sd', 'sr_type', 'run_no', 'agg_date')
+
+# definitions of messages which only give the id of an entity referenced by
+# the following period rows, giving the referenced model and message key
+CONTEXT_DEFINITIONS = {
+    'GP9': ('GSP', 'gsp_id'),
+    'EPD': ('Interconnector', 'inter_id'),
+    'IPD': ('InterGSP', 'intergsp_id'),
+}
+
+# definitions of period messages, giving the model created, the header
+# message type and (optionally) the context field and message type
+CHILD_DEFINITIONS = {
+    'ABP': {'model': 'ABP', 'log_key': 'abp', 'parent': 'ABV', 'context': None},
+    'AGP': {'model': 'AGP', 'log_key': 'agp', 'parent': 'AGV', 'context': None},
+    'GMP': {'model': 'GMP', 'log_key': 'gmp', 'parent': 'MPD', 'context': ('gsp', 'GP9')},
+    'EMP': {'model': 'EMP', 'log_key': 'emp', 'parent': 'MPD',
+            'context': ('interconnector', 'EPD')},
+    'IMP': {'model': 'IMP', 'log_key': 'imp', 'parent': 'MPD', 'context': ('intergsp', 'IPD')},
+}
+
+# period fields identifying a duplicate entry, following the header and
+# context fields
+CHILD_KEY = ('sp', 'ei', 'vol', 'ii')
+
+
+def get_model(model_name):
+    """
+    Returns the P114 model (or BMRA model, for BMUs) with a given name
+    """
+    import P114.models as p114_models
+    import BMRA.models as bmra_models
+
+    if model_name == 'BMU':
+        return bmra_models.BMU
+    return getattr(p114_models, model_name)
+
+
+def get_parent_key(message_type, message_dict):
+    """
+    Returns the key identifying a header entry
+    """
+    message_key = PARENT_DEFINITIONS[message_type]['reference'][2]
+    return (message_dict[message_key],) + tuple(message_dict[parent_key]
+                                                for parent_key in PARENT_MESSAGE_KEYS)
+
+
+def get_child_key(definition, parent_id, context_id, values):
+    """
+    Returns the key identifying a period entry. Volumes are compared as
+    floats, as IMP volumes are stored as decimals
+    """
+    key = (parent_id,) if definition['context'] is None else (parent_id, context_id)
+    return key + (values[0], values[1], float(values[2]), values[3])
+
+
+class BulkInserter:
+    """
+    Buffers P114 message dictionaries and inserts them in batches using
+    bulk_create. Messages must be added in file order, each with its header
+    context
+
+    Parameters
+    ----------
+    batch_size : int
+        the number of period rows to be buffered before the buffer is
+        flushed to the database
+    """
+
+    def __init__(self, batch_size=5000):
+        self.batch_size = batch_size
+        self.reference_cache = ReferenceCache()
+        self.references = defaultdict(list)
+        self.gsp_groups = {}
+        self.pending_gsp_groups = {}
+        self.parent_ids = {}
+        self.pending_parents = defaultdict(dict)
+        self.existing_parents = set()
+        self.loaded_parents = defaultdict(set)
+        self.known_keys = defaultdict(set)
+        self.buffer = []
+        self.insert_log = new_insert_log()
+
+    def add(self, message_dict, context):
+        """
+        Adds a message with its header context (as per add_header_context),
+        flushing the buffer if full
+        """
+        message_type = message_dict['message_type']
+        if message_type in PARENT_DEFINITIONS:
+            _, model_name, message_key = PARENT_DEFINITIONS[message_type]['reference']
+            self.references[model_name].append(message_dict[message_key])
+            self.references['SR_type'].append(message_dict['sr_type'])
+            self.pending_parents[message_type][get_parent_key(message_type, message_dict)] = None
+        elif message_type in CONTEXT_DEFINITIONS:
+            model_name, message_key = CONTEXT_DEFINITIONS[message_type]
+            self.references[model_name].append(message_dict[message_key])
+            if model_name == 'GSP' and message_dict[message_key] not in self.gsp_groups:
+                # as per insert_data, GSPs take the group of the first header
+                # under which they appear, if not already set
+                self.gsp_groups[message_dict[message_key]] = context.get('gsp_group')
+                self.pending_gsp_groups[message_dict[message_key]] = context.get('gsp_group')
+        elif message_type in CHILD_DEFINITIONS:
+            definition = CHILD_DEFINITIONS[message_type]
+            context_id = None
+            if definition['context'] is not None:
+                context_type = definition['context'][1]
+                context_id = context[context_type][CONTEXT_DEFINITIONS[context_type][1]]
+            self.buffer.append((message_type,
+                                get_parent_key(definition['parent'], context[definition['parent']]),
+                                context_id,
+                                tuple(message_dict[field] for field in CHILD_KEY)))
+            if len(self.buffer) >= self.batch_size:
+                self.flush()
+
+    def close(self):
+        """
+        Flushes all remaining messages
+
+        Returns
+        -------
+        dict
+            the combined insert log of all messages added
+        """
+        self.flush()
+        return self.insert_log
+
+    def create_references(self):
+        """
+        Creates any BMU, GSP etc. entries referenced by the buffered
+        messages which do not already exist, logging new BMUs
+        """
+        for model_name in ['SR_type', 'BMU', 'GSP_group', 'GSP', 'Interconnector', 'InterGSP']:
+            ids = self.references.pop(model_name, [])
+            if len(ids) == 0:
+                continue
+            new_ids = self.reference_cache.create(get_model(model_name), ids)
+            if model_name == 'BMU':
+                self.insert_log['new_bmus'].extend(new_ids)
+        gsps_by_group = defaultdict(list)
+        for gsp_id, gsp_group in self.pending_gsp_groups.items():
+            if gsp_group is not None:
+                gsps_by_group[gsp_group].append(gsp_id)
+        for gsp_group, gsp_ids in gsps_by_group.items():
+            get_model('GSP').objects.filter(id__in=gsp_ids,
+                                            gsp_group__isnull=True).update(gsp_group_id=gsp_group)
+        self.pending_gsp_groups = {}
+
+    def load_parent_ids(self, message_type, keys):
+        """
+        Loads the ids of existing header entries with the given keys in a
+        single query, returning the keys not found
+        """
+        definition = PARENT_DEFINITIONS[message_type]
+        model = get_model(definition['model'])
+        key_fields = (definition['reference'][0] + '_id',) + PARENT_KEY
+        existing_entries = model.objects.filter(
+            sd__in={key[1] for key in keys},
+            agg_date__in={key[4] for key in keys}).values_list('id', *key_fields)
+        existing_ids = {tuple(entry[1:]): entry[0] for entry in existing_entries}
+        missing_keys = []
+        for key in keys:
+            if key in existing_ids:
+                self.parent_ids[(message_type, key)] = existing_ids[key]
+            else:
+                missing_keys.append(key)
+        return missing_keys
+
+    def create_parents(self):
+        """
+        Creates any buffered header entries which do not already exist
+        """
+        for message_type, keys in self.pending_parents.items():
+            keys = [key for key in keys if (message_type, key) not in self.parent_ids]
+            if len(keys) == 0:
+                continue
+            missing_keys = self.load_parent_ids(message_type, keys)
+            # entries found already existed, so may have period rows
+            self.existing_parents.update(self.parent_ids[(message_type, key)] for key in keys
+                                         if (message_type, key) in self.parent_ids)
+            if len(missing_keys) == 0:
+                continue
+            definition = PARENT_DEFINITIONS[message_type]
+            model = get_model(definition['model'])
+            key_fields = (definition['reference'][0] + '_id',) + PARENT_KEY
+            model.objects.bulk_create([model(**dict(zip(key_fields, key))) for key in missing_keys])
+            self.load_parent_ids(message_type, missing_keys)
+        self.pending_parents = defaultdict(dict)
+
+    def load_existing_keys(self, message_type, parent_ids):
+        """
+        Loads the keys of existing period entries under the given header
+        entries into the set of known keys, in a single query
+        """
+        definition = CHILD_DEFINITIONS[message_type]
+        parent_ids = set(parent_ids) - self.loaded_parents[message_type]
+        if len(parent_ids) == 0:
+            return
+        key_fields = (definition['parent'].lower() + '_id',)
+        if definition['context'] is not None:
+            key_fields += (definition['context'][0] + '_id',)
+        model = get_model(definition['model'])
+        for entry in model.objects.filter(**{definition['parent'].lower() + '_id__in': parent_ids})\
+                .values_list(*(key_fields + CHILD_KEY)):
+            self.known_keys[message_type].add(
+                get_child_key(definition, entry[0], entry[1], entry[-4:]))
+        self.loaded_parents[message_type].update(parent_ids)
+
+    def flush(self):
+        """
+        Inserts all buffered messages
+        """
+        self.create_references()
+        self.create_parents()
+
+        rows = defaultdict(list)
+        for message_type, parent_key, context_id, values in self.buffer:
+            rows[message_type].append(
+                (self.parent_ids[(CHILD_DEFINITIONS[message_type]['parent'], parent_key)],
+                 context_id,
+                 values))
+        self.buffer = []
+
+        for message_type, message_rows in rows.items():
+            definition = CHILD_DEFINITIONS[message_type]
+            model = get_model(definition['model'])
+            self.load_existing_keys(message_type,
+                                    [parent_id for parent_id, _, _ in message_rows
+                                     if parent_id in self.existing_parents])
+            known_keys = self.known_keys[message_type]
+            objects = []
+            for parent_id, context_id, values in message_rows:
+                key = get_child_key(definition, parent_id, context_id, values)
+                if key in known_keys:
+                    continue
+                known_keys.add(key)
+                fields = {definition['parent'].lower() + '_id': parent_id}
+                if definition['context'] is not None:
+                    fields[definition['context'][0] + '_id'] = context_id
+                fields.update(zip(CHILD_KEY, values))
+                objects.append(model(**fields))
+            model.objects.bulk_create(objects, batch_size=self.batch_size)
+            if len(objects) > 0:
+                merge_insert_log(self.insert_log,
+                                 {'new_entries': {definition['log_key']: len(objects)}})
+            if len(message_rows) > len(objects):
+                merge_insert_log(self.insert_log,
+                                 {'duplicate_msg': {message_type: len(message_rows) - len(objects)}})
@@ -20,6 +20,10 @@ ACCEPTED_MESSAGES = {
     'S0142': [],
 }
 
+# message types giving context to the messages following them, e.g. the
+# ABV to which the following ABPs belong
+HEADER_MESSAGES = ['ABV', 'AGV', 'MPD', 'GP9', 'EPD', 'IPD']
+
 # message types which are ignored and not further processed
 IGNORED_MESSAGES = {
     'C0291': ['AAA', 'ZZZ'],
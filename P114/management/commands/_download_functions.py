@@ -2,13 +2,20 @@
 Helper functions for managing P114 file downloads
 
 """
-import urllib.request
 import os.path
 import json
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 import requests
+from django.db import transaction, connections, IntegrityError
 from GBEnergyDataManager.settings import ELEXON_KEY, P114_INPUT_DIR, P114_LIST_URL, P114_DOWNLOAD_URL
-from ._upload_functions import file_to_message_list, insert_data
+from ._upload_functions import read_p114_messages, add_header_context
+from ._bulk_upload_functions import BulkInserter
 from ._data_definitions import PROCESSED_FEEDS, IGNORED_FEEDS
+from BMRA.management.commands._async_download_functions import download_files
+from BMRA.management.commands._ledger_functions import get_file_checksum, get_completed_entry, \
+    get_completed_filenames, start_entry, finish_entry
+from BMRA.management.commands._download_functions import init_bmra_worker
 from tqdm import tqdm
 
 def get_p114_filenames_for_date(p114_date):
@@ -64,19 +71,147 @@ def get_p114_file(filename, overwrite=True):
 
     """
     #print(filename)
-    if not os.path.isfile(P114_INPUT_DIR + filename) or overwrite:
-        remote_url = (P114_DOWNLOAD_URL.format(ELEXON_KEY, filename))
-        urllib.request.urlretrieve(remote_url,
-                                   P114_INPUT_DIR + filename)
+    get_p114_files([filename], overwrite)
 
-def process_p114_date(p114_date, no_insert=False):
+def get_p114_files(filenames, overwrite=True, max_concurrency=4, completed=()):
     """
-    Retrieves data for nominated day and processes it
+    downloads specified P114 files concurrently
+
+    Parameters
+    ----------
+    filenames : list
+        the filenames to be retrieved
+    overwrite : boolean
+        if a file already exists, whether to overwrite or keep
+    max_concurrency : int
+        the maximum number of downloads in progress at a time
+    completed : set
+        filenames already completed in the ingestion ledger, which are kept
+        if they already exist whether or not overwrite is set
+
+    Returns
+    -------
+
+    Raises
+    ------
+
+    """
+    download_files([(P114_DOWNLOAD_URL.format(ELEXON_KEY, filename), P114_INPUT_DIR + filename)
+                    for filename in filenames
+                    if (overwrite and filename not in completed)
+                    or not os.path.isfile(P114_INPUT_DIR + filename)],
+                   max_concurrency)
+
+def prefetch_p114_files(prefetcher, p114_date):
+    """
+    starts background downloads of the P114 files for a given date which
+    are not already saved locally
+
+    Parameters
+    ----------
+    prefetcher : Prefetcher
+        the prefetcher used to download the files
+    p114_date : date
+        the date for which files are to be downloaded
+
+    Returns
+    -------
+    list
+        the paths of the files being downloaded
+    """
+    filenames = get_p114_filenames_for_date(p114_date)
+    if filenames is None:
+        return []
+    file_paths = []
+    for filename in filenames:
+        if not os.path.isfile(P114_INPUT_DIR + filename):
+            prefetcher.prefetch(P114_DOWNLOAD_URL.format(ELEXON_KEY, filename),
+                                P114_INPUT_DIR + filename)
+            file_paths.append(P114_INPUT_DIR + filename)
+    return file_paths
+
+def group_p114_filenames(filenames):
+    """
+    Groups P114 filenames by feed (e.g. 'C0301'), keeping their order
+
+    Parameters
+    ----------
+    filenames : list
+        the filenames to be grouped
+
+    Returns
+    -------
+    dict
+        lists of filenames by feed
+    """
+    feed_filenames = defaultdict(list)
+    for filename in filenames:
+        feed_filenames[filename.split('_')[0]].append(filename)
+    return dict(feed_filenames)
+
+def process_p114_feed(filenames, force=False, overwrite=True, retries=3):
+    """
+    Downloads and processes the files of a single feed in turn, each in its
+    own transaction. Files of different feeds insert into separate tables
+    but may reference the same SR types, GSP groups etc., so a file which
+    fails as another process created the same entries at the same time is
+    processed again
+
+    Parameters
+    ----------
+    filenames : list
+        the filenames to be processed
+    force : bool
+        as per process_p114_date
+    overwrite : bool
+        as per process_p114_date
+    retries : int
+        the number of times a file is processed again on conflict
+
+    Returns
+    -------
+    int
+        the number of files skipped as already completed
+    """
+    # completed files are only downloaded again if not saved locally, as
+    # their checksum is needed to check whether they have changed
+    get_p114_files(filenames, overwrite=overwrite,
+                   completed=set() if force else get_completed_filenames(filenames))
+    skipped = 0
+    for filename in filenames:
+        for attempt in range(retries + 1):
+            try:
+                processed = process_p114_file(filename, force)
+                break
+            except IntegrityError:
+                if attempt == retries:
+                    raise
+        if not processed:
+            skipped += 1
+    return skipped
+
+def process_p114_date(p114_date, no_insert=False, force=False, overwrite=True, workers=None):
+    """
+    Retrieves data for nominated day and processes it, recording the outcome
+    for each file in the ingestion ledger. Files already completed with the
+    same checksum are skipped unless force is set. If workers is set, the
+    files of each feed are downloaded and processed in a separate worker
+    process, each file in its own transaction
 
     Parameters
     ----------
     p114_date : date
         the date for which filenames are to be retrieved
+    no_insert : bool
+        if True, files are parsed but not inserted into the db
+    force : bool
+        if True, files are processed even if already completed
+    overwrite : bool
+        if False, files already saved locally are not downloaded again.
+        Files already completed are not downloaded again if saved locally
+        unless force is set
+    workers : int
+        the maximum number of feeds processed in parallel
 
     Returns
     -------
@@ -85,13 +220,70 @@ def process_p114_date(p114_date, no_insert=False):
     ------
     """
     filenames = get_p114_filenames_for_date(p114_date)
-    if filenames is not None:
+    if filenames is not None and workers is not None and workers > 1 and not no_insert:
         print('{} relevant files found'.format(len(filenames)))
+        feed_filenames = group_p114_filenames(filenames)
+        # connections must not be shared with forked worker processes
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(workers, len(feed_filenames)),
+                                 initializer=init_bmra_worker) as executor:
+            futures = [executor.submit(process_p114_feed, feed_filenames[feed], force, overwrite)
+                       for feed in feed_filenames]
+            skipped = sum(future.result() for future in futures)
+        if skipped > 0:
+            print('{} files already completed, skipped'.format(skipped))
+    elif filenames is not None:
+        print('{} relevant files found'.format(len(filenames)))
+        get_p114_files(filenames, overwrite=overwrite,
+                       completed=set() if force else get_completed_filenames(filenames))
+        skipped = 0
         for filename in tqdm(filenames):
-            get_p114_file(filename, overwrite=True)
             if no_insert:
-                file_to_message_list(filename)
-            else:
-                insert_data(file_to_message_list(filename))
+                for message_dict in read_p114_messages(filename):
+                    pass
+            elif not process_p114_file(filename, force):
+                skipped += 1
+        if skipped > 0:
+            print('{} files already completed, skipped'.format(skipped))
     else:
         print('No relevant files found')
+
+def process_p114_file(filename, force=False, batch_size=5000):
+    """
+    Inserts a single downloaded P114 file in a single transaction, recording
+    the outcome in the ingestion ledger
+
+    Parameters
+    ----------
+    filename : string
+        the filename to be processed
+    force : bool
+        if True, the file is processed even if already completed
+    batch_size : int
+        the number of period rows inserted at a time (as per BulkInserter)
+
+    Returns
+    -------
+    bool
+        True if the file was processed, False if skipped
+    """
+    checksum = get_file_checksum(P114_INPUT_DIR + filename)
+    if get_completed_entry(filename, checksum) is not None and not force:
+        return False
+    processed_file = start_entry(filename, 'P114', checksum)
+    try:
+        with transaction.atomic():
+            # rows are read one at a time and inserted in batches, so that
+            # files of any size are processed in constant memory
+            count = 0
+            bulk_inserter = BulkInserter(batch_size)
+            for message_dict, context in add_header_context(read_p114_messages(filename)):
+                bulk_inserter.add(message_dict, context)
+                count += 1
+            insert_log = bulk_inserter.close()
+    except Exception as e:
+        finish_entry(processed_file, error=e)
+        raise
+    insert_log['count'] = count
+    finish_entry(processed_file, insert_log)
+    return True
@@ -3,7 +3,7 @@ Helper functions for uploading data to database
 
 """
 from ._data_definitions import ACCEPTED_MESSAGES, IGNORED_MESSAGES, \
-FIELDNAMES, FIELD_CASTING_FUNCS
+FIELDNAMES, FIELD_CASTING_FUNCS, HEADER_MESSAGES
 from GBEnergyDataManager.settings import P114_INPUT_DIR
 import gzip
 
@@ -34,6 +34,95 @@ def message_to_dict(raw_message, associated_params=None):
                                                message_values[1:])]
     return dict(zip(message_keys, casted_message_values))
 
+def row_to_message_dict(row, p114_feed):
+    """
+    Converts a single row of a P114 file to a message dictionary
+
+    Parameters
+    ----------
+    row : string
+        the row to be converted
+    p114_feed : string
+        the P114 feed of the file (e.g. 'C0301')
+
+    Returns
+    -------
+    message_dict: dict
+        a dictionary containing key/value pairs, or None if the message
+        type is ignored
+    """
+    message_values = row.split('|')
+    message_type = message_values[0]
+    if message_type in ACCEPTED_MESSAGES[p114_feed]:
+        message_keys = FIELDNAMES[message_type]
+        casted_message_values = [FIELD_CASTING_FUNCS[key](value.strip()) for
+                                 key, value in zip(message_keys,
+                                                   message_values[1:])]
+        return dict(zip(['message_type']+message_keys, [message_type]+casted_message_values))
+    elif message_type not in IGNORED_MESSAGES[p114_feed]:
+        print(row)
+        raise ValueError('message type {} not recognised'.format(message_type))
+    return None
+
+def read_p114_messages(filename, input_dir=P114_INPUT_DIR):
+    """
+    Generator reading a locally saved file one row at a time, so that
+    files of any size are read in constant memory
+    Filters for accepted message types and raises errors for
+    unrecognised message types
+
+    Parameters
+    ----------
+    filename : string
+        the filename to be processed
+    input_dir : string
+        the directory in which the file is saved
+
+    Yields
+    ------
+    dict
+        message dictionary containing key/value pairs
+    """
+    p114_feed = filename.split('_')[0]
+    if p114_feed not in ACCEPTED_MESSAGES and p114_feed not in IGNORED_MESSAGES:
+        raise ValueError('P114 item {} not recognised'.format(p114_feed))
+    with gzip.open(input_dir + filename, 'rt', encoding='utf-8', errors='ignore',
+                   newline='\n') as file:
+        for row in file:
+            row = row.rstrip('\n')
+            if len(row)>0:
+                message_dict = row_to_message_dict(row, p114_feed)
+                if message_dict is not None:
+                    yield message_dict
+
+def add_header_context(messages):
+    """
+    Generator pairing each message with its header context, i.e. the most
+    recent message of each header type (ABV, AGV, MPD, GP9, EPD, IPD) and
+    the GSP group of the most recent AGV or MPD. As per insert_data, this
+    relies on message order being correct in the input files. The context
+    dictionary is replaced rather than updated when a header changes, so
+    that it may be kept by the consumer
+
+    Parameters
+    ----------
+    messages : iterable
+        message dictionaries, in file order
+
+    Yields
+    ------
+    tuple
+        message dictionary and header context dictionary
+    """
+    context = {}
+    for message_dict in messages:
+        if message_dict['message_type'] in HEADER_MESSAGES:
+            context = dict(context)
+            context[message_dict['message_type']] = message_dict
+            if message_dict['message_type'] in ['AGV', 'MPD']:
+                context['gsp_group'] = message_dict['gsp_group']
+        yield message_dict, context
+
 def file_to_message_list(filename):
     """
     Converts locally saved file to list of message dictionaries
@@ -50,27 +139,7 @@ def file_to_message_list(filename):
     message_list: list
         a list of message dictionaries containing key/value pairs
     """
-
-    p114_feed = filename.split('_')[0]
-    if p114_feed not in ACCEPTED_MESSAGES and p114_feed not in IGNORED_MESSAGES:
-        raise ValueError('P114 item {} not recognised'.format(p114_feed))
-    file = gzip.open(P114_INPUT_DIR + filename, 'rb')
-    file_content = file.read().decode('utf-8', 'ignore')
-    message_list = []
-    for row in file_content.split('\n'):
-        if len(row)>0:
-            message_values = row.split('|')
-            message_type = message_values[0]
-            if message_type in ACCEPTED_MESSAGES[p114_feed]:
-                message_keys = FIELDNAMES[message_type]
-                casted_message_values = [FIELD_CASTING_FUNCS[key](value.strip()) for
-                                         key, value in zip(message_keys,
-                                                           message_values[1:])]
-                message_list.append(dict(zip(['message_type']+message_keys, [message_type]+casted_message_values)))
-            elif message_type not in IGNORED_MESSAGES[p114_feed]:
-                print(row)
-                raise ValueError('message type {} not recognised'.format(message_type))
-    return message_list
+    return list(read_p114_messages(filename))
 
 def insert_data(message_list):
     """
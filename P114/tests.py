@@ -1,3 +1,198 @@
+"""
+Tests for P114 data uploads
+
+The test rows cover each header type (ABV, AGV, MPD) with its period rows,
+and the GP9/EPD/IPD context rows which identify the GSP, interconnector or
+interconnector GSP of the period rows which follow them
+"""
+from __future__ import unicode_literals
+import gzip
+import os
+import tempfile
 from django.test import TestCase
+from P114.models import GSP, ABV, ABP, AGV, AGP, MPD, GMP, EMP, IMP
+from P114.management.commands._data_definitions import FIELDNAMES, FIELD_CASTING_FUNCS
+from P114.management.commands._upload_functions import insert_data, add_header_context, \
+    read_p114_messages
+from P114.management.commands._bulk_upload_functions import BulkInserter
+from P114.management.commands._download_functions import group_p114_filenames
+
+ROWS = ['MPD|_A|20170329|SF|1|20170405',
+        'GP9|BRED_1',
+        'GMP|1|F|10.5|E',
+        'GMP|2|F|11.5|E',
+        'EPD|FRANCE',
+        'EMP|1|F|100.0|I',
+        'IPD|A_B',
+        'IMP|1|T|0.1|I',
+        'MPD|_B|20170329|SF|1|20170405',
+        'GP9|BRED_1',
+        'GMP|1|F|1.0|E',
+        'GP9|CANT_1',
+        'GMP|1|F|2.0|E',
+        'GMP|1|F|2.0|E',
+        'ABV|T_ABTH9|20170329|SF|1|20170405',
+        'ABP|1|F|5.0|E',
+        'ABP|2|F|5.0|E',
+        'ABV|T_DRAXX1|20170329|SF|1|20170405',
+        'ABP|1|F|400.0|E',
+        'AGV|_A|20170329|SF|1|20170405',
+        'AGP|1|F|I|20.0']
+
+
+def rows_to_message_list(rows):
+    """converts raw rows to message dictionaries, as per file_to_message_list"""
+    message_list = []
+    for row in rows:
+        message_values = row.split('|')
+        message_keys = FIELDNAMES[message_values[0]]
+        message_list.append(dict(
+            [('message_type', message_values[0])]
+            + [(key, FIELD_CASTING_FUNCS[key](value.strip()))
+               for key, value in zip(message_keys, message_values[1:])]))
+    return message_list
+
+
+def insert_batched(message_list, batch_size):
+    """inserts messages in batches using BulkInserter"""
+    bulk_inserter = BulkInserter(batch_size=batch_size)
+    for message_dict, context in add_header_context(message_list):
+        bulk_inserter.add(message_dict, context)
+    return bulk_inserter.close()
+
+
+def period_rows():
+    """
+    returns the period rows of each type, each with the key of its header
+    (BMU or GSP group, settlement run type) and any context entity
+    """
+    return {
+        'ABP': sorted(ABP.objects.values_list('abv__bmu_id', 'abv__sr_type_id',
+                                              'sp', 'vol', 'ii')),
+        'AGP': sorted(AGP.objects.values_list('agv__gsp_group_id', 'agv__sr_type_id',
+                                              'sp', 'vol', 'ii')),
+        'GMP': sorted(GMP.objects.values_list('mpd__gsp_group_id', 'gsp_id', 'sp', 'vol')),
+        'EMP': sorted(EMP.objects.values_list('mpd__gsp_group_id', 'interconnector_id',
+                                              'sp', 'vol')),
+        'IMP': sorted((group_id, intergsp_id, sp, float(vol)) for group_id, intergsp_id, sp, vol
+                      in IMP.objects.values_list('mpd__gsp_group_id', 'intergsp_id', 'sp', 'vol')),
+    }
+
+
+class BulkInsertCase(TestCase):
+    """
+    Tests for BulkInserter
+    """
+
+    def setUp(self):
+        self.message_list = rows_to_message_list(ROWS)
+
+    def test_period_rows(self):
+        """period rows are created under the preceding header and context rows"""
+        insert_log = insert_batched(self.message_list, batch_size=100)
+        self.assertEqual(period_rows(), {
+            'ABP': [('T_ABTH9', 'SF', 1, 5.0, False), ('T_ABTH9', 'SF', 2, 5.0, False),
+                    ('T_DRAXX1', 'SF', 1, 400.0, False)],
+            'AGP': [('A', 'SF', 1, 20.0, True)],
+            # the repeated CANT_1 row under header B is a duplicate, the
+            # same values under BRED_1 or header A are not
+            'GMP': [('A', 'BRED_1', 1, 10.5), ('A', 'BRED_1', 2, 11.5),
+                    ('B', 'BRED_1', 1, 1.0), ('B', 'CANT_1', 1, 2.0)],
+            'EMP': [('A', 'FRANCE', 1, 100.0)],
+            'IMP': [('A', 'A_B', 1, 0.1)]})
+        # GSPs take the group of the first header under which they appear
+        self.assertEqual(sorted(GSP.objects.values_list('id', 'gsp_group_id')),
+                         [('BRED_1', 'A'), ('CANT_1', 'B')])
+        self.assertEqual(insert_log['inserts'],
+                         {'gmp': 4, 'emp': 1, 'imp': 1, 'abp': 3, 'agp': 1})
+        self.assertEqual(insert_log['duplicate_msg'], {'GMP': 1})
+        self.assertEqual(insert_log['new_bmus'], ['T_ABTH9', 'T_DRAXX1'])
+
+    def test_headers_across_batches(self):
+        """period rows are matched to their headers when batches split them"""
+        insert_batched(self.message_list, batch_size=100)
+        expected_rows = period_rows()
+        for batch_size in [1, 3]:
+            for model in [ABP, AGP, GMP, EMP, IMP, ABV, AGV, MPD]:
+                model.objects.all().delete()
+            insert_batched(self.message_list, batch_size=batch_size)
+            self.assertEqual(period_rows(), expected_rows)
+            self.assertEqual(ABV.objects.count(), 2)
+            self.assertEqual(MPD.objects.count(), 2)
+
+    def test_existing_rows(self):
+        """rows already inserted by insert_data are not inserted again"""
+        insert_data(self.message_list)
+        expected_rows = period_rows()
+        insert_log = insert_batched(self.message_list, batch_size=2)
+        self.assertEqual(period_rows(), expected_rows)
+        self.assertEqual(insert_log['inserts'], {})
+        self.assertEqual(sum(insert_log['duplicate_msg'].values()), 11)
+
+    def test_existing_headers(self):
+        """rows are added under headers already inserted, skipping existing rows"""
+        insert_batched(self.message_list, batch_size=100)
+        expected_rows = period_rows()
+        for model in [ABP, AGP, GMP, EMP, IMP, ABV, AGV, MPD]:
+            model.objects.all().delete()
+        # the first MPD header with its first GMP row, and the first ABV
+        # header with its first ABP row
+        insert_data(self.message_list[:3] + self.message_list[14:16])
+        insert_log = insert_batched(self.message_list, batch_size=3)
+        self.assertEqual(period_rows(), expected_rows)
+        self.assertEqual(MPD.objects.count(), 2)
+        self.assertEqual(insert_log['inserts'],
+                         {'gmp': 3, 'emp': 1, 'imp': 1, 'abp': 2, 'agp': 1})
+
+    def test_header_query_count(self):
+        """headers are deduplicated in a single query per header type"""
+        insert_batched(self.message_list, batch_size=100)
+        bulk_inserter = BulkInserter(batch_size=100)
+        for message_dict, context in add_header_context(self.message_list):
+            bulk_inserter.add(message_dict, context)
+        # references (6 tables), GSP groups (2 groups), headers (3 types)
+        # and period rows (5 types)
+        with self.assertNumQueries(6 + 2 + 3 + 5):
+            bulk_inserter.close()
+
+
+class FileReadingCase(TestCase):
+    """
+    Tests for reading P114 files
+    """
+
+    def read_rows(self, filename, rows):
+        """writes rows to a gzipped file and reads them back"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with gzip.open(os.path.join(temp_dir, filename), 'wb') as file:
+                file.write('\n'.join(rows).encode('utf-8'))
+            return list(read_p114_messages(filename, temp_dir + os.sep))
+
+    def test_read_messages(self):
+        """rows are read one at a time, skipping ignored message types"""
+        rows = [row for row in ROWS if row[:3] in ['MPD', 'GP9', 'GMP', 'EPD', 'EMP', 'IPD', 'IMP']]
+        message_list = self.read_rows('C0301_test.gz', ['AAA|x'] + rows + ['ZZZ|x', ''])
+        self.assertEqual(message_list, rows_to_message_list(rows))
+        with self.assertRaises(ValueError):
+            self.read_rows('C0301_test.gz', rows + ['ABV|T_ABTH9|20170329|SF|1|20170405'])
+
+    def test_header_context(self):
+        """messages are paired with the most recent header of each type"""
+        message_list = rows_to_message_list(ROWS)
+        contexts = [context for _, context in add_header_context(message_list)]
+        self.assertEqual(contexts[3]['MPD'], message_list[0])
+        self.assertEqual(contexts[3]['GP9'], message_list[1])
+        self.assertEqual(contexts[12]['MPD'], message_list[8])
+        self.assertEqual(contexts[12]['GP9'], message_list[11])
+        self.assertEqual(contexts[12]['gsp_group'], 'B')
+        self.assertEqual(contexts[18]['ABV'], message_list[17])
+        # contexts are not modified by later headers
+        self.assertEqual(contexts[0]['MPD'], message_list[0])
+        self.assertIs(contexts[2], contexts[3])
 
-# Create your tests here.
+    def test_group_filenames(self):
+        """files are grouped by feed for parallel processing, keeping their order"""
+        self.assertEqual(group_p114_filenames(['C0301_SF_20170405.gz', 'C0421_SF_20170405.gz',
+                                               'C0301_R1_20170405.gz']),
+                         {'C0301': ['C0301_SF_20170405.gz', 'C0301_R1_20170405.gz'],
+                          'C0421': ['C0421_SF_20170405.gz']})
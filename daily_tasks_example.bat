@@ -1,3 +1,3 @@
 REM example daily batch file calling daily download and data aggregation commands via anaconda environment
 call "C:/Users/Username/AppData/Local/anaconda3/Scripts/activate.bat" EnvironmentName & cd "C:/path/to/code/GBEnergyDataManager" & python manage.py daily_download
-call "C:/Users/Username/AppData/Local/anaconda3/Scripts/activate.bat" EnvironmentName & cd "C:/path/to/code/GBEnergyDataManager" & python manage.py generate_annual_summary scotland 0
\ No newline at end of file
+call "C:/Users/Username/AppData/Local/anaconda3/Scripts/activate.bat" EnvironmentName & cd "C:/path/to/code/GBEnergyDataManager" & python manage.py generate_annual_summary scotland 0 --incremental
\ No newline at end of file